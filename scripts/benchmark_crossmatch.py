@@ -0,0 +1,118 @@
+""" Python script measuring the runtime of the crossmatch function
+for each strategy, compared to the sort-based algorithm of previous versions,
+and the scaling of the crossmatch_parallel function with the number of threads.
+The ID distributions mimic the halo_id and upid columns of a UniverseMachine mock:
+``y`` stores unique IDs and ``x`` stores IDs with repeats,
+about half of which have a match in ``y``.
+"""
+import argparse
+from time import time
+
+import numpy as np
+
+from umachine_pyio.index_utils import crossmatch, crossmatch_parallel
+
+
+def legacy_crossmatch(x, y):
+    """Sort-based algorithm used by crossmatch before adaptive strategies,
+    with the bounds checking of the previous version.
+    """
+    assert len(set(y)) == len(y)
+    idx_x_sorted = np.argsort(x)
+    idx_y_sorted = np.argsort(y)
+    x_sorted = np.copy(x[idx_x_sorted])
+    y_sorted = np.copy(y[idx_y_sorted])
+    unique_xvals, counts = np.unique(x_sorted, return_counts=True)
+    unique_xval_has_match = np.isin(unique_xvals, y_sorted, assume_unique=True)
+    idx_x = np.repeat(unique_xval_has_match, counts)
+    matching_indices_in_y = np.searchsorted(
+        y_sorted, unique_xvals[unique_xval_has_match]
+    )
+    idx_y = np.repeat(matching_indices_in_y, counts[unique_xval_has_match])
+    return idx_x_sorted[idx_x], idx_y_sorted[idx_y]
+
+
+def generate_ids(num_ids, id_layout, seed):
+    rng = np.random.RandomState(seed)
+    if id_layout == "compact":
+        y = np.arange(num_ids, dtype=np.int64) + 10**9
+    elif id_layout == "sparse":
+        y = np.unique(rng.randint(0, 2**62, int(1.01 * num_ids)))[:num_ids]
+    else:
+        raise ValueError("Unrecognized id_layout ``{0}``".format(id_layout))
+    rng.shuffle(y)
+    x = y[rng.randint(0, 2 * num_ids, num_ids) % num_ids]
+    x[rng.uniform(size=num_ids) < 0.5] = -1
+    return x, y
+
+
+def time_function(func, num_repeats):
+    runtimes = []
+    for __ in range(num_repeats):
+        start = time()
+        func()
+        runtimes.append(time() - start)
+    return min(runtimes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-num_ids",
+        type=float,
+        nargs="+",
+        default=[1e6, 1e7],
+        help="Sequence of array lengths. Default is 1e6 1e7",
+    )
+    parser.add_argument(
+        "-strategies",
+        nargs="+",
+        default=["auto", "hash", "sort"],
+        help="Sequence of crossmatch strategies to benchmark",
+    )
+    parser.add_argument(
+        "-num_workers",
+        type=int,
+        nargs="+",
+        default=[],
+        help="Sequence of thread counts used to benchmark crossmatch_parallel, "
+        "e.g., 1 2 4 8 16 32 64. Default is to skip crossmatch_parallel.",
+    )
+    parser.add_argument("-num_repeats", type=int, default=3)
+    parser.add_argument("-seed", type=int, default=43)
+    parser.add_argument(
+        "-skip_legacy", action="store_true", help="Do not time the legacy algorithm"
+    )
+    args = parser.parse_args()
+
+    print(
+        "{0:>10} {1:>8} {2:>10} {3:>10}".format(
+            "num_ids", "layout", "method", "seconds"
+        )
+    )
+    for num_ids in args.num_ids:
+        for id_layout in ("compact", "sparse"):
+            x, y = generate_ids(int(num_ids), id_layout, args.seed)
+            methods = [("legacy", lambda: legacy_crossmatch(x, y))]
+            if args.skip_legacy:
+                methods = []
+            for strategy in args.strategies:
+                if (strategy == "lookup") & (id_layout == "sparse"):
+                    continue
+                methods.append(
+                    (strategy, lambda s=strategy: crossmatch(x, y, strategy=s))
+                )
+            for num_workers in args.num_workers:
+                methods.append(
+                    (
+                        "par{0}".format(num_workers),
+                        lambda n=num_workers: crossmatch_parallel(x, y, num_workers=n),
+                    )
+                )
+            for name, func in methods:
+                runtime = time_function(func, args.num_repeats)
+                print(
+                    "{0:>10.0e} {1:>8} {2:>10} {3:>10.3f}".format(
+                        num_ids, id_layout, name, runtime
+                    )
+                )
@@ -0,0 +1,177 @@
+""" Python script measuring the throughput of the main I/O paths of the package
+on synthetic UniverseMachine catalogs of increasing size:
+ingesting ASCII catalogs with both ingest modules, loading the reduced columns,
+value-adding the mock, crossmatching IDs and computing richness.
+Results are written as JSON so that runs of different versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+from time import time
+
+import numpy as np
+
+import umachine_pyio
+from umachine_pyio.index_utils import compute_richness, crossmatch
+from umachine_pyio.load_mock import load_mock_from_binaries, value_added_mock
+from umachine_pyio.process_ascii_file_into_binaries import (
+    write_ascii_to_memmap_tree as write_ascii_to_binaries,
+)
+from umachine_pyio.process_ascii_into_memmap import write_ascii_to_memmap_tree
+from umachine_pyio.synthetic_catalogs import (
+    write_synthetic_column_info,
+    write_synthetic_sfh_catalog,
+)
+
+GALPROPS = [
+    "halo_id",
+    "upid",
+    "x",
+    "y",
+    "z",
+    "vx",
+    "vy",
+    "vz",
+    "mvir",
+    "rvir",
+    "obs_sm",
+    "sfr",
+    "sm_history_main_prog",
+    "sfr_history_main_prog",
+]
+LBOX = 250.0
+
+
+def time_function(func, num_repeats):
+    runtimes = []
+    for __ in range(num_repeats):
+        start = time()
+        func()
+        runtimes.append(time() - start)
+    return min(runtimes)
+
+
+def run_benchmarks(num_gals, scale_factor, compress, num_repeats, seed, tmp_dirname):
+    column_info_fname = os.path.join(tmp_dirname, "column_info.dat")
+    write_synthetic_column_info(column_info_fname)
+    column_info_fname2 = os.path.join(tmp_dirname, "column_info2.dat")
+    write_synthetic_column_info(column_info_fname2, with_history_flags=False)
+
+    ascii_fname = os.path.join(
+        tmp_dirname, "sfh_catalog_{0}.0.txt".format(scale_factor)
+    )
+    write_synthetic_sfh_catalog(ascii_fname, num_gals, scale_factor, LBOX, seed)
+    ascii_fname2 = ascii_fname
+    if compress:
+        ascii_fname2 = ascii_fname + ".gz"
+        write_synthetic_sfh_catalog(
+            ascii_fname2, num_gals, scale_factor, LBOX, seed, compress=True
+        )
+
+    root_dirname = os.path.join(tmp_dirname, "a_" + scale_factor)
+    subvol_dirname = os.path.join(root_dirname, "subvol_0")
+    subvol_dirname2 = os.path.join(root_dirname, "subvol_1")
+
+    benchmarks = [
+        (
+            "ingest_process_ascii_into_memmap",
+            lambda: write_ascii_to_memmap_tree(
+                ascii_fname, column_info_fname, subvol_dirname, GALPROPS
+            ),
+        ),
+        (
+            "ingest_process_ascii_file_into_binaries",
+            lambda: write_ascii_to_binaries(
+                ascii_fname2, column_info_fname2, subvol_dirname2, GALPROPS, 0, 0
+            ),
+        ),
+        (
+            "load_mock_from_binaries",
+            lambda: load_mock_from_binaries([0], root_dirname, GALPROPS),
+        ),
+    ]
+    results = []
+    for name, func in benchmarks:
+        results.append((name, time_function(func, num_repeats)))
+
+    mock = load_mock_from_binaries([0], root_dirname, GALPROPS)
+    halo_id = np.array(mock["halo_id"])
+    upid = np.array(mock["upid"])
+    halo_hostid = np.where(upid == -1, halo_id, upid)
+
+    benchmarks = [
+        ("value_added_mock", lambda: value_added_mock(mock.copy(), LBOX)),
+        ("crossmatch", lambda: crossmatch(upid, halo_id)),
+        ("compute_richness", lambda: compute_richness(halo_id, halo_hostid)),
+    ]
+    for name, func in benchmarks:
+        results.append((name, time_function(func, num_repeats)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_fname", help="Name of the output JSON file")
+    parser.add_argument(
+        "-num_gals",
+        type=float,
+        nargs="+",
+        default=[1e4, 1e5],
+        help="Sequence of catalog sizes. Default is 1e4 1e5",
+    )
+    parser.add_argument(
+        "-scale_factor",
+        default="1.002310",
+        help="Scale factor of the example header used to generate the catalogs",
+    )
+    parser.add_argument(
+        "-compress",
+        action="store_true",
+        help="Ingest a gzip-compressed catalog with process_ascii_file_into_binaries",
+    )
+    parser.add_argument("-num_repeats", type=int, default=3)
+    parser.add_argument("-seed", type=int, default=43)
+    parser.add_argument(
+        "-tmp_dirname",
+        default=None,
+        help="Parent directory of the temporary catalogs. Default is the system default",
+    )
+    args = parser.parse_args()
+
+    report = dict(
+        umachine_pyio_version=umachine_pyio.__version__,
+        numpy_version=np.__version__,
+        python_version=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        scale_factor=args.scale_factor,
+        compress=args.compress,
+        num_repeats=args.num_repeats,
+        results=[],
+    )
+    print("{0:>10} {1:>42} {2:>10}".format("num_gals", "benchmark", "seconds"))
+    for num_gals in args.num_gals:
+        with tempfile.TemporaryDirectory(dir=args.tmp_dirname) as tmp_dirname:
+            results = run_benchmarks(
+                int(num_gals),
+                args.scale_factor,
+                args.compress,
+                args.num_repeats,
+                args.seed,
+                tmp_dirname,
+            )
+        for name, runtime in results:
+            print("{0:>10.0e} {1:>42} {2:>10.3f}".format(num_gals, name, runtime))
+            report["results"].append(
+                dict(
+                    benchmark=name,
+                    num_gals=int(num_gals),
+                    seconds=runtime,
+                    rows_per_second=num_gals / runtime if runtime > 0 else None,
+                )
+            )
+
+    with open(args.output_fname, "w") as f:
+        json.dump(report, f, indent=2)
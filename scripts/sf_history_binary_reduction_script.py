@@ -8,8 +8,14 @@ import os
 import argparse
 from time import time
 from umachine_pyio.process_ascii_into_memmap import write_ascii_to_memmap_tree
+from umachine_pyio.column_sketches import write_column_sketches
+from umachine_pyio.derived_columns import write_derived_columns
+from umachine_pyio.halo_id_index import write_halo_id_index
 from umachine_pyio.directory_tree_utils import sf_history_ascii_fname_iterator
+from umachine_pyio.instrumentation import IOStats, JsonLinesProgressLog
+from umachine_pyio.load_mock import get_snapshot_times
 from umachine_pyio.sf_history_header_processing import retrieve_requested_colnames
+from umachine_pyio.spatial_ordering import DEFAULT_BLOCK_SIZE, reorder_subvolume_rows
 
 ################################################################################
 if __name__ == "__main__":
@@ -54,6 +60,65 @@ if __name__ == "__main__":
         "Each string must appear in the first column of ``column_info_fname``. "
         "Default behavior is to process all columns.",
     )
+    parser.add_argument(
+        "-derived_columns",
+        action="store_true",
+        help="Additionally store the halo_hostid, host_row, num_snaps_since_merge "
+        "and last_surviving_id columns of each subvolume. "
+        "Requires the halo_id and upid columns.",
+    )
+    parser.add_argument(
+        "-trimmed_colnames",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Sequence of strings of history columns to store without the leading "
+        "zeros of each galaxy, as ``<colname>_trimmed_start`` and "
+        "``<colname>_trimmed_values`` columns. Default is to store all histories "
+        "as dense arrays.",
+    )
+    parser.add_argument(
+        "-history_summaries",
+        action="store_true",
+        help="Additionally store the t_half_mass, t_quench, sfr_peak, t_sfr_peak "
+        "and sm_formed columns of each galaxy, computed from its "
+        "sm_history_main_prog and sfr_history_main_prog. Requires "
+        "simulation_data/snapshot_times.npy in the output directory.",
+    )
+    parser.add_argument(
+        "-spatial_order",
+        action="store_true",
+        help="Reorder the rows of each subvolume along a Morton curve of the "
+        "positions and store the bounding boxes of blocks of rows in "
+        "spatial_blocks. Requires the x, y and z columns.",
+    )
+    parser.add_argument(
+        "-spatial_block_size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Number of rows per block of -spatial_order. "
+        "Default is {0}".format(DEFAULT_BLOCK_SIZE),
+    )
+    parser.add_argument(
+        "-halo_id_index",
+        action="store_true",
+        help="After reducing all subvolumes, store the sorted halo_id of the "
+        "processed subvolumes in halo_id_index, so that galaxies can be loaded "
+        "by ID without scanning the halo_id column. Requires the halo_id column.",
+    )
+    parser.add_argument(
+        "-column_sketches",
+        action="store_true",
+        help="Additionally store mergeable quantile and histogram sketches of "
+        "each one-dimensional column of each subvolume in column_sketches.",
+    )
+    parser.add_argument(
+        "-progress_log",
+        default=None,
+        help="Name of a JSON-lines file recording the runtime, bytes read and "
+        "written, rows, files opened and peak memory of each stage of the "
+        "reduction of each subvolume. Default is to not write a log.",
+    )
 
     args = parser.parse_args()
     ################################################################################
@@ -68,6 +133,15 @@ if __name__ == "__main__":
     requested_colnames = retrieve_requested_colnames(
         args.galaxy_colnames, args.column_info_fname
     )
+    if args.derived_columns:
+        msg = "Must reduce the halo_id and upid columns to store derived columns"
+        assert ("halo_id" in requested_colnames) & ("upid" in requested_colnames), msg
+    if args.spatial_order:
+        msg = "Must reduce the x, y and z columns to reorder rows spatially"
+        assert set(("x", "y", "z")) <= set(requested_colnames), msg
+    if args.halo_id_index:
+        msg = "Must reduce the halo_id column to index it"
+        assert "halo_id" in requested_colnames, msg
 
     fname_iter = sf_history_ascii_fname_iterator(
         args.subvolume_labels,
@@ -79,23 +153,59 @@ if __name__ == "__main__":
     scale_factor_subdrname = "a_" + args.scale_factor
     output_dirname = os.path.join(args.output_dirname, scale_factor_subdrname)
     os.makedirs(output_dirname, exist_ok=True)
+    summary_cosmic_age = None
+    if args.history_summaries:
+        summary_cosmic_age = get_snapshot_times(output_dirname)
+
+    progress_log = None
+    if args.progress_log is not None:
+        progress_log = JsonLinesProgressLog(args.progress_log)
+        progress_log.write("start", scale_factor=args.scale_factor)
+
     start = time()
     print("...beginning loop over files")
+    processed_subvolumes = []
     for subvol_index, ascii_fname in fname_iter:
         output_subdir = "subvol_" + str(subvol_index)
         subvol_output_dirname = os.path.join(output_dirname, output_subdir)
 
+        stats = IOStats() if progress_log is not None else None
         start1 = time()
         write_ascii_to_memmap_tree(
             ascii_fname,
             args.column_info_fname,
             subvol_output_dirname,
             requested_colnames,
+            trimmed_colnames=args.trimmed_colnames,
+            summary_cosmic_age=summary_cosmic_age,
+            stats=stats,
         )
+        if args.derived_columns:
+            write_derived_columns(output_dirname, [subvol_index])
+        if args.spatial_order:
+            reorder_subvolume_rows(
+                output_dirname, [subvol_index], args.spatial_block_size
+            )
+        if args.column_sketches:
+            write_column_sketches(output_dirname, [subvol_index], stats=stats)
+        processed_subvolumes.append(subvol_index)
         end1 = time()
         runtime1 = end1 - start1
         msg = "Runtime to reduce {0} = {1:.1f} seconds".format(output_subdir, runtime1)
         print(msg)
+        if progress_log is not None:
+            progress_log.write(
+                "subvolume_done",
+                subvol=subvol_index,
+                seconds=runtime1,
+                **stats.as_dict(),
+            )
+
+    if args.halo_id_index:
+        write_halo_id_index(output_dirname, processed_subvolumes)
 
     end = time()
     print("Total runtime = {0:.2f} seconds\n".format((end - start)))
+    if progress_log is not None:
+        progress_log.write("done", seconds=end - start)
+        progress_log.close()
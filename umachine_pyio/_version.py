@@ -0,0 +1 @@
+__version__ = "0.1.dev1+gf5ba6b4bd"
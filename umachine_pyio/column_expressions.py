@@ -0,0 +1,380 @@
+""" Module storing lazily evaluated expressions of the stored columns of a mock,
+e.g., ``np.log10(col("obs_sfr") / col("obs_sm"))``, evaluated in chunks of rows
+of each subvolume so that no input column is loaded in full.
+"""
+import operator
+
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+from .directory_tree_utils import subvol_dirname_iterator
+from .memmap_array_utils import (
+    TRIMMED_START_SUFFIX,
+    _column_fnames,
+    _read_trimmed_history_layout,
+    _select_trimmed_history_rows,
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+    trimmed_history_exists,
+    untrim_history,
+    write_column_to_memmap,
+)
+
+DEFAULT_CHUNK_SIZE = 2**16
+
+__all__ = (
+    "ColumnExpression",
+    "col",
+    "host_col",
+    "where",
+    "evaluate_expression",
+    "write_expression_column",
+)
+
+
+class ColumnExpression(NDArrayOperatorsMixin):
+    """Base class of the lazily evaluated expressions of stored columns.
+
+    Arithmetic and comparison operators, Numpy ufuncs such as ``np.log10``,
+    and indexing of the trailing axes, e.g., ``col("sm_history")[:, -1]``,
+    return new expressions instead of arrays. Expressions are evaluated
+    by `evaluate_expression` and `write_expression_column`.
+
+    Examples
+    --------
+    >>> ssfr = col("obs_sfr") / col("obs_sm")
+    >>> log_mpeak = np.log10(col("mpeak"))
+    >>> dx = col("x") - host_col("x")
+    >>> ssfr = evaluate_expression(ssfr, range(144), root_dirname)  # doctest: +SKIP
+    """
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if (method != "__call__") or ("out" in kwargs):
+            return NotImplemented
+        return _CallExpression(ufunc, inputs, kwargs)
+
+    def __getitem__(self, key):
+        return _CallExpression(operator.getitem, (self, key), dict())
+
+    @property
+    def colnames(self):
+        """Sorted list of the names of the stored columns used by the expression"""
+        return sorted(set(self._colnames()))
+
+    def _colnames(self):
+        raise NotImplementedError
+
+    def _evaluate(self, chunk):
+        raise NotImplementedError
+
+
+class _Column(ColumnExpression):
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "col({0!r})".format(self.name)
+
+    def _colnames(self):
+        return [self.name]
+
+    def _evaluate(self, chunk):
+        return chunk.column(self.name)
+
+
+class _HostColumn(ColumnExpression):
+    def __init__(self, name, fill_value):
+        self.name = name
+        self.fill_value = fill_value
+
+    def __repr__(self):
+        return "host_col({0!r})".format(self.name)
+
+    def _colnames(self):
+        return [self.name, "host_row"]
+
+    def _evaluate(self, chunk):
+        return chunk.host_column(self.name, self.fill_value)
+
+
+class _CallExpression(ColumnExpression):
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        name = getattr(self.func, "__name__", repr(self.func))
+        return "{0}({1})".format(name, ", ".join(repr(arg) for arg in self.args))
+
+    def _colnames(self):
+        colnames = []
+        for arg in self.args:
+            if isinstance(arg, ColumnExpression):
+                colnames.extend(arg._colnames())
+        return colnames
+
+    def _evaluate(self, chunk):
+        args = [
+            arg._evaluate(chunk) if isinstance(arg, ColumnExpression) else arg
+            for arg in self.args
+        ]
+        return self.func(*args, **self.kwargs)
+
+
+def col(name):
+    """Expression of a stored column
+
+    Parameters
+    ----------
+    name : string
+        Name of a column stored in each subvolume, e.g., ``obs_sm``.
+        Trimmed history columns are read as dense arrays.
+
+    Returns
+    -------
+    expr : ColumnExpression
+    """
+    return _Column(name)
+
+
+def host_col(name, fill_value=np.nan):
+    """Expression of a stored column of the host halo of each galaxy,
+    found through the ``host_row`` column of
+    `~umachine_pyio.derived_columns.write_derived_columns`
+
+    Parameters
+    ----------
+    name : string
+        Name of a column stored in each subvolume
+
+    fill_value : scalar, optional
+        Value of the galaxies whose host is not in the subvolume.
+        Default is NaN, so that integer columns are returned as floats.
+
+    Returns
+    -------
+    expr : ColumnExpression
+
+    Notes
+    -----
+    The host of a central galaxy is the galaxy itself.
+    """
+    return _HostColumn(name, fill_value)
+
+
+def where(condition, x, y):
+    """Expression of ``np.where(condition, x, y)``,
+    where each argument is either an expression or an array-like
+    """
+    return _CallExpression(np.where, (condition, x, y), dict())
+
+
+def evaluate_expression(
+    expr, subvolumes, root_dirname, chunk_size=DEFAULT_CHUNK_SIZE, stats=None
+):
+    """Evaluate an expression of stored columns into memory
+
+    Parameters
+    ----------
+    expr : ColumnExpression
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    chunk_size : int, optional
+        Number of rows read from each column at a time. Default is 65536.
+
+    stats : IOStats, optional
+        Records the memmap reads of each chunk.
+        See `~umachine_pyio.instrumentation.IOStats`.
+
+    Returns
+    -------
+    result : ndarray
+        Value of the expression for every galaxy, in the order of
+        `~umachine_pyio.load_mock.load_mock_from_binaries`
+
+    Notes
+    -----
+    Only ``chunk_size`` rows of each input column and of each intermediate
+    result are held in memory at a time, in addition to the output array.
+    """
+    subvol_dirnames = list(subvol_dirname_iterator(root_dirname, *subvolumes))
+    msg = "Must pass at least one subvolume"
+    assert len(subvol_dirnames) > 0, msg
+    num_rows = [_num_rows_of_expression(expr, d) for d in subvol_dirnames]
+
+    #  Empty subvolumes are skipped since they do not know
+    #  the number of scales of trimmed history columns
+    chunks = [
+        (subvol_dirname, rows)
+        for subvol_dirname, n in zip(subvol_dirnames, num_rows)
+        for rows in _chunk_slices(n, chunk_size)
+    ]
+    if len(chunks) == 0:
+        chunks = [(subvol_dirnames[0], slice(0, 0))]
+
+    #  The start column of each trimmed history column is read
+    #  once per subvolume rather than once per chunk
+    result, ifirst, trimmed_layouts = None, 0, dict()
+    for subvol_dirname, rows in chunks:
+        if subvol_dirname not in trimmed_layouts:
+            trimmed_layouts = {subvol_dirname: dict()}
+        arr = _evaluate_chunk(
+            expr, subvol_dirname, rows, stats, trimmed_layouts[subvol_dirname]
+        )
+        if result is None:
+            result = np.empty((sum(num_rows),) + arr.shape[1:], dtype=arr.dtype)
+        result[ifirst : ifirst + len(arr)] = arr
+        ifirst += len(arr)
+    return result
+
+
+def write_expression_column(
+    expr,
+    subvolumes,
+    root_dirname,
+    colname,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    stats=None,
+):
+    """Evaluate an expression of stored columns and store the result
+    as a new column of each subvolume
+
+    Parameters
+    ----------
+    expr : ColumnExpression
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    colname : string
+        Name of the new column, stored in ``subvol_N/colname/colname.memmap``.
+        An existing column is overwritten, including a column used by expr.
+
+    chunk_size : int, optional
+        Number of rows read from each column at a time. Default is 65536.
+
+    stats : IOStats, optional
+        Records the memmap reads and writes.
+        See `~umachine_pyio.instrumentation.IOStats`.
+
+    Examples
+    --------
+    >>> log_ssfr = np.log10(col("obs_sfr") / col("obs_sm"))
+    >>> write_expression_column(log_ssfr, range(144), root_dirname, "log_ssfr")  # doctest: +SKIP
+    """
+    subvolumes = list(subvolumes)
+    subvol_dirnames = list(subvol_dirname_iterator(root_dirname, *subvolumes))
+    num_rows = [_num_rows_of_expression(expr, d) for d in subvol_dirnames]
+
+    #  Empty subvolumes are written last, with the trailing shape and dtype
+    #  of the result of the other subvolumes
+    empty_result = None
+    for i in np.argsort(np.array(num_rows) == 0, kind="stable"):
+        if (num_rows[i] == 0) and (empty_result is not None):
+            result = empty_result
+        else:
+            result = evaluate_expression(
+                expr, [subvolumes[i]], root_dirname, chunk_size, stats
+            )
+            empty_result = result[:0]
+        write_column_to_memmap(result, subvol_dirnames[i], colname, stats=stats)
+
+
+class _Chunk:
+    """Private class storing the columns read for a chunk of rows of a subvolume"""
+
+    def __init__(self, subvol_dirname, rows, stats, trimmed_layouts):
+        self.subvol_dirname = subvol_dirname
+        self.rows = rows
+        self.stats = stats
+        self.trimmed_layouts = trimmed_layouts
+        self._columns = dict()
+
+    def read_rows(self, name, rows):
+        return _read_rows(
+            self.subvol_dirname, name, rows, self.stats, self.trimmed_layouts
+        )
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self.read_rows(name, self.rows)
+        return self._columns[name]
+
+    def host_column(self, name, fill_value):
+        key = ("host", name, fill_value)
+        if key not in self._columns:
+            host_row = self.column("host_row")
+            has_host = host_row >= 0
+            values = self.read_rows(name, np.where(has_host, host_row, 0))
+            dtype = np.result_type(values, fill_value)
+            values = values.astype(dtype, copy=False)
+            values[~has_host] = fill_value
+            self._columns[key] = values
+        return self._columns[key]
+
+
+def _evaluate_chunk(expr, subvol_dirname, rows, stats, trimmed_layouts):
+    """Private function evaluating the expression for a slice of rows of a subvolume"""
+    chunk = _Chunk(subvol_dirname, rows, stats, trimmed_layouts)
+    arr = np.asarray(expr._evaluate(chunk))
+    msg = "Expression {0} must have one value per row"
+    assert (arr.ndim > 0) and (len(arr) == rows.stop - rows.start), msg.format(expr)
+    return arr
+
+
+def _read_rows(subvol_dirname, colname, rows, stats, trimmed_layouts):
+    """Private function reading the selected rows of a column of a subvolume.
+    The layout of a trimmed history column is stored in ``trimmed_layouts``
+    so that the following chunks only read their own slice of the values.
+    """
+    if trimmed_history_exists(subvol_dirname, colname):
+        if colname not in trimmed_layouts:
+            trimmed_layouts[colname] = _read_trimmed_history_layout(
+                subvol_dirname, colname
+            )
+        start, values, num_scales = _select_trimmed_history_rows(
+            trimmed_layouts[colname], rows
+        )
+        return untrim_history(start, values, 0 if num_scales is None else num_scales)
+    memmap_fname, shape_fname = _column_fnames(subvol_dirname, colname)
+    return read_ndarray_from_memmap_sequence(
+        [memmap_fname], [shape_fname], [rows], stats=stats
+    )
+
+
+def _num_rows_of_expression(expr, subvol_dirname):
+    """Private function returning the number of rows of the columns
+    of the expression in the input subvolume
+    """
+    colnames = expr.colnames
+    msg = "Expression {0} must use at least one stored column"
+    assert len(colnames) > 0, msg.format(expr)
+
+    num_rows = set()
+    for colname in colnames:
+        if trimmed_history_exists(subvol_dirname, colname):
+            colname = colname + TRIMMED_START_SUFFIX
+        shape_fname = _column_fnames(subvol_dirname, colname)[1]
+        num_rows.add(read_shape_and_dtype_from_ascii(shape_fname)[0][0])
+    msg = "Columns {0} of {1} must have the same number of rows"
+    assert len(num_rows) == 1, msg.format(colnames, subvol_dirname)
+    return num_rows.pop()
+
+
+def _chunk_slices(num_rows, chunk_size):
+    """Private function returning the slices of consecutive chunks of rows"""
+    msg = "chunk_size must be a positive integer"
+    assert chunk_size > 0, msg
+    starts = range(0, num_rows, int(chunk_size))
+    return [slice(a, min(a + chunk_size, num_rows)) for a in starts]
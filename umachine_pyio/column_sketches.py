@@ -0,0 +1,445 @@
+""" Module storing mergeable sketches of the distribution of each column
+of each subvolume, used to answer approximate quantiles, histograms and
+counts above a threshold of any subset of subvolumes without loading columns.
+"""
+import os
+
+import numpy as np
+
+from .directory_tree_utils import subvol_dirname_iterator
+from .memmap_array_utils import (
+    TRIMMED_START_SUFFIX,
+    TRIMMED_VALUES_SUFFIX,
+    _column_fnames,
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+)
+
+COLUMN_SKETCH_DIRNAME = "column_sketches"
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_SKETCH_CHUNK_SIZE = 2**20
+
+__all__ = (
+    "ColumnSketch",
+    "merge_sketches",
+    "write_column_sketches",
+    "load_column_sketch",
+)
+
+
+class ColumnSketch:
+    """Mergeable sketch of the distribution of the values of a column.
+
+    Finite values are counted in logarithmically spaced buckets, so that every
+    quantile is returned with a relative error of at most ``relative_accuracy``,
+    and sketches of different subvolumes are merged by adding bucket counts.
+    The number of buckets grows with the logarithm of the dynamic range
+    of the values, not with the number of values.
+
+    Parameters
+    ----------
+    relative_accuracy : float, optional
+        Maximum relative error of the quantiles. Default is 0.01.
+
+    Notes
+    -----
+    Values within relative_accuracy of each other may fall in the same bucket.
+    Histograms and counts above a threshold split the count of the bucket
+    containing a bin edge or the threshold in proportion to the width of the
+    bucket on each side, so only the values within relative_accuracy of an
+    edge or of the threshold may be counted on the wrong side.
+    The minimum, maximum, sum and number of values are exact.
+
+    Examples
+    --------
+    >>> sketch = ColumnSketch.from_array(10 ** np.random.uniform(9, 12, 10000))
+    >>> median = sketch.quantile(0.5)
+    >>> num_massive = sketch.count_above(1e11)
+    >>> counts, edges = sketch.histogram(np.logspace(9, 12, 31))
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        msg = "relative_accuracy must be between 0 and 1"
+        assert 0 < relative_accuracy < 1, msg
+        self.relative_accuracy = float(relative_accuracy)
+        self.positive_keys = np.zeros(0, dtype=np.int64)
+        self.positive_counts = np.zeros(0, dtype=np.int64)
+        self.negative_keys = np.zeros(0, dtype=np.int64)
+        self.negative_counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.num_nonfinite = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.sum = 0.0
+
+    @property
+    def gamma(self):
+        """Ratio of the upper and lower edges of each bucket"""
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    @property
+    def count(self):
+        """Number of finite values"""
+        return int(
+            self.positive_counts.sum() + self.negative_counts.sum() + self.zero_count
+        )
+
+    @property
+    def mean(self):
+        """Mean of the finite values"""
+        return self.sum / self.count if self.count > 0 else np.nan
+
+    @classmethod
+    def from_array(cls, arr, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """Sketch of the values of the input array"""
+        sketch = cls(relative_accuracy)
+        sketch.update(arr)
+        return sketch
+
+    def update(self, arr):
+        """Add the values of the input array to the sketch, e.g.,
+        to sketch a column one chunk of rows at a time
+        """
+        x = np.asarray(arr, dtype=np.float64).ravel()
+        is_finite = np.isfinite(x)
+        self.num_nonfinite += int(len(x) - is_finite.sum())
+        x = x[is_finite]
+        if len(x) == 0:
+            return
+
+        log_gamma = np.log(self.gamma)
+        keys = dict()
+        for sign, y in ((1, x[x > 0]), (-1, -x[x < 0])):
+            keys[sign] = _count_keys(np.ceil(np.log(y) / log_gamma).astype(np.int64))
+        self.positive_keys, self.positive_counts = _merge_keys(
+            (self.positive_keys, self.positive_counts), keys[1]
+        )
+        self.negative_keys, self.negative_counts = _merge_keys(
+            (self.negative_keys, self.negative_counts), keys[-1]
+        )
+        self.zero_count += int(np.count_nonzero(x == 0))
+        self.min = float(np.fmin(self.min, x.min()))
+        self.max = float(np.fmax(self.max, x.max()))
+        self.sum += float(x.sum())
+
+    def merge(self, other):
+        """Return the sketch of the values of both sketches"""
+        msg = "Cannot merge sketches with different relative_accuracy"
+        assert self.relative_accuracy == other.relative_accuracy, msg
+        merged = ColumnSketch(self.relative_accuracy)
+        merged.positive_keys, merged.positive_counts = _merge_keys(
+            (self.positive_keys, self.positive_counts),
+            (other.positive_keys, other.positive_counts),
+        )
+        merged.negative_keys, merged.negative_counts = _merge_keys(
+            (self.negative_keys, self.negative_counts),
+            (other.negative_keys, other.negative_counts),
+        )
+        merged.zero_count = self.zero_count + other.zero_count
+        merged.num_nonfinite = self.num_nonfinite + other.num_nonfinite
+        merged.min = float(np.fmin(self.min, other.min))
+        merged.max = float(np.fmax(self.max, other.max))
+        merged.sum = self.sum + other.sum
+        return merged
+
+    def quantile(self, q):
+        """Approximate quantiles of the finite values
+
+        Parameters
+        ----------
+        q : float or ndarray
+            Quantiles between 0 and 1
+
+        Returns
+        -------
+        quantiles : float or ndarray
+            Value of each quantile, NaN for an empty sketch, within
+            relative_accuracy of the value of rank ``floor(q * (count - 1))``.
+            Quantiles 0 and 1 are the exact minimum and maximum.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        msg = "Quantiles must be between 0 and 1"
+        assert np.all((q >= 0) & (q <= 1)), msg
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+
+        #  The bucket with edges gamma**(k-1) and gamma**k is represented by
+        #  2 * gamma**k / (gamma + 1), within relative_accuracy of its values
+        gamma = self.gamma
+        representative = (2 / (gamma + 1)) * np.concatenate(
+            (
+                -(gamma ** self.negative_keys[::-1]),
+                [0.0],
+                gamma**self.positive_keys,
+            )
+        )
+        representative = np.clip(representative, self.min, self.max)
+
+        counts = self._bucket_edges()[2]
+        rank = np.floor(q * (self.count - 1))
+        ibucket = np.searchsorted(np.cumsum(counts), rank, side="right")
+        result = representative[np.minimum(ibucket, len(counts) - 1)]
+        result = np.where(q == 0, self.min, np.where(q == 1, self.max, result))
+        return result[()]
+
+    def count_above(self, threshold):
+        """Approximate number of finite values larger than the threshold"""
+        if self.count == 0:
+            return 0
+        num_below = self._cumulative_counts(np.atleast_1d(threshold), inclusive=True)
+        return int(np.round(self.count - num_below[0]))
+
+    def histogram(self, bins=10):
+        """Approximate histogram of the finite values
+
+        Parameters
+        ----------
+        bins : int or ndarray, optional
+            Number of bins between the minimum and the maximum,
+            or edges of the bins. Default is 10.
+
+        Returns
+        -------
+        counts, edges : ndarrays
+            See ``np.histogram``
+        """
+        if np.ndim(bins) == 0:
+            vmin, vmax = (0.0, 1.0) if self.count == 0 else (self.min, self.max)
+            bins = np.linspace(vmin, vmax, int(bins) + 1)
+        edges = np.asarray(bins, dtype=np.float64)
+        if self.count == 0:
+            return np.zeros(len(edges) - 1, dtype=np.int64), edges
+
+        #  Bins include their left edge, and the last bin its right edge
+        num_below = np.append(
+            self._cumulative_counts(edges[:-1], inclusive=False),
+            self._cumulative_counts(edges[-1:], inclusive=True),
+        )
+        return np.round(np.diff(num_below)).astype(np.int64), edges
+
+    def save(self, fname):
+        """Write the sketch to an ``.npz`` file that can be read with `load`"""
+        np.savez(
+            fname,
+            relative_accuracy=self.relative_accuracy,
+            positive_keys=self.positive_keys,
+            positive_counts=self.positive_counts,
+            negative_keys=self.negative_keys,
+            negative_counts=self.negative_counts,
+            zero_count=self.zero_count,
+            num_nonfinite=self.num_nonfinite,
+            min=self.min,
+            max=self.max,
+            sum=self.sum,
+        )
+
+    @classmethod
+    def load(cls, fname):
+        """Read a sketch written with the `save` method"""
+        with np.load(fname) as data:
+            sketch = cls(float(data["relative_accuracy"]))
+            for name in ("positive", "negative"):
+                for suffix in ("_keys", "_counts"):
+                    setattr(sketch, name + suffix, data[name + suffix])
+            sketch.zero_count = int(data["zero_count"])
+            sketch.num_nonfinite = int(data["num_nonfinite"])
+            for name in ("min", "max", "sum"):
+                setattr(sketch, name, float(data[name]))
+        return sketch
+
+    def _bucket_edges(self):
+        """Lower edge, upper edge and count of every bucket,
+        in ascending order of the values, with edges clipped to the exact
+        minimum and maximum
+        """
+        gamma = self.gamma
+        lo = np.concatenate(
+            (
+                -(gamma ** self.negative_keys[::-1]),
+                [0.0],
+                gamma ** (self.positive_keys - 1),
+            )
+        )
+        hi = np.concatenate(
+            (
+                -(gamma ** (self.negative_keys[::-1] - 1)),
+                [0.0],
+                gamma**self.positive_keys,
+            )
+        )
+        counts = np.concatenate(
+            (self.negative_counts[::-1], [self.zero_count], self.positive_counts)
+        )
+        lo = np.clip(lo, self.min, self.max)
+        hi = np.clip(hi, self.min, self.max)
+        return lo, hi, counts
+
+    def _cumulative_counts(self, t, inclusive):
+        """Approximate number of values below each element of t,
+        assuming the values of each bucket are uniformly distributed
+        between the edges of the bucket
+        """
+        lo, hi, counts = self._bucket_edges()
+        t = np.asarray(t, dtype=np.float64)[:, np.newaxis]
+        width = hi - lo
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.clip((t - lo) / width, 0, 1)
+        is_below = (t >= hi) if inclusive else (t > hi)
+        fraction = np.where(width > 0, fraction, is_below)
+        return np.dot(fraction, counts)
+
+
+def merge_sketches(sketches):
+    """Merge a sequence of sketches of the same relative_accuracy"""
+    sketches = list(sketches)
+    msg = "Must pass at least one sketch"
+    assert len(sketches) > 0, msg
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = merged.merge(sketch)
+    return merged
+
+
+def write_column_sketches(
+    root_dirname,
+    subvolumes,
+    colnames=None,
+    relative_accuracy=DEFAULT_RELATIVE_ACCURACY,
+    chunk_size=DEFAULT_SKETCH_CHUNK_SIZE,
+    stats=None,
+):
+    """Sketch the distribution of each column of each subvolume,
+    reading each column once in chunks of rows
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    colnames : sequence of strings, optional
+        Names of the columns to sketch. Default is every one-dimensional
+        numerical column of each subvolume. History columns are not sketched.
+
+    relative_accuracy : float, optional
+        See `ColumnSketch`. Default is 0.01.
+
+    chunk_size : int, optional
+        Number of rows read at a time. Default is 2**20.
+
+    stats : IOStats, optional
+        Records the memmap reads.
+        See `~umachine_pyio.instrumentation.IOStats`.
+
+    Notes
+    -----
+    The sketch of each column is stored in
+    ``root_dirname/column_sketches/subvol_N/<colname>.npz``,
+    replacing any existing sketch. Sketches must be rebuilt
+    when the values of a column are rewritten.
+    """
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        sketch_dirname = _sketch_dirname(root_dirname, subvol)
+        os.makedirs(sketch_dirname, exist_ok=True)
+        if colnames is None:
+            subvol_colnames = _sketchable_colnames(subvol_dirname)
+        else:
+            subvol_colnames = list(colnames)
+
+        for colname in subvol_colnames:
+            memmap_fname, shape_fname = _column_fnames(subvol_dirname, colname)
+            shape = read_shape_and_dtype_from_ascii(shape_fname)[0]
+            msg = "Cannot sketch column ``{0}`` of shape {1}"
+            assert len(shape) == 1, msg.format(colname, shape)
+
+            sketch = ColumnSketch(relative_accuracy)
+            for row_start in range(0, shape[0], int(chunk_size)):
+                rows = slice(row_start, row_start + int(chunk_size))
+                sketch.update(
+                    read_ndarray_from_memmap_sequence(
+                        [memmap_fname], [shape_fname], [rows], stats=stats
+                    )
+                )
+            sketch.save(os.path.join(sketch_dirname, colname + ".npz"))
+
+
+def load_column_sketch(root_dirname, subvolumes, colname):
+    """Merge the sketches of a column across the input subvolumes
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels, all sketched by `write_column_sketches`
+
+    colname : string
+        Name of the column
+
+    Returns
+    -------
+    sketch : ColumnSketch
+
+    Examples
+    --------
+    >>> sketch = load_column_sketch(root_dirname, range(144), "obs_sm")  # doctest: +SKIP
+    >>> num_massive = sketch.count_above(1e11)  # doctest: +SKIP
+    >>> sfr_quantiles = load_column_sketch(root_dirname, range(144), "obs_sfr").quantile([0.1, 0.5, 0.9])  # doctest: +SKIP
+    """
+    sketches = []
+    for subvol in subvolumes:
+        fname = os.path.join(_sketch_dirname(root_dirname, subvol), colname + ".npz")
+        msg = (
+            "No sketch of column ``{0}`` of subvol_{1}. "
+            "Build it with write_column_sketches"
+        )
+        assert os.path.isfile(fname), msg.format(colname, subvol)
+        sketches.append(ColumnSketch.load(fname))
+    return merge_sketches(sketches)
+
+
+def _count_keys(keys):
+    """Private function returning the sorted unique keys and their counts"""
+    if len(keys) == 0:
+        return keys, np.zeros(0, dtype=np.int64)
+    kmin = keys.min()
+    counts = np.bincount(keys - kmin)
+    has_count = counts > 0
+    return np.flatnonzero(has_count) + kmin, counts[has_count].astype(np.int64)
+
+
+def _merge_keys(keys_and_counts1, keys_and_counts2):
+    """Private function adding the counts of two sets of sorted unique keys"""
+    keys = np.concatenate((keys_and_counts1[0], keys_and_counts2[0]))
+    counts = np.concatenate((keys_and_counts1[1], keys_and_counts2[1]))
+    keys, idx = np.unique(keys, return_inverse=True)
+    counts = np.bincount(idx, weights=counts, minlength=len(keys))
+    return keys.astype(np.int64), counts.astype(np.int64)
+
+
+def _sketchable_colnames(subvol_dirname):
+    """Private function returning the sorted names of the one-dimensional
+    numerical columns of a subvolume
+    """
+    colnames = []
+    for colname in sorted(os.listdir(subvol_dirname)):
+        if colname.endswith((TRIMMED_START_SUFFIX, TRIMMED_VALUES_SUFFIX)):
+            continue
+        shape_fname = _column_fnames(subvol_dirname, colname)[1]
+        if not os.path.isfile(shape_fname):
+            continue
+        shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+        if (len(shape) == 1) and (np.dtype(dtype).kind in "biuf"):
+            colnames.append(colname)
+    return colnames
+
+
+def _sketch_dirname(root_dirname, subvol):
+    return os.path.join(root_dirname, COLUMN_SKETCH_DIRNAME, "subvol_" + str(subvol))
@@ -0,0 +1,105 @@
+""" Module storing functions used to compute columns derived from the
+ID columns of each subvolume and store them next to the reduced columns,
+so that value-adding the mock at load time only requires a gather.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator, subvol_dirname_iterator
+from .index_utils import (
+    calculate_last_surviving_id,
+    crossmatch,
+    get_num_snaps_since_orphan_merge,
+)
+from .memmap_array_utils import (
+    read_ndarray_from_memmap_sequence,
+    write_column_to_memmap,
+)
+
+derived_colnames = (
+    "halo_hostid",
+    "host_row",
+    "num_snaps_since_merge",
+    "last_surviving_id",
+)
+
+__all__ = ("compute_derived_columns", "write_derived_columns")
+
+
+def compute_derived_columns(halo_id, upid):
+    """Calculate the derived columns of a single subvolume
+
+    Parameters
+    ----------
+    halo_id : ndarray of shape (n, )
+        Integer array storing the ID of each galaxy in the subvolume
+
+    upid : ndarray of shape (n, )
+        Integer array storing the ID of the host halo of each satellite,
+        and -1 for each central
+
+    Returns
+    -------
+    derived_columns : OrderedDict
+        Dictionary storing the following arrays of shape (n, ):
+
+        - ``halo_hostid`` : ID of the host halo of each galaxy
+        - ``host_row`` : row of the host halo within the subvolume,
+          or -1 if the host halo does not appear in the subvolume
+        - ``num_snaps_since_merge`` : see `get_num_snaps_since_orphan_merge`
+        - ``last_surviving_id`` : see `calculate_last_surviving_id`
+
+    """
+    halo_id = np.asarray(halo_id).astype(np.int64)
+    upid = np.asarray(upid).astype(np.int64)
+
+    derived_columns = OrderedDict()
+    derived_columns["halo_hostid"] = np.where(upid == -1, halo_id, upid)
+
+    host_row = np.full(len(halo_id), -1, dtype=np.int64)
+    idxA, idxB = crossmatch(derived_columns["halo_hostid"], halo_id)
+    host_row[idxA] = idxB
+    derived_columns["host_row"] = host_row
+
+    num_snaps = get_num_snaps_since_orphan_merge(halo_id).astype(np.int32)
+    derived_columns["num_snaps_since_merge"] = num_snaps
+    derived_columns["last_surviving_id"] = calculate_last_surviving_id(halo_id)
+    return derived_columns
+
+
+def write_derived_columns(root_dirname, subvolumes):
+    """Compute the derived columns of each subvolume from its ``halo_id``
+    and ``upid`` columns, and store them as memmap columns of the subvolume
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    Notes
+    -----
+    When the ``host_row`` column is loaded with
+    `~umachine_pyio.load_mock.load_mock_from_binaries`, it is converted into
+    the row of the host halo in the loaded catalog, and
+    `~umachine_pyio.load_mock.value_added_mock` uses it in place of a crossmatch.
+    """
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        halo_id = _read_subvolume_column(root_dirname, "halo_id", subvol)
+        upid = _read_subvolume_column(root_dirname, "upid", subvol)
+        derived_columns = compute_derived_columns(halo_id, upid)
+        for colname, arr in derived_columns.items():
+            write_column_to_memmap(arr, subvol_dirname, colname)
+
+
+def _read_subvolume_column(root_dirname, colname, subvol):
+    memmap_fname, shape_fname = next(
+        memmap_fname_iterator(root_dirname, colname, subvol)
+    )
+    return read_ndarray_from_memmap_sequence(memmap_fname, shape_fname)
@@ -0,0 +1,307 @@
+""" Module storing functions used to crossmatch ID columns that do not fit in memory.
+The ID columns are streamed from sequences of memory-mapped arrays,
+sorted in runs of bounded length that are spilled to scratch disk,
+and the sorted runs are merge-joined.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .index_utils import CrossmatchIndex
+from .memmap_array_utils import (
+    read_shape_and_dtype_from_ascii,
+    write_shape_and_dtype_to_ascii,
+)
+
+__all__ = ("crossmatch_memmap_sequences",)
+
+
+def crossmatch_memmap_sequences(
+    x_memmap_fnames,
+    x_shape_fnames,
+    y_memmap_fnames,
+    y_shape_fnames,
+    output_dirname,
+    scratch_dirname=None,
+    max_rows_in_memory=int(1e7),
+):
+    """Out-of-core equivalent of `~umachine_pyio.index_utils.crossmatch` for
+    ID columns stored as sequences of memory-mapped arrays, e.g., as produced by
+    `~umachine_pyio.directory_tree_utils.memmap_fname_iterator`.
+
+    Parameters
+    ----------
+    x_memmap_fnames, x_shape_fnames : sequences of strings
+        Filenames of the memmaps and of their ASCII metadata
+        storing the ``x`` array of integers with possibly repeated entries.
+        The ``x`` array is the concatenation of the memmaps.
+
+    y_memmap_fnames, y_shape_fnames : sequences of strings
+        Filenames of the memmaps and of their ASCII metadata
+        storing the ``y`` array of unique integers
+
+    output_dirname : string
+        Directory where the result will be stored as memmap columns
+        ``idx_x`` and ``idx_y`` according to the standard directory tree layout
+
+    scratch_dirname : string, optional
+        Directory where the sorted runs will be temporarily stored.
+        Default is the system temporary directory.
+        Requires 16 bytes of disk space per element of ``x`` and ``y``,
+        plus 8 bytes per element of ``x``.
+
+    max_rows_in_memory : int, optional
+        Maximum number of IDs that are sorted or joined at once,
+        which bounds the memory use to about 40 bytes per row.
+        Default is 1e7.
+
+    Returns
+    -------
+    idx_x : memmap
+        Read-only integer memmap such that x[idx_x] = y[idx_y].
+        Sorted in ascending order.
+
+    idx_y : memmap
+        Read-only integer memmap such that x[idx_x] = y[idx_y]
+
+    """
+    max_rows_in_memory = int(max_rows_in_memory)
+    msg = "Input max_rows_in_memory must be a positive integer"
+    assert max_rows_in_memory > 0, msg
+
+    os.makedirs(output_dirname, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix="crossmatch_", dir=scratch_dirname)
+    try:
+        x_runs, num_x = _write_sorted_runs(
+            x_memmap_fnames, x_shape_fnames, scratch, "x", max_rows_in_memory
+        )
+        y_runs, __ = _write_sorted_runs(
+            y_memmap_fnames, y_shape_fnames, scratch, "y", max_rows_in_memory
+        )
+
+        row_of_match_fname = os.path.join(scratch, "row_of_match.memmap")
+        row_of_match = _filled_memmap(row_of_match_fname, num_x, -1)
+        _merge_join_runs(x_runs, y_runs, row_of_match, max_rows_in_memory)
+        row_of_match.flush()
+
+        idx_x, idx_y = _write_matches(row_of_match, output_dirname, max_rows_in_memory)
+        del row_of_match, x_runs, y_runs
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return idx_x, idx_y
+
+
+def _filled_memmap(fname, num_rows, fill_value):
+    mmp = np.memmap(fname, mode="w+", dtype=np.int64, shape=(max(num_rows, 1),))
+    mmp[:] = fill_value
+    return mmp[:num_rows]
+
+
+def _memmap_chunk_iterator(memmap_fnames, shape_fnames, max_rows):
+    """Yield consecutive chunks of at most ``max_rows`` rows of the concatenation
+    of the memmaps, converted to int64
+    """
+    memmap_fnames = np.atleast_1d(memmap_fnames)
+    shape_fnames = np.atleast_1d(shape_fnames)
+    msg = "Must have the same number of ``shapes`` as ``memmap_fnames``"
+    assert len(memmap_fnames) == len(shape_fnames), msg
+
+    for memmap_fname, shape_fname in zip(memmap_fnames, shape_fnames):
+        shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+        msg = "Memmap {0} must store a 1d array".format(memmap_fname)
+        assert len(shape) == 1, msg
+        if shape[0] == 0:
+            continue
+        mmp = np.memmap(memmap_fname, shape=shape, dtype=dtype, mode="r")
+        for ifirst in range(0, shape[0], max_rows):
+            yield np.array(mmp[ifirst : ifirst + max_rows], dtype=np.int64)
+
+
+def _write_sorted_runs(memmap_fnames, shape_fnames, scratch, label, max_rows):
+    """Sort the input sequence in runs of at most ``max_rows`` rows,
+    storing the sorted values and their global rows in scratch memmaps
+
+    Returns
+    -------
+    runs : list of tuples
+        Memmaps ``(values, rows)`` of each sorted run
+
+    num_rows : int
+        Total number of rows in the sequence
+    """
+    runs = []
+    num_rows = 0
+    chunks = _memmap_chunk_iterator(memmap_fnames, shape_fnames, max_rows)
+    for irun, values in enumerate(chunks):
+        isort = np.argsort(values, kind="stable")
+        run = []
+        for name, arr in (("values", values[isort]), ("rows", isort + num_rows)):
+            fname = os.path.join(
+                scratch, "{0}_run{1}_{2}.memmap".format(label, irun, name)
+            )
+            mmp = np.memmap(fname, mode="w+", dtype=np.int64, shape=arr.shape)
+            mmp[:] = arr
+            mmp.flush()
+            run.append(np.memmap(fname, mode="r", dtype=np.int64, shape=arr.shape))
+        runs.append(tuple(run))
+        num_rows += len(values)
+    return runs, num_rows
+
+
+def _merge_join_runs(x_runs, y_runs, row_of_match, max_rows_in_memory):
+    """Merge the sorted runs of ``x`` and ``y`` in rounds. Each round takes from
+    every run all remaining values below a common threshold, so that every
+    occurrence of a given value is joined in the same round.
+
+    Returns
+    -------
+    max_rows_per_round : int
+        Largest number of rows of ``x`` and ``y`` held in memory at once
+    """
+    runs = x_runs + y_runs
+    num_x_runs = len(x_runs)
+    block_size = max(max_rows_in_memory // max(len(runs), 1), 1)
+    cursors = [0] * len(runs)
+    max_rows_per_round = 0
+
+    while True:
+        # The threshold is the smallest value at the end of a block
+        # among the runs whose remaining values do not fit in the block
+        threshold = None
+        for (values, __), cursor in zip(runs, cursors):
+            if cursor + block_size < len(values):
+                last_value = values[cursor + block_size - 1]
+                if (threshold is None) or (last_value < threshold):
+                    threshold = last_value
+
+        stops = []
+        for (values, __), cursor in zip(runs, cursors):
+            block = values[cursor : cursor + block_size]
+            if threshold is None:
+                stops.append(cursor + len(block))
+            else:
+                stops.append(cursor + int(np.searchsorted(block, threshold, "left")))
+
+        if (threshold is not None) and (stops == cursors):
+            # A full block of some run equals the threshold
+            cursors = _join_repeated_value(
+                runs, cursors, threshold, num_x_runs, row_of_match, block_size
+            )
+            max_rows_per_round = max(max_rows_per_round, block_size)
+            continue
+
+        _join_round(runs, cursors, stops, num_x_runs, row_of_match)
+        num_rows = sum(b - a for a, b in zip(cursors, stops))
+        max_rows_per_round = max(max_rows_per_round, num_rows)
+        cursors = stops
+        if threshold is None:
+            break
+
+    return max_rows_per_round
+
+
+def _join_repeated_value(runs, cursors, value, num_x_runs, row_of_match, block_size):
+    """Join every remaining occurrence of ``value``, which starts the remaining
+    values of each run where it appears. Since ``y`` is unique, its single
+    match is looked up once, and the rows of ``x`` storing the value
+    are streamed in blocks of at most ``block_size`` rows.
+    Returns the cursors past the last occurrence of the value in each run.
+    """
+    stops = list(
+        cursor + int(np.searchsorted(values[cursor:], value, "right"))
+        for (values, __), cursor in zip(runs, cursors)
+    )
+
+    num_y_matches = sum(b - a for a, b in zip(cursors[num_x_runs:], stops[num_x_runs:]))
+    if num_y_matches > 1:
+        raise ValueError("Input array y must be a 1d sequence of unique integers")
+
+    y_row = -1
+    for (__, rows), a, b in zip(
+        runs[num_x_runs:], cursors[num_x_runs:], stops[num_x_runs:]
+    ):
+        if b > a:
+            y_row = rows[a]
+
+    if y_row >= 0:
+        for (__, rows), a, b in zip(runs[:num_x_runs], cursors, stops):
+            for ifirst in range(a, b, block_size):
+                row_of_match[rows[ifirst : min(ifirst + block_size, b)]] = y_row
+    return stops
+
+
+def _join_round(runs, cursors, stops, num_x_runs, row_of_match):
+    """Crossmatch in memory the values taken from each run in the current round,
+    storing the row of ``y`` matching each row of ``x`` in ``row_of_match``
+    """
+    taken = list(
+        (values[a:b], rows[a:b]) for (values, rows), a, b in zip(runs, cursors, stops)
+    )
+    x_values, x_rows = _concatenate_taken(taken[:num_x_runs])
+    y_values, y_rows = _concatenate_taken(taken[num_x_runs:])
+    if (len(x_values) == 0) | (len(y_values) == 0):
+        return
+
+    y_index = CrossmatchIndex(y_values, strategy="sort")
+    local_row = y_index.row_of_match(x_values, skip_bounds_checking=True)
+    has_match = local_row >= 0
+    row_of_match[x_rows[has_match]] = y_rows[local_row[has_match]]
+
+
+def _concatenate_taken(taken):
+    values = np.zeros(0, dtype=np.int64)
+    rows = np.zeros(0, dtype=np.int64)
+    if len(taken) > 0:
+        values = np.concatenate([values] + [t[0] for t in taken])
+        rows = np.concatenate([rows] + [t[1] for t in taken])
+    return values, rows
+
+
+def _write_matches(row_of_match, output_dirname, max_rows):
+    """Stream the dense row-of-match array into the ``idx_x`` and ``idx_y``
+    memmap columns
+    """
+    num_matches = 0
+    for ifirst in range(0, len(row_of_match), max_rows):
+        num_matches += np.count_nonzero(row_of_match[ifirst : ifirst + max_rows] >= 0)
+
+    outputs = []
+    for name in ("idx_x", "idx_y"):
+        dirname = os.path.join(output_dirname, name)
+        os.makedirs(dirname, exist_ok=True)
+        fname = os.path.join(dirname, name + ".memmap")
+        shape_fname = os.path.join(dirname, name + "_shape_and_dtype.txt")
+        write_shape_and_dtype_to_ascii(shape_fname, (num_matches,), np.dtype(np.int64))
+        if num_matches == 0:
+            open(fname, "wb").close()
+            outputs.append(None)
+        else:
+            outputs.append(
+                np.memmap(fname, mode="w+", dtype=np.int64, shape=(num_matches,))
+            )
+
+    if num_matches > 0:
+        idx_x, idx_y = outputs
+        icur = 0
+        for ifirst in range(0, len(row_of_match), max_rows):
+            chunk = np.array(row_of_match[ifirst : ifirst + max_rows])
+            matched = np.flatnonzero(chunk >= 0)
+            idx_x[icur : icur + len(matched)] = matched + ifirst
+            idx_y[icur : icur + len(matched)] = chunk[matched]
+            icur += len(matched)
+        idx_x.flush()
+        idx_y.flush()
+
+    results = []
+    for name in ("idx_x", "idx_y"):
+        fname = os.path.join(output_dirname, name, name + ".memmap")
+        if num_matches == 0:
+            results.append(np.zeros(0, dtype=np.int64))
+        else:
+            results.append(
+                np.memmap(fname, mode="r", dtype=np.int64, shape=(num_matches,))
+            )
+    return tuple(results)
@@ -0,0 +1,344 @@
+""" Module storing functions used to compute reductions of galaxy properties
+over groups of galaxies sharing an ID, e.g., all the galaxies of the same host halo.
+The galaxies are sorted by ID only once, after which every reduction
+is a vectorized pass over the sorted galaxies.
+"""
+import numpy as np
+
+from .load_mock import load_mock_from_binaries
+
+__all__ = ("GroupBy", "GroupByAccumulator", "groupby_subvolumes")
+
+_REDUCTIONS = ("count", "sum", "mean", "min", "max", "var", "std")
+
+
+class GroupBy:
+    """Groups of galaxies sharing the same ID
+
+    Parameters
+    ----------
+    keys : ndarray of shape (n, )
+        ID of the group of each galaxy, e.g., ``halo_hostid``
+
+    Examples
+    --------
+    >>> halo_hostid = np.random.randint(0, 100, 1000)
+    >>> sm = 10 ** np.random.uniform(9, 11, 1000)
+    >>> groups = GroupBy(halo_hostid)
+    >>> total_sm = groups.sum(sm)
+    >>> max_sm = groups.max(sm)
+    >>> richness = groups.count()
+    >>> sm_fraction = sm / groups.broadcast(total_sm)
+    """
+
+    def __init__(self, keys):
+        keys = np.atleast_1d(keys)
+        msg = "Input keys must be a 1d array"
+        assert keys.ndim == 1, msg
+
+        self.num_members = len(keys)
+        self.order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self.order]
+        if self.num_members == 0:
+            self.starts = np.zeros(0, dtype=np.int64)
+        else:
+            is_new_group = sorted_keys[1:] != sorted_keys[:-1]
+            self.starts = np.concatenate(([0], np.flatnonzero(is_new_group) + 1))
+        self.unique_keys = sorted_keys[self.starts]
+        self.counts = np.diff(np.append(self.starts, self.num_members))
+
+        # Group of each member in the original order of the keys
+        self.group_index = np.empty(self.num_members, dtype=np.int64)
+        self.group_index[self.order] = np.repeat(
+            np.arange(len(self.starts)), self.counts
+        )
+
+    @property
+    def num_groups(self):
+        return len(self.unique_keys)
+
+    def _sorted(self, values):
+        values = np.asarray(values)
+        msg = "Input values must have the same length as the keys"
+        assert len(values) == self.num_members, msg
+        return values[self.order]
+
+    def _reduceat(self, ufunc, sorted_values):
+        if self.num_groups == 0:
+            return np.zeros((0, *sorted_values.shape[1:]), dtype=sorted_values.dtype)
+        return ufunc.reduceat(sorted_values, self.starts, axis=0)
+
+    def _expand_weights(self, weights, values):
+        weights = np.asarray(weights, dtype=float)
+        return weights.reshape((-1,) + (1,) * (np.ndim(values) - 1))
+
+    def count(self, weights=None):
+        """Number of members of each group, or sum of weights of the members
+
+        Parameters
+        ----------
+        weights : ndarray of shape (n, ), optional
+            Weight of each member, e.g., a boolean mask selecting centrals
+
+        Returns
+        -------
+        counts : ndarray of shape (num_groups, )
+        """
+        if weights is None:
+            return self.counts.copy()
+        return self._reduceat(np.add, self._sorted(np.asarray(weights, dtype=float)))
+
+    def sum(self, values, weights=None):
+        """Sum of the values of the members of each group
+
+        Parameters
+        ----------
+        values : ndarray of shape (n, ) or (n, m)
+            Property of each member. History columns are reduced along axis 0.
+
+        weights : ndarray of shape (n, ), optional
+            Weight of each member. The weighted sum is returned if passed.
+
+        Returns
+        -------
+        sums : ndarray of shape (num_groups, ) or (num_groups, m)
+        """
+        values = np.asarray(values)
+        if weights is not None:
+            values = values * self._expand_weights(weights, values)
+        return self._reduceat(np.add, self._sorted(values))
+
+    def mean(self, values, weights=None):
+        """Mean of the values of the members of each group,
+        weighted by ``weights`` if passed. Groups with zero total weight are NaN.
+        """
+        sums = self.sum(values, weights)
+        norm = self.count(weights).astype(float)
+        norm = norm.reshape((-1,) + (1,) * (sums.ndim - 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return sums / norm
+
+    def min(self, values):
+        """Minimum of the values of the members of each group"""
+        return self._reduceat(np.minimum, self._sorted(values))
+
+    def max(self, values):
+        """Maximum of the values of the members of each group"""
+        return self._reduceat(np.maximum, self._sorted(values))
+
+    def var(self, values, weights=None):
+        """Variance of the values of the members of each group,
+        weighted by ``weights`` if passed. Computed in two passes
+        to avoid the cancellation of the sum-of-squares formula.
+        """
+        values = np.asarray(values, dtype=float)
+        deviations = values - self.broadcast(self.mean(values, weights))
+        return self.mean(deviations * deviations, weights)
+
+    def std(self, values, weights=None):
+        """Standard deviation of the values of the members of each group"""
+        return np.sqrt(self.var(values, weights))
+
+    def broadcast(self, group_values):
+        """Broadcast a property of each group back to its members
+
+        Parameters
+        ----------
+        group_values : ndarray of shape (num_groups, ...)
+            Property of each group, e.g., the output of `sum`
+
+        Returns
+        -------
+        member_values : ndarray of shape (n, ...)
+            Property of the group of each member, in the original order
+        """
+        return np.asarray(group_values)[self.group_index]
+
+    def aggregate(self, columns, reductions):
+        """Compute several reductions at once
+
+        Parameters
+        ----------
+        columns : dict-like
+            Mapping from column name to ndarray of shape (n, ...),
+            e.g., an Astropy Table of galaxies
+
+        reductions : dict
+            Mapping from output name to a tuple ``(colname, reduction)`` or
+            ``(colname, reduction, weight_colname)``,
+            where reduction is one of ``count``, ``sum``, ``mean``, ``min``,
+            ``max``, ``var`` or ``std``. Use None as colname for ``count``.
+
+        Returns
+        -------
+        result : dict
+            Mapping from output name to ndarray of shape (num_groups, ...)
+        """
+        result = dict()
+        for name, spec in reductions.items():
+            colname, reduction, weight_colname = _parse_reduction(spec)
+            weights = None if weight_colname is None else columns[weight_colname]
+            if reduction == "count":
+                result[name] = self.count(weights)
+            elif reduction in ("min", "max"):
+                result[name] = getattr(self, reduction)(columns[colname])
+            else:
+                result[name] = getattr(self, reduction)(columns[colname], weights)
+        return result
+
+
+class GroupByAccumulator:
+    """Reductions over groups of galaxies accumulated over chunks of galaxies,
+    e.g., one subvolume at a time. Members of the same group may appear
+    in any number of chunks.
+
+    Parameters
+    ----------
+    reductions : dict
+        Mapping from output name to a tuple ``(colname, reduction)`` or
+        ``(colname, reduction, weight_colname)``. See `GroupBy.aggregate`.
+
+    Examples
+    --------
+    >>> reductions = dict(total_sm=("sm", "sum"), richness=(None, "count"))
+    >>> accumulator = GroupByAccumulator(reductions)
+    >>> for subvol in range(144):  # doctest: +SKIP
+    ...     mock = load_mock_from_binaries([subvol], root_dirname, ["halo_hostid", "sm"])
+    ...     accumulator.update(mock["halo_hostid"], mock)
+    >>> unique_keys, result = accumulator.result()  # doctest: +SKIP
+    """
+
+    def __init__(self, reductions):
+        self.reductions = dict(
+            (name, _parse_reduction(spec)) for name, spec in reductions.items()
+        )
+        self._partial_keys = []
+        self._partials = dict((name, []) for name in self.reductions)
+
+    def update(self, keys, columns):
+        """Accumulate the reductions of a chunk of galaxies
+
+        Parameters
+        ----------
+        keys : ndarray of shape (n, )
+            ID of the group of each galaxy in the chunk
+
+        columns : dict-like
+            Mapping from column name to ndarray of shape (n, ...)
+        """
+        groups = GroupBy(keys)
+        self._partial_keys.append(groups.unique_keys)
+        for name, (colname, reduction, weight_colname) in self.reductions.items():
+            weights = None if weight_colname is None else columns[weight_colname]
+            if reduction == "count":
+                partial = (groups.count(weights),)
+            elif reduction == "sum":
+                partial = (groups.sum(columns[colname], weights),)
+            elif reduction in ("min", "max"):
+                partial = (getattr(groups, reduction)(columns[colname]),)
+            else:
+                # Mean and variance are merged from (weight, mean, M2) of each chunk
+                values = np.asarray(columns[colname], dtype=float)
+                norm = groups.count(weights).astype(float)
+                mean = groups.mean(values, weights)
+                deviations = values - groups.broadcast(mean)
+                m2 = groups.sum(deviations * deviations, weights)
+                partial = (norm, mean, m2)
+            self._partials[name].append(partial)
+
+    def result(self):
+        """Combine the accumulated chunks
+
+        Returns
+        -------
+        unique_keys : ndarray of shape (num_groups, )
+            Sorted ID of each group
+
+        result : dict
+            Mapping from output name to ndarray of shape (num_groups, ...)
+        """
+        msg = "Must call update at least once before result"
+        assert len(self._partial_keys) > 0, msg
+        groups = GroupBy(np.concatenate(self._partial_keys))
+
+        result = dict()
+        for name, (__, reduction, __) in self.reductions.items():
+            partials = list(zip(*self._partials[name]))
+            partials = list(np.concatenate(p) for p in partials)
+            if reduction in ("count", "sum"):
+                result[name] = groups.sum(partials[0])
+            elif reduction == "min":
+                result[name] = groups.min(partials[0])
+            elif reduction == "max":
+                result[name] = groups.max(partials[0])
+            else:
+                norm, mean, m2 = partials
+                #  Chunks where a group has zero total weight have NaN mean and M2
+                has_weight = (norm > 0).reshape((-1,) + (1,) * (mean.ndim - 1))
+                mean = np.where(has_weight, mean, 0.0)
+                m2 = np.where(has_weight, m2, 0.0)
+                combined_norm = groups.count(norm)
+                combined_mean = groups.mean(mean, norm)
+                deviations = mean - groups.broadcast(combined_mean)
+                combined_m2 = groups.sum(m2) + groups.sum(deviations * deviations, norm)
+                if reduction == "mean":
+                    result[name] = combined_mean
+                else:
+                    shape = (-1,) + (1,) * (combined_m2.ndim - 1)
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        var = combined_m2 / combined_norm.reshape(shape)
+                    result[name] = var if reduction == "var" else np.sqrt(var)
+        return groups.unique_keys, result
+
+
+def groupby_subvolumes(subvolumes, root_dirname, key, reductions):
+    """Compute reductions over groups of galaxies one subvolume at a time,
+    so that only the columns of a single subvolume are in memory at once
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    key : string
+        Name of the column storing the ID of the group of each galaxy,
+        e.g., ``halo_hostid``
+
+    reductions : dict
+        Mapping from output name to a tuple ``(colname, reduction)`` or
+        ``(colname, reduction, weight_colname)``. See `GroupBy.aggregate`.
+
+    Returns
+    -------
+    unique_keys : ndarray of shape (num_groups, )
+        Sorted ID of each group
+
+    result : dict
+        Mapping from output name to ndarray of shape (num_groups, ...)
+    """
+    accumulator = GroupByAccumulator(reductions)
+    galprops = {key}
+    for colname, __, weight_colname in accumulator.reductions.values():
+        galprops |= {colname, weight_colname}
+    galprops = sorted(galprops - {None})
+
+    for subvol in subvolumes:
+        mock = load_mock_from_binaries([subvol], root_dirname, galprops)
+        accumulator.update(mock[key], mock)
+    return accumulator.result()
+
+
+def _parse_reduction(spec):
+    if len(spec) == 2:
+        colname, reduction = spec
+        weight_colname = None
+    else:
+        colname, reduction, weight_colname = spec
+    if reduction not in _REDUCTIONS:
+        msg = "Reduction ``{0}`` must be one of {1}".format(reduction, _REDUCTIONS)
+        raise ValueError(msg)
+    return colname, reduction, weight_colname
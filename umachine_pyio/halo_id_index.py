@@ -0,0 +1,250 @@
+""" Module storing the HaloIDIndex class used to load the galaxies of
+a reduced snapshot with given ``halo_id``, reading only their rows
+from each subvolume rather than scanning the ``halo_id`` column.
+"""
+import os
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator
+from .index_utils import CrossmatchIndex
+from .load_mock import default_galprops, load_mock_from_binaries
+from .memmap_array_utils import (
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+)
+from .snapshot_linking import SUBVOLUME_OFFSETS_BASENAME
+
+HALO_ID_INDEX_DIRNAME = "halo_id_index"
+
+__all__ = ("HaloIDIndex", "write_halo_id_index", "load_galaxies_by_id")
+
+
+class HaloIDIndex:
+    """Persistent index mapping the ``halo_id`` of a galaxy to its subvolume
+    and to its row within that subvolume.
+
+    The index is stored in ``root_dirname/halo_id_index`` as the sorted
+    ``halo_id`` of the snapshot and the global row of each sorted ID,
+    see `write_halo_id_index`. Both arrays are memory-mapped, so that
+    a lookup is a binary search touching a few pages of the index
+    per requested ID, rather than a read of the ``halo_id`` column.
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the snapshot directory storing subdirectories with names
+        ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.,
+        and the index written by `write_halo_id_index`
+
+    Examples
+    --------
+    >>> write_halo_id_index(root_dirname, range(144))  # doctest: +SKIP
+    >>> index = HaloIDIndex(root_dirname)  # doctest: +SKIP
+    >>> subvol, subvol_row = index.lookup(halo_id)  # doctest: +SKIP
+    >>> mock, idx_found = index.load_galaxies(halo_id, ["sm", "x", "y", "z"])  # doctest: +SKIP
+    """
+
+    def __init__(self, root_dirname):
+        self.root_dirname = root_dirname
+        index_dirname = os.path.join(root_dirname, HALO_ID_INDEX_DIRNAME)
+        if not os.path.isdir(index_dirname):
+            msg = "No halo_id index in {0}. Build it with write_halo_id_index"
+            raise ValueError(msg.format(root_dirname))
+        self._index = CrossmatchIndex.load(index_dirname)
+        offsets_fname = os.path.join(index_dirname, SUBVOLUME_OFFSETS_BASENAME)
+        offsets = np.loadtxt(offsets_fname, dtype=np.int64, ndmin=2)
+        self.subvolumes, self._offsets, self._num_rows = offsets.T
+
+    def __len__(self):
+        return len(self._index)
+
+    def global_row(self, halo_id):
+        """Row of each galaxy in the concatenation of the indexed subvolumes
+
+        Parameters
+        ----------
+        halo_id : ndarray of shape (n, )
+
+        Returns
+        -------
+        row : ndarray of shape (n, )
+            Global row of each galaxy, or -1 if no galaxy has the input ``halo_id``
+        """
+        return self._index.row_of_match(halo_id)
+
+    def lookup(self, halo_id):
+        """Find the subvolume and the row within the subvolume of each galaxy
+
+        Parameters
+        ----------
+        halo_id : ndarray of shape (n, )
+
+        Returns
+        -------
+        subvol : ndarray of shape (n, )
+            Label of the subvolume of each galaxy, or -1 if no galaxy
+            has the input ``halo_id``
+
+        subvol_row : ndarray of shape (n, )
+            Row within the subvolume, as loaded by
+            `~umachine_pyio.load_mock.load_mock_from_binaries`, or -1
+        """
+        return self._subvolume_and_row(self.global_row(halo_id))
+
+    def load_galaxies(self, halo_id, galprops=default_galprops):
+        """Load the requested columns of the galaxies with the input ``halo_id``,
+        reading only their rows from each subvolume
+
+        Parameters
+        ----------
+        halo_id : ndarray of shape (n, )
+            IDs of the galaxies to load, possibly repeated
+
+        galprops : sequence of strings, optional
+            See `~umachine_pyio.load_mock.load_mock_from_binaries`
+
+        Returns
+        -------
+        mock : Astropy Table
+            Table of the galaxies found in the index, in the order of the
+            input IDs, so that ``mock["halo_id"] = halo_id[idx_found]``,
+            with the columns in the order of ``galprops``.
+            The ``host_row`` column stores the row of the host halo in this
+            table, or -1 if the host halo was not requested.
+
+        idx_found : ndarray
+            Sorted indices of the input IDs found in the index
+        """
+        halo_id = np.atleast_1d(halo_id).astype(np.int64)
+        row_of_match = self.global_row(halo_id)
+        idx_found = np.flatnonzero(row_of_match >= 0)
+        unique_rows, idx_unique = np.unique(
+            row_of_match[idx_found], return_inverse=True
+        )
+
+        isubvol = np.searchsorted(self._offsets, unique_rows, side="right") - 1
+        loaded_isubvol, ifirst = np.unique(isubvol, return_index=True)
+        if len(loaded_isubvol) == 0:
+            #  Load an empty selection of the first subvolume to get an empty table
+            loaded_isubvol = ifirst = np.zeros(1, dtype=np.int64)
+        subvol_rows = unique_rows - self._offsets[isubvol]
+        row_selections = np.split(subvol_rows, ifirst[1:])
+        subvolumes = self.subvolumes[loaded_isubvol]
+        self._check_num_rows(loaded_isubvol)
+
+        galprops = list(dict.fromkeys(np.atleast_1d(galprops)))
+        loaded_galprops = galprops
+        if "halo_id" not in galprops:
+            loaded_galprops = galprops + ["halo_id"]
+        mock = load_mock_from_binaries(
+            subvolumes,
+            self.root_dirname,
+            loaded_galprops,
+            row_selections=row_selections,
+        )
+        mock = mock[idx_unique]
+
+        if np.any(mock["halo_id"] != halo_id[idx_found]):
+            msg = (
+                "The halo_id index of {0} is stale. "
+                "Rebuild it with write_halo_id_index"
+            )
+            raise ValueError(msg.format(self.root_dirname))
+
+        if "host_row" in mock.keys():
+            #  Map the row of each host among the unique loaded rows
+            #  onto the first row of the output table storing that host
+            position = np.full(len(unique_rows) + 1, -1, dtype=np.int64)
+            position[idx_unique[::-1]] = np.arange(len(idx_unique))[::-1]
+            mock["host_row"] = position[mock["host_row"]]
+
+        #  Keep the order of the requested columns
+        return mock[galprops], idx_found
+
+    def _subvolume_and_row(self, rows):
+        rows = np.atleast_1d(rows).astype(np.int64)
+        isubvol = np.searchsorted(self._offsets, rows, side="right") - 1
+        is_valid = rows >= 0
+        subvol = np.where(is_valid, self.subvolumes[isubvol], -1)
+        subvol_row = np.where(is_valid, rows - self._offsets[isubvol], -1)
+        return subvol, subvol_row
+
+    def _check_num_rows(self, isubvol):
+        fname_tuples = memmap_fname_iterator(
+            self.root_dirname, "halo_id", *self.subvolumes[isubvol]
+        )
+        for i, (__, shape_fname) in zip(isubvol, fname_tuples):
+            if read_shape_and_dtype_from_ascii(shape_fname)[0][0] != self._num_rows[i]:
+                msg = (
+                    "The number of rows of subvol_{0} of {1} changed since its "
+                    "halo_id index was built. Rebuild it with write_halo_id_index"
+                )
+                raise ValueError(msg.format(self.subvolumes[i], self.root_dirname))
+
+
+def write_halo_id_index(root_dirname, subvolumes):
+    """Index the ``halo_id`` column of a reduced snapshot, see `HaloIDIndex`
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the snapshot directory storing subdirectories with names
+        ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to index
+
+    Notes
+    -----
+    The index is written to ``root_dirname/halo_id_index``, replacing any
+    existing index. The ``halo_id`` of all indexed subvolumes must be unique.
+    The index must be rebuilt if the rows of the subvolumes are reordered,
+    e.g., by `~umachine_pyio.spatial_ordering.reorder_subvolume_rows`;
+    `HaloIDIndex.load_galaxies` raises a ValueError when it detects
+    a stale index.
+    """
+    subvolumes = list(subvolumes)
+    fname_tuples = list(memmap_fname_iterator(root_dirname, "halo_id", *subvolumes))
+    shape_fnames = [t[1] for t in fname_tuples]
+    halo_id = read_ndarray_from_memmap_sequence(
+        [t[0] for t in fname_tuples], shape_fnames
+    )
+    num_rows = [read_shape_and_dtype_from_ascii(f)[0][0] for f in shape_fnames]
+
+    index_dirname = os.path.join(root_dirname, HALO_ID_INDEX_DIRNAME)
+    CrossmatchIndex(halo_id, strategy="sort").save(index_dirname)
+
+    offsets = np.cumsum([0] + num_rows[:-1])
+    with open(os.path.join(index_dirname, SUBVOLUME_OFFSETS_BASENAME), "w") as f:
+        for subvol, offset, n in zip(subvolumes, offsets, num_rows):
+            f.write("{0} {1} {2}\n".format(subvol, offset, n))
+
+
+def load_galaxies_by_id(root_dirname, halo_id, galprops=default_galprops):
+    """Load the requested columns of the galaxies with the input ``halo_id``
+    using the index written by `write_halo_id_index`
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the snapshot directory
+
+    halo_id : ndarray of shape (n, )
+        IDs of the galaxies to load
+
+    galprops : sequence of strings, optional
+        See `~umachine_pyio.load_mock.load_mock_from_binaries`
+
+    Returns
+    -------
+    mock : Astropy Table
+
+    idx_found : ndarray
+        See `HaloIDIndex.load_galaxies`
+
+    Examples
+    --------
+    >>> mock, idx_found = load_galaxies_by_id(root_dirname, halo_id, ["sm"])  # doctest: +SKIP
+    """
+    return HaloIDIndex(root_dirname).load_galaxies(halo_id, galprops)
@@ -0,0 +1,256 @@
+""" Module storing functions used to compute scalar summaries of the
+star formation history of each galaxy, such as the half-mass formation time,
+and store them as columns next to the reduced columns,
+so that most analyses do not need to load the history columns.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from .directory_tree_utils import subvol_dirname_iterator
+from .load_mock import get_snapshot_times, load_mock_from_binaries
+from .memmap_array_utils import write_column_to_memmap
+
+history_summary_colnames = (
+    "t_half_mass",
+    "t_quench",
+    "sfr_peak",
+    "t_sfr_peak",
+    "sm_formed",
+)
+history_summary_input_colnames = ("sm_history_main_prog", "sfr_history_main_prog")
+
+DEFAULT_SSFR_QUENCHING_CUT = 1e-11
+
+__all__ = (
+    "half_mass_time",
+    "quenching_time",
+    "peak_sfr",
+    "integrated_mass",
+    "compute_history_summaries",
+    "write_history_summaries",
+)
+
+
+def half_mass_time(sm_history, cosmic_age, fraction=0.5):
+    """Calculate the time at which each galaxy first formed
+    the input fraction of its present-day stellar mass
+
+    Parameters
+    ----------
+    sm_history : ndarray of shape (n, num_snapshots)
+        Stellar mass history of each galaxy, e.g., ``sm_history_main_prog``
+
+    cosmic_age : ndarray of shape (num_snapshots, )
+        Age of the Universe in Gyr at each snapshot
+
+    fraction : float, optional
+        Fraction of the stellar mass at the last snapshot. Default is 0.5.
+
+    Returns
+    -------
+    t_half_mass : ndarray of shape (n, )
+        Age of the Universe in Gyr, linearly interpolated between the snapshots
+        bracketing the first crossing. NaN for galaxies without stellar mass.
+    """
+    sm_history, cosmic_age = _check_history(sm_history, cosmic_age)
+    num_gals = sm_history.shape[0]
+    if num_gals == 0:
+        return np.zeros(0)
+
+    target_sm = fraction * sm_history[:, -1]
+    iupper = np.argmax(sm_history >= target_sm[:, np.newaxis], axis=1)
+    ilower = np.maximum(iupper - 1, 0)
+    rows = np.arange(num_gals)
+    sm_lower, sm_upper = sm_history[rows, ilower], sm_history[rows, iupper]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(
+            sm_upper > sm_lower, (target_sm - sm_lower) / (sm_upper - sm_lower), 1.0
+        )
+    t_lower, t_upper = cosmic_age[ilower], cosmic_age[iupper]
+    t_half_mass = t_lower + weight * (t_upper - t_lower)
+    return np.where(sm_history[:, -1] > 0, t_half_mass, np.nan)
+
+
+def quenching_time(
+    sfr_history, sm_history, cosmic_age, ssfr_cut=DEFAULT_SSFR_QUENCHING_CUT
+):
+    """Calculate the time at which each quenched galaxy last quenched
+
+    Parameters
+    ----------
+    sfr_history : ndarray of shape (n, num_snapshots)
+        Star formation rate history of each galaxy in Msun/yr
+
+    sm_history : ndarray of shape (n, num_snapshots)
+        Stellar mass history of each galaxy in Msun
+
+    cosmic_age : ndarray of shape (num_snapshots, )
+        Age of the Universe in Gyr at each snapshot
+
+    ssfr_cut : float, optional
+        Galaxies with sfr / sm below ssfr_cut in 1/yr are quenched.
+        Default is 1e-11.
+
+    Returns
+    -------
+    t_quench : ndarray of shape (n, )
+        Age of the Universe at the first snapshot of the final quenched period.
+        NaN for galaxies that are star-forming at the last snapshot
+        or that were never star-forming.
+    """
+    sfr_history, cosmic_age = _check_history(sfr_history, cosmic_age)
+    sm_history, __ = _check_history(sm_history, cosmic_age)
+    num_snapshots = len(cosmic_age)
+    if sfr_history.shape[0] == 0:
+        return np.zeros(0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        is_star_forming = sfr_history >= ssfr_cut * sm_history
+    is_star_forming &= sm_history > 0
+
+    ever_star_forming = is_star_forming.any(axis=1)
+    ilast_sf = num_snapshots - 1 - np.argmax(is_star_forming[:, ::-1], axis=1)
+    is_quenched = ever_star_forming & ~is_star_forming[:, -1]
+    iquench = np.minimum(ilast_sf + 1, num_snapshots - 1)
+    return np.where(is_quenched, cosmic_age[iquench], np.nan)
+
+
+def peak_sfr(sfr_history, cosmic_age):
+    """Calculate the peak star formation rate of each galaxy and its time
+
+    Parameters
+    ----------
+    sfr_history : ndarray of shape (n, num_snapshots)
+        Star formation rate history of each galaxy
+
+    cosmic_age : ndarray of shape (num_snapshots, )
+        Age of the Universe in Gyr at each snapshot
+
+    Returns
+    -------
+    sfr_peak : ndarray of shape (n, )
+        Maximum star formation rate over all snapshots
+
+    t_sfr_peak : ndarray of shape (n, )
+        Age of the Universe in Gyr of the first snapshot reaching sfr_peak
+    """
+    sfr_history, cosmic_age = _check_history(sfr_history, cosmic_age)
+    ipeak = np.argmax(sfr_history, axis=1)
+    sfr_peak = sfr_history[np.arange(sfr_history.shape[0]), ipeak]
+    return sfr_peak, cosmic_age[ipeak]
+
+
+def integrated_mass(sfr_history, cosmic_age):
+    """Calculate the stellar mass formed by each galaxy by integrating
+    its star formation rate history with the trapezoidal rule
+
+    Parameters
+    ----------
+    sfr_history : ndarray of shape (n, num_snapshots)
+        Star formation rate history of each galaxy in Msun/yr
+
+    cosmic_age : ndarray of shape (num_snapshots, )
+        Age of the Universe in Gyr at each snapshot
+
+    Returns
+    -------
+    sm_formed : ndarray of shape (n, )
+        Total stellar mass formed in Msun, neglecting mass loss
+    """
+    sfr_history, cosmic_age = _check_history(sfr_history, cosmic_age)
+    dt_yr = np.diff(cosmic_age) * 1e9
+    mean_sfr = 0.5 * (sfr_history[:, 1:] + sfr_history[:, :-1])
+    return mean_sfr @ dt_yr
+
+
+def compute_history_summaries(
+    sm_history, sfr_history, cosmic_age, ssfr_cut=DEFAULT_SSFR_QUENCHING_CUT
+):
+    """Calculate every history summary of a chunk of galaxies
+
+    Parameters
+    ----------
+    sm_history : ndarray of shape (n, num_snapshots)
+        Stellar mass history of each galaxy, ``sm_history_main_prog``
+
+    sfr_history : ndarray of shape (n, num_snapshots)
+        Star formation rate history of each galaxy, ``sfr_history_main_prog``
+
+    cosmic_age : ndarray of shape (num_snapshots, )
+        Age of the Universe in Gyr at each snapshot
+
+    ssfr_cut : float, optional
+        See `quenching_time`
+
+    Returns
+    -------
+    history_summaries : OrderedDict
+        Dictionary storing the following arrays of shape (n, ):
+
+        - ``t_half_mass`` : see `half_mass_time`
+        - ``t_quench`` : see `quenching_time`
+        - ``sfr_peak`` and ``t_sfr_peak`` : see `peak_sfr`
+        - ``sm_formed`` : see `integrated_mass`
+
+    """
+    history_summaries = OrderedDict()
+    history_summaries["t_half_mass"] = half_mass_time(sm_history, cosmic_age)
+    history_summaries["t_quench"] = quenching_time(
+        sfr_history, sm_history, cosmic_age, ssfr_cut
+    )
+    sfr_peak, t_sfr_peak = peak_sfr(sfr_history, cosmic_age)
+    history_summaries["sfr_peak"] = sfr_peak
+    history_summaries["t_sfr_peak"] = t_sfr_peak
+    history_summaries["sm_formed"] = integrated_mass(sfr_history, cosmic_age)
+    return history_summaries
+
+
+def write_history_summaries(
+    root_dirname, subvolumes, cosmic_age=None, ssfr_cut=DEFAULT_SSFR_QUENCHING_CUT
+):
+    """Compute the history summaries of each subvolume of an already reduced tree
+    from its ``sm_history_main_prog`` and ``sfr_history_main_prog`` columns,
+    one subvolume at a time, and store them as memmap columns of the subvolume
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    cosmic_age : ndarray of shape (num_snapshots, ), optional
+        Age of the Universe in Gyr at each snapshot. Default is the output of
+        `~umachine_pyio.load_mock.get_snapshot_times`.
+
+    ssfr_cut : float, optional
+        See `quenching_time`
+    """
+    if cosmic_age is None:
+        cosmic_age = get_snapshot_times(root_dirname)
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        mock = load_mock_from_binaries(
+            [subvol], root_dirname, list(history_summary_input_colnames)
+        )
+        history_summaries = compute_history_summaries(
+            mock["sm_history_main_prog"],
+            mock["sfr_history_main_prog"],
+            cosmic_age,
+            ssfr_cut,
+        )
+        for colname, arr in history_summaries.items():
+            write_column_to_memmap(arr, subvol_dirname, colname)
+
+
+def _check_history(history, cosmic_age):
+    history = np.asarray(history, dtype=float)
+    cosmic_age = np.asarray(cosmic_age, dtype=float)
+    msg = "history must have shape (n, {0})".format(len(cosmic_age))
+    assert (history.ndim == 2) & (history.shape[1] == len(cosmic_age)), msg
+    return history, cosmic_age
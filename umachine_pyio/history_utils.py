@@ -0,0 +1,279 @@
+""" Module storing functions used to evaluate the history columns of the mock,
+e.g., ``sm_history_main_prog`` or ``sfr_history_main_prog``,
+at arbitrary cosmic times or scale factors in between the snapshots.
+"""
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator, subvol_dirname_iterator
+from .load_mock import (
+    _is_trimmed_history,
+    _row_selections_from_row_ranges,
+    get_snapshot_times,
+)
+from .memmap_array_utils import (
+    _read_trimmed_history_layout,
+    _select_trimmed_history_rows,
+    read_shape_and_dtype_from_ascii,
+)
+from .memmap_cache import _cached_memmap
+
+__all__ = (
+    "interpolate_history",
+    "interpolate_history_from_binaries",
+    "interpolate_history_chunks",
+)
+
+
+def interpolate_history(history, snapshot_abscissa, target_abscissa):
+    """Linearly interpolate the history of every galaxy at the target abscissa
+
+    Parameters
+    ----------
+    history : ndarray of shape (n, num_snapshots)
+        History of each galaxy sampled at each snapshot
+
+    snapshot_abscissa : ndarray of shape (num_snapshots, )
+        Monotonically increasing cosmic time or scale factor of each snapshot
+
+    target_abscissa : ndarray of shape (num_targets, )
+        Cosmic times or scale factors at which to evaluate the history.
+        Values outside the range of the snapshots take the value
+        of the first or last snapshot, as in ``np.interp``.
+
+    Returns
+    -------
+    result : ndarray of shape (n, num_targets)
+
+    Examples
+    --------
+    >>> history = np.random.uniform(size=(1000, 178))
+    >>> cosmic_age = np.linspace(0.1, 13.8, 178)
+    >>> result = interpolate_history(history, cosmic_age, [1.0, 12.8])
+    """
+    cols, indices, weights = _bracketing_snapshots(snapshot_abscissa, target_abscissa)
+    history = np.asarray(history)
+    msg = "history must have shape (n, {0})".format(len(snapshot_abscissa))
+    assert (history.ndim == 2) & (history.shape[1] == len(snapshot_abscissa)), msg
+    return _interpolate_bracketing_columns(history[:, cols], indices, weights)
+
+
+def interpolate_history_from_binaries(
+    subvolumes,
+    root_dirname,
+    colname,
+    target_times=None,
+    target_scale_factors=None,
+    scale_list=None,
+    row_ranges=None,
+):
+    """Evaluate a history column of the mock at arbitrary cosmic times
+    or scale factors, reading only the snapshot columns that bracket the targets
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    colname : string
+        Name of a history column, e.g., ``sfr_history_main_prog``
+
+    target_times : ndarray of shape (num_targets, ), optional
+        Ages of the Universe in Gyr, interpolated on the snapshot times
+        returned by `~umachine_pyio.load_mock.get_snapshot_times`.
+        Exactly one of target_times and target_scale_factors must be passed.
+
+    target_scale_factors : ndarray of shape (num_targets, ), optional
+        Scale factors, interpolated on the input scale_list
+
+    scale_list : ndarray of shape (num_snapshots, ), optional
+        Scale factor of each snapshot, e.g., the ``scale list`` of the
+        header of the UniverseMachine outputs.
+        Required when passing target_scale_factors.
+
+    row_ranges : sequence of tuples, optional
+        One ``(row_start, row_stop)`` tuple per element of ``subvolumes``.
+        See `~umachine_pyio.load_mock.load_mock_from_binaries`.
+
+    Returns
+    -------
+    result : ndarray of shape (ngals, num_targets)
+        History of each galaxy evaluated at each target, in float64
+    """
+    subvolumes = list(subvolumes)
+    row_selections = _row_selections_from_row_ranges(row_ranges)
+    if row_selections is None:
+        row_selections = [None] * len(subvolumes)
+    chunks = list(
+        _interpolate_history_generator(
+            subvolumes,
+            root_dirname,
+            colname,
+            target_times,
+            target_scale_factors,
+            scale_list,
+            row_selections,
+        )
+    )
+    if len(chunks) == 0:
+        num_targets = len(np.atleast_1d(_targets(target_times, target_scale_factors)))
+        return np.zeros((0, num_targets))
+    return np.concatenate([chunk for __, chunk in chunks])
+
+
+def interpolate_history_chunks(
+    subvolumes,
+    root_dirname,
+    colname,
+    target_times=None,
+    target_scale_factors=None,
+    scale_list=None,
+):
+    """Generator evaluating a history column one subvolume at a time,
+    so that memory use is set by the largest subvolume
+
+    Parameters are the same as `interpolate_history_from_binaries`.
+
+    Yields
+    ------
+    subvol : int
+        Label of the subvolume
+
+    result : ndarray of shape (ngals_subvol, num_targets)
+        History of each galaxy in the subvolume evaluated at each target
+    """
+    subvolumes = list(subvolumes)
+    yield from _interpolate_history_generator(
+        subvolumes,
+        root_dirname,
+        colname,
+        target_times,
+        target_scale_factors,
+        scale_list,
+        [None] * len(subvolumes),
+    )
+
+
+def _interpolate_history_generator(
+    subvolumes,
+    root_dirname,
+    colname,
+    target_times,
+    target_scale_factors,
+    scale_list,
+    row_selections,
+):
+    targets = _targets(target_times, target_scale_factors)
+    if target_times is not None:
+        snapshot_abscissa = get_snapshot_times(root_dirname)
+    else:
+        msg = "Must pass scale_list to interpolate at target_scale_factors"
+        assert scale_list is not None, msg
+        snapshot_abscissa = np.asarray(scale_list, dtype=float)
+
+    cols, indices, weights = _bracketing_snapshots(snapshot_abscissa, targets)
+
+    fname_tuples = memmap_fname_iterator(root_dirname, colname, *subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    msg = "Column ``{0}`` has {1} snapshots but the abscissa has {2}"
+    for subvol, subvol_dirname, (memmap_fname, shape_fname), rows in zip(
+        subvolumes, subvol_dirnames, fname_tuples, row_selections
+    ):
+        if _is_trimmed_history([subvol_dirname], [shape_fname], colname):
+            layout = _read_trimmed_history_layout(subvol_dirname, colname)
+            start, values, num_scales = _select_trimmed_history_rows(layout, rows)
+            #  Subvolumes without galaxies do not know their number of scales
+            if num_scales is None:
+                num_scales = len(snapshot_abscissa)
+            assert num_scales == len(snapshot_abscissa), msg.format(
+                colname, (num_scales,), len(snapshot_abscissa)
+            )
+            bracketing_history = _trimmed_history_columns(
+                start, values, num_scales, cols
+            )
+        else:
+            shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+            assert shape[1:] == (len(snapshot_abscissa),), msg.format(
+                colname, shape[1:], len(snapshot_abscissa)
+            )
+            if shape[0] == 0:
+                bracketing_history = np.zeros((0, len(cols)), dtype=dtype)
+            else:
+                mmp = _cached_memmap(memmap_fname, shape, dtype)[0]
+                if rows is None:
+                    bracketing_history = mmp[:, cols]
+                elif isinstance(rows, slice):
+                    bracketing_history = mmp[rows][:, cols]
+                else:
+                    bracketing_history = mmp[np.ix_(np.asarray(rows), cols)]
+        yield subvol, _interpolate_bracketing_columns(
+            bracketing_history, indices, weights
+        )
+
+
+def _targets(target_times, target_scale_factors):
+    msg = "Must pass exactly one of target_times and target_scale_factors"
+    assert (target_times is None) != (target_scale_factors is None), msg
+    if target_times is not None:
+        return np.atleast_1d(target_times).astype(float)
+    return np.atleast_1d(target_scale_factors).astype(float)
+
+
+def _bracketing_snapshots(snapshot_abscissa, target_abscissa):
+    """Determine the snapshot columns bracketing each target
+
+    Returns
+    -------
+    cols : ndarray of shape (num_cols, )
+        Sorted unique snapshot columns needed to interpolate at every target
+
+    indices : ndarray of shape (2, num_targets)
+        Position in cols of the lower and upper bracketing column of each target
+
+    weights : ndarray of shape (num_targets, )
+        Weight of the upper bracketing column of each target
+    """
+    snapshot_abscissa = np.asarray(snapshot_abscissa, dtype=float)
+    target_abscissa = np.atleast_1d(target_abscissa).astype(float)
+    msg = "snapshot abscissa must be monotonically increasing"
+    assert np.all(np.diff(snapshot_abscissa) > 0), msg
+
+    num_snapshots = len(snapshot_abscissa)
+    clipped = np.clip(target_abscissa, snapshot_abscissa[0], snapshot_abscissa[-1])
+    iupper = np.searchsorted(snapshot_abscissa, clipped, side="left")
+    iupper = np.clip(iupper, 1, max(num_snapshots - 1, 1))
+    ilower = iupper - 1
+    if num_snapshots == 1:
+        iupper = ilower = np.zeros_like(iupper)
+        weights = np.zeros(len(clipped))
+    else:
+        x0, x1 = snapshot_abscissa[ilower], snapshot_abscissa[iupper]
+        weights = (clipped - x0) / (x1 - x0)
+
+    cols, inverse = np.unique(np.concatenate((ilower, iupper)), return_inverse=True)
+    indices = inverse.reshape((2, len(clipped)))
+    return cols, indices, weights
+
+
+def _trimmed_history_columns(start, values, num_scales, cols):
+    """Private function returning the columns ``cols`` of the history encoded
+    by `~umachine_pyio.memmap_array_utils.trim_history`,
+    without reconstructing the other columns of the dense history
+    """
+    start = np.asarray(start).astype(np.int64)[:, np.newaxis]
+    lengths = num_scales - start
+    offsets = np.cumsum(lengths) - lengths[:, 0]
+    is_kept = cols >= start
+    idx_values = offsets[:, np.newaxis] + cols - start
+    history = np.zeros(is_kept.shape, dtype=values.dtype)
+    history[is_kept] = values[idx_values[is_kept]]
+    return history
+
+
+def _interpolate_bracketing_columns(bracketing_history, indices, weights):
+    lower = bracketing_history[:, indices[0]].astype(float)
+    upper = bracketing_history[:, indices[1]].astype(float)
+    return lower + weights * (upper - lower)
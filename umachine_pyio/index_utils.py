@@ -1,7 +1,22 @@
 """Utility functions related to Rockstar/UniverseMachine indexing conventions
 """
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
+from .memmap_array_utils import read_shape_and_dtype_from_ascii, write_column_to_memmap
+
+ORPHAN_ID_OFFSET = 10**15
+
+CROSSMATCH_INDEX_INFO_BASENAME = "crossmatch_index_info.txt"
+_CROSSMATCH_INDEX_ARRAY_NAMES = dict(
+    lookup=("lookup_table",),
+    sorted=("y_sorted",),
+    hash=("slot_keys", "slot_rows"),
+    sort=("y_sorted", "idx_y_sorted"),
+)
+
 
 def get_num_snaps_since_orphan_merge(halo_id):
     """Calculate the number of snapshots since the time a subhalo merged
@@ -16,8 +31,14 @@ def get_num_snaps_since_orphan_merge(halo_id):
         Integer array storing num_snaps since the time of merging
         Equals zero if and only if the (sub)halo survives to z=0
 
+    Notes
+    -----
+    The calculation uses exact int64 arithmetic,
+    so that the result is correct for arbitrarily large IDs.
+
     """
-    num_snaps = np.floor(halo_id / 1e15).astype(int)
+    halo_id = np.asarray(halo_id).astype(np.int64)
+    num_snaps = np.floor_divide(halo_id, ORPHAN_ID_OFFSET)
     return num_snaps
 
 
@@ -35,12 +56,12 @@ def calculate_last_surviving_id(halo_id):
         Equals the input `halo_id` if and only if the (sub)halo survives to z=0
 
     """
-    num_snaps_since_merge = get_num_snaps_since_orphan_merge(halo_id)
-    last_surviving_id = halo_id - num_snaps_since_merge * int(1e15)
+    halo_id = np.asarray(halo_id).astype(np.int64)
+    last_surviving_id = np.remainder(halo_id, ORPHAN_ID_OFFSET)
     return last_surviving_id
 
 
-def crossmatch(x, y, skip_bounds_checking=False):
+def crossmatch(x, y, skip_bounds_checking=False, strategy="auto"):
     """
     Finds where the elements of ``x`` appear in the array ``y``, including repeats.
 
@@ -54,8 +75,10 @@ def crossmatch(x, y, skip_bounds_checking=False):
     x : integer array
         Array of integers with possibly repeated entries.
 
-    y : integer array
-        Array of unique integers.
+    y : integer array or CrossmatchIndex
+        Array of unique integers, or a `CrossmatchIndex` prebuilt from
+        such an array, which avoids rebuilding the index of ``y``
+        when matching many arrays against the same ``y``.
 
     skip_bounds_checking : bool, optional
         The first step in the `crossmatch` function is to test that the input
@@ -66,11 +89,26 @@ def crossmatch(x, y, skip_bounds_checking=False):
         this testing is bypassed and the function evaluates faster.
         Default is False.
 
+    strategy : string, optional
+        Algorithm used to find the matches. Options are:
+
+        - ``lookup`` : direct-address table indexed by ``y - y.min()``,
+          requiring memory proportional to the range of values in ``y``
+        - ``sorted`` : binary search in ``y``, which must be sorted
+        - ``hash`` : hash table of the values in ``y``
+        - ``sort`` : binary search in a sorted copy of ``y``
+
+        Default is ``auto``, which selects ``lookup`` when the range of values
+        in ``y`` is at most a few times larger than the length of ``y``,
+        otherwise ``sorted`` when ``y`` is already sorted, otherwise ``hash``.
+        All strategies return identical results.
+        Ignored when ``y`` is a `CrossmatchIndex`.
+
     Returns
     -------
     idx_x : integer array
         Integer array used to apply a mask to x
-        such that x[idx_x] = y[idx_y]
+        such that x[idx_x] = y[idx_y]. Sorted in ascending order.
 
     y_idx : integer array
         Integer array used to apply a mask to y
@@ -79,52 +117,545 @@ def crossmatch(x, y, skip_bounds_checking=False):
     """
     # Ensure inputs are Numpy arrays
     x = np.atleast_1d(x)
-    y = np.atleast_1d(y)
+    if not isinstance(y, CrossmatchIndex):
+        y = CrossmatchIndex(y, strategy, skip_bounds_checking)
 
     # Require that the inputs meet the assumptions of the algorithm
-    if skip_bounds_checking is True:
-        pass
+    if skip_bounds_checking is not True:
+        _check_crossmatch_x(x)
+
+    row_of_match = y.row_of_match(x, skip_bounds_checking=True)
+    idx_x = np.flatnonzero(row_of_match >= 0)
+    return idx_x, row_of_match[idx_x]
+
+
+class CrossmatchIndex:
+    """Index of an array of unique integer IDs, built once and reused to find
+    where the elements of many other arrays appear in the indexed array.
+
+    Parameters
+    ----------
+    y : integer array
+        Array of unique integers, e.g., the ``halo_id`` column of a mock
+
+    strategy : string, optional
+        Algorithm used to index ``y``. See `crossmatch`. Default is ``auto``.
+
+    skip_bounds_checking : bool, optional
+        If True, do not test whether ``y`` is a 1d sequence of unique integers.
+        Default is False.
+
+    Notes
+    -----
+    Instances can be pickled, e.g., to send them to the workers of a
+    multiprocessing pool. An index written to disk with the `save` method
+    can instead be memory-mapped by each worker with `CrossmatchIndex.load`;
+    pickling a memory-mapped index only sends the name of its directory.
+
+    Examples
+    --------
+    >>> halo_id = np.random.permutation(np.arange(1000))
+    >>> index = CrossmatchIndex(halo_id)
+    >>> upid = np.random.randint(-1, 2000, 500)
+    >>> idx_upid, idx_halo_id = index.crossmatch(upid)
+    >>> host_row = index.row_of_match(upid)
+    """
+
+    def __init__(self, y, strategy="auto", skip_bounds_checking=False):
+        y = np.atleast_1d(y)
+        check_unique = skip_bounds_checking is not True
+        if check_unique:
+            _check_crossmatch_y(y)
+        y = np.asarray(y).astype(np.int64, copy=False)
+
+        options = ("auto",) + tuple(_CROSSMATCH_INDEX_ARRAY_NAMES)
+        if strategy not in options:
+            msg = "Input strategy = ``{0}`` must be one of {1}"
+            raise ValueError(msg.format(strategy, options))
+
+        if len(y) == 0:
+            if check_unique & (strategy == "sorted"):
+                _check_sorted_unique(y)
+            strategy = "sort"
+        elif strategy == "auto":
+            strategy = _select_crossmatch_strategy(y)
+
+        self.strategy = strategy
+        self.num_ids = len(y)
+        self.dirname = None
+        self.ymin = int(y.min()) if len(y) > 0 else 0
+
+        if strategy == "lookup":
+            span = int(y.max()) - self.ymin + 1
+            self._arrays = dict(
+                lookup_table=_build_lookup_table(y, self.ymin, span, check_unique)
+            )
+        elif strategy == "sorted":
+            if check_unique:
+                _check_sorted_unique(y)
+            self._arrays = dict(y_sorted=y)
+        elif strategy == "hash":
+            slot_keys, slot_rows = _build_hash_table(y, check_unique)
+            self._arrays = dict(slot_keys=slot_keys, slot_rows=slot_rows)
+        elif strategy == "sort":
+            idx_y_sorted = np.argsort(y)
+            y_sorted = y[idx_y_sorted]
+            if check_unique and np.any(y_sorted[1:] == y_sorted[:-1]):
+                msg = "Input array y must be a 1d sequence of unique integers"
+                raise ValueError(msg)
+            self._arrays = dict(y_sorted=y_sorted, idx_y_sorted=idx_y_sorted)
+
+    def __len__(self):
+        return self.num_ids
+
+    def row_of_match(self, x, skip_bounds_checking=False):
+        """For every element of ``x``, find the row of the matching element
+        of the indexed array
+
+        Parameters
+        ----------
+        x : integer array
+            Array of integers with possibly repeated entries
+
+        skip_bounds_checking : bool, optional
+            If True, do not test whether ``x`` is a 1d sequence of integers.
+            Default is False.
+
+        Returns
+        -------
+        row_of_match : ndarray of shape (n, )
+            Integer array storing the row of the indexed array matching each
+            element of ``x``, or -1 for elements of ``x`` with no match
+        """
+        x = np.atleast_1d(x)
+        if skip_bounds_checking is not True:
+            _check_crossmatch_x(x)
+        x = np.asarray(x).astype(np.int64, copy=False)
+
+        if (len(x) == 0) | (self.num_ids == 0):
+            return np.full(len(x), -1, dtype=np.int64)
+        elif self.strategy == "lookup":
+            table = self._arrays["lookup_table"]
+            return _row_of_match_in_lookup_table(table, self.ymin, x)
+        elif self.strategy == "sorted":
+            return _row_of_match_in_sorted(self._arrays["y_sorted"], None, x)
+        elif self.strategy == "hash":
+            slot_keys, slot_rows = self._arrays["slot_keys"], self._arrays["slot_rows"]
+            return _row_of_match_in_hash_table(slot_keys, slot_rows, x)
+        else:
+            y_sorted = self._arrays["y_sorted"]
+            return _row_of_match_in_sorted(y_sorted, self._arrays["idx_y_sorted"], x)
+
+    def crossmatch(self, x, skip_bounds_checking=False):
+        """Equivalent to ``crossmatch(x, y)`` for the indexed array ``y``
+
+        Returns
+        -------
+        idx_x : integer array
+            Integer array such that x[idx_x] = y[idx_y]. Sorted in ascending order.
+
+        y_idx : integer array
+            Integer array such that x[idx_x] = y[idx_y]
+        """
+        return crossmatch(x, self, skip_bounds_checking)
+
+    def save(self, dirname):
+        """Write the index to disk so that it can be memory-mapped with `load`
+
+        Parameters
+        ----------
+        dirname : string
+            Directory that will store one memmap column per array of the index
+        """
+        os.makedirs(dirname, exist_ok=True)
+        for name, arr in self._arrays.items():
+            write_column_to_memmap(arr, dirname, name)
+
+        info_fname = os.path.join(dirname, CROSSMATCH_INDEX_INFO_BASENAME)
+        with open(info_fname, "w") as f:
+            f.write("strategy " + self.strategy + "\n")
+            f.write("num_ids " + str(self.num_ids) + "\n")
+            f.write("ymin " + str(self.ymin) + "\n")
+
+    @classmethod
+    def load(cls, dirname, mode="r"):
+        """Memory-map an index written to disk with the `save` method
+
+        Parameters
+        ----------
+        dirname : string
+            Directory passed to `save`
+
+        mode : string, optional
+            Mode of the memory maps. Default is ``r``.
+
+        Returns
+        -------
+        index : CrossmatchIndex
+        """
+        info = dict()
+        with open(os.path.join(dirname, CROSSMATCH_INDEX_INFO_BASENAME), "r") as f:
+            for raw_line in f:
+                key, val = raw_line.strip().split()
+                info[key] = val
+
+        index = cls.__new__(cls)
+        index.strategy = info["strategy"]
+        index.num_ids = int(info["num_ids"])
+        index.ymin = int(info["ymin"])
+        index.dirname = dirname
+        index._arrays = dict()
+        for name in _CROSSMATCH_INDEX_ARRAY_NAMES[index.strategy]:
+            memmap_fname = os.path.join(dirname, name, name + ".memmap")
+            shape_fname = os.path.join(dirname, name, name + "_shape_and_dtype.txt")
+            shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+            if shape[0] == 0:
+                index._arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                index._arrays[name] = np.memmap(
+                    memmap_fname, shape=shape, dtype=dtype, mode=mode
+                )
+        return index
+
+    def __getstate__(self):
+        if self.dirname is None:
+            return self.__dict__
+        else:
+            return dict(dirname=self.dirname)
+
+    def __setstate__(self, state):
+        if "_arrays" in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(CrossmatchIndex.load(state["dirname"]).__dict__)
+
+
+def crossmatch_parallel(
+    x, y, num_workers=None, skip_bounds_checking=False, strategy="auto", seed=43
+):
+    """Multithreaded equivalent of `crossmatch`.
+
+    Both ``x`` and ``y`` are partitioned into ranges of ID values
+    delimited by splitters drawn from a random sample of ``y``,
+    and the partitions are crossmatched concurrently in a thread pool.
+    When ``y`` is compact enough for the ``lookup`` strategy,
+    a single lookup table is built instead and queried by chunks of ``x``.
+    Numpy releases the GIL in the sorting, searching and indexing kernels
+    that dominate the runtime of each partition.
+
+    Parameters
+    ----------
+    x : integer array
+        Array of integers with possibly repeated entries.
+
+    y : integer array
+        Array of unique integers.
+
+    num_workers : int, optional
+        Number of threads. Default is the number of CPUs.
+
+    skip_bounds_checking : bool, optional
+        See `crossmatch`. Default is False.
+
+    strategy : string, optional
+        Strategy used to crossmatch each partition. See `crossmatch`.
+        Default is ``auto``.
+
+    seed : int, optional
+        Random seed used to sample the splitters. Results do not depend on
+        the seed, only the balance of the partitions does.
+
+    Returns
+    -------
+    idx_x : integer array
+        Integer array used to apply a mask to x
+        such that x[idx_x] = y[idx_y]. Identical to the output of `crossmatch`.
+
+    y_idx : integer array
+        Integer array used to apply a mask to y
+        such that x[idx_x] = y[idx_y]. Identical to the output of `crossmatch`.
+
+    """
+    x = np.atleast_1d(x)
+    y = np.atleast_1d(y)
+    if skip_bounds_checking is not True:
+        _check_crossmatch_y(y)
+        _check_crossmatch_x(x)
+    x = np.asarray(x).astype(np.int64, copy=False)
+    y = np.asarray(y).astype(np.int64, copy=False)
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_partitions = min(
+        _PARTITIONS_PER_WORKER * num_workers, len(y) // 2 + 1, _MAX_NUM_PARTITIONS
+    )
+    if (num_workers == 1) | (num_partitions <= 1):
+        return crossmatch(x, y, skip_bounds_checking, strategy)
+
+    if strategy == "auto":
+        strategy = _select_crossmatch_strategy(y)
+    if strategy == "lookup":
+        # A single lookup table is built quickly, and the lookups are
+        # distributed over chunks of x without partitioning the IDs
+        index = CrossmatchIndex(y, strategy, skip_bounds_checking)
+        row_of_match = np.empty(len(x), dtype=np.int64)
+        edges = np.linspace(0, len(x), num_workers + 1).astype(np.int64)
+
+        def lookup_chunk(ichunk):
+            a, b = edges[ichunk], edges[ichunk + 1]
+            row_of_match[a:b] = index.row_of_match(x[a:b], skip_bounds_checking=True)
+
+        with ThreadPoolExecutor(num_workers) as executor:
+            list(executor.map(lookup_chunk, range(num_workers)))
+        idx_x = np.flatnonzero(row_of_match >= 0)
+        return idx_x, row_of_match[idx_x]
+
+    # Draw the splitters as quantiles of a random sample of y
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(y), _SPLITTER_SAMPLES_PER_PARTITION * num_partitions)
+    sample = np.sort(y[rng.integers(0, len(y), sample_size)])
+    quantiles = np.linspace(0, 1, num_partitions + 1)[1:-1]
+    splitters = np.unique(sample[(quantiles * (sample_size - 1)).astype(int)])
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        x_partition_rows = _partition_rows(x, splitters, executor, num_workers)
+        y_partition_rows = _partition_rows(y, splitters, executor, num_workers)
+
+        row_of_match = np.full(len(x), -1, dtype=np.int64)
+
+        def crossmatch_partition(ipart):
+            x_rows = x_partition_rows[ipart]
+            y_rows = y_partition_rows[ipart]
+            if (len(x_rows) == 0) | (len(y_rows) == 0):
+                return
+            index = CrossmatchIndex(y[y_rows], strategy, skip_bounds_checking)
+            local_row = index.row_of_match(x[x_rows], skip_bounds_checking=True)
+            has_match = local_row >= 0
+            # Each partition writes to a disjoint set of rows of x
+            row_of_match[x_rows[has_match]] = y_rows[local_row[has_match]]
+
+        # Crossmatch the largest partitions first to balance the threads
+        num_rows = [len(a) + len(b) for a, b in zip(x_partition_rows, y_partition_rows)]
+        order = np.argsort(num_rows)[::-1]
+        list(executor.map(crossmatch_partition, order))
+
+    idx_x = np.flatnonzero(row_of_match >= 0)
+    return idx_x, row_of_match[idx_x]
+
+
+_PARTITIONS_PER_WORKER = 4
+_SPLITTER_SAMPLES_PER_PARTITION = 256
+_MAX_NUM_PARTITIONS = np.iinfo(np.uint16).max
+
+
+def _partition_rows(arr, splitters, executor, num_chunks):
+    """Group the rows of ``arr`` by the range of values delimited by ``splitters``
+
+    Returns
+    -------
+    partition_rows : list of ndarrays
+        Element i stores the rows of ``arr`` with values in partition i,
+        in ascending order
+    """
+    labels = np.empty(len(arr), dtype=np.uint16)
+    edges = np.linspace(0, len(arr), num_chunks + 1).astype(np.int64)
+
+    def label_chunk(ichunk):
+        a, b = edges[ichunk], edges[ichunk + 1]
+        labels[a:b] = np.searchsorted(splitters, arr[a:b], side="right")
+
+    list(executor.map(label_chunk, range(num_chunks)))
+
+    # Stable sort of small integer labels is a linear-time radix sort
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=len(splitters) + 1)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return list(order[a:b] for a, b in zip(offsets[:-1], offsets[1:]))
+
+
+def _check_crossmatch_y(y):
+    try:
+        assert np.shape(y) == (len(y),)
+        assert _is_integer_valued(y)
+    except (AssertionError, ValueError, TypeError):
+        msg = "Input array y must be a 1d sequence of unique integers"
+        raise ValueError(msg)
+
+
+def _check_crossmatch_x(x):
+    try:
+        assert np.shape(x) == (len(x),)
+        assert _is_integer_valued(x)
+    except (AssertionError, ValueError, TypeError):
+        msg = "Input array x must be a 1d sequence of integers"
+        raise ValueError(msg)
+
+
+def _is_integer_valued(arr):
+    """Private function returning True if every element of the input array
+    has an integer value, without a Python-level loop over the array
+    """
+    if np.issubdtype(arr.dtype, np.integer):
+        return True
+    return bool(np.all(np.array(arr, dtype=np.int64) == arr))
+
+
+_LOOKUP_TABLE_MAX_SPAN_FACTOR = 4
+
+
+def _select_crossmatch_strategy(y):
+    """Choose the fastest crossmatch strategy for the input ``y``"""
+    span = int(y.max()) - int(y.min()) + 1
+    if span <= _LOOKUP_TABLE_MAX_SPAN_FACTOR * len(y):
+        return "lookup"
+    elif np.all(y[1:] > y[:-1]):
+        return "sorted"
     else:
-        try:
-            assert len(set(y)) == len(y)
-            assert np.all(np.array(y, dtype=np.int64) == y)
-            assert np.shape(y) == (len(y),)
-        except (AssertionError, ValueError, TypeError):
+        return "hash"
+
+
+def _check_sorted_unique(y):
+    if not np.all(y[1:] > y[:-1]):
+        msg = (
+            "Input array y must be a 1d sequence of unique integers "
+            "sorted in ascending order"
+        )
+        raise ValueError(msg)
+
+
+def _build_lookup_table(y, ymin, span, check_unique=True):
+    """Direct-address table storing the row of each value of ``y``
+    at position ``y - ymin``, and -1 at every other position
+    """
+    table = np.full(span, -1, dtype=np.int64)
+    table[y - ymin] = np.arange(len(y))
+    if check_unique and np.count_nonzero(table >= 0) != len(y):
+        msg = "Input array y must be a 1d sequence of unique integers"
+        raise ValueError(msg)
+    return table
+
+
+def _row_of_match_in_lookup_table(table, ymin, x):
+    row_of_match = np.full(len(x), -1, dtype=np.int64)
+    offset = x - ymin
+    in_range = np.flatnonzero((offset >= 0) & (offset < len(table)))
+    row_of_match[in_range] = table[offset[in_range]]
+    return row_of_match
+
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hash_slots(keys, num_bits):
+    """Fibonacci hashing of int64 keys into a table with 2**num_bits slots"""
+    h = keys.view(np.uint64) * _HASH_MULTIPLIER
+    return (h >> np.uint64(64 - num_bits)).astype(np.int64)
+
+
+def _build_hash_table(y, check_unique=True):
+    """Open-addressing hash table with linear probing storing the row of each
+    value of ``y``. Insertion is vectorized over all keys that are still looking
+    for an empty slot, so that the number of Python-level iterations is set by
+    the longest probe sequence rather than by the number of keys.
+
+    Returns
+    -------
+    slot_keys : ndarray
+        Key stored in each slot of the table
+
+    slot_rows : ndarray
+        Row of ``y`` stored in each slot of the table, or -1 for empty slots
+    """
+    num_bits = max(int(np.ceil(np.log2(2 * len(y)))), 1)
+    mask = (1 << num_bits) - 1
+    slot_keys = np.zeros(1 << num_bits, dtype=np.int64)
+    slot_rows = np.full(1 << num_bits, -1, dtype=np.int64)
+
+    pending = np.arange(len(y))
+    slots = _hash_slots(y, num_bits)
+    while len(pending) > 0:
+        is_empty = slot_rows[slots] < 0
+        if check_unique and np.any(
+            slot_keys[slots[~is_empty]] == y[pending[~is_empty]]
+        ):
             msg = "Input array y must be a 1d sequence of unique integers"
             raise ValueError(msg)
-        try:
-            assert np.all(np.array(x, dtype=np.int64) == x)
-            assert np.shape(x) == (len(x),)
-        except (AssertionError, ValueError, TypeError):
-            msg = "Input array x must be a 1d sequence of integers"
-            raise ValueError(msg)
 
-    # Internally, we will work with sorted arrays, and then undo the sorting at the end
-    idx_x_sorted = np.argsort(x)
-    idx_y_sorted = np.argsort(y)
-    x_sorted = np.copy(x[idx_x_sorted])
-    y_sorted = np.copy(y[idx_y_sorted])
+        # Among keys competing for the same empty slot, one of them wins
+        candidates = pending[is_empty]
+        candidate_slots = slots[is_empty]
+        slot_rows[candidate_slots] = candidates
+        is_placed = np.zeros(len(pending), dtype=bool)
+        is_placed[is_empty] = slot_rows[candidate_slots] == candidates
+        slot_keys[slots[is_placed]] = y[pending[is_placed]]
 
-    # x may have repeated entries
-    # Address by finding the unique values as well as their multiplicity
-    unique_xvals, counts = np.unique(x_sorted, return_counts=True)
+        # Keys that lost the competition for an empty slot retry the same slot,
+        # where they will be compared against the winner
+        advance = ~is_placed & ~is_empty
+        slots[advance] = (slots[advance] + 1) & mask
+        pending = pending[~is_placed]
+        slots = slots[~is_placed]
 
-    # Determine which of the unique x values has a match in y
-    unique_xval_has_match = np.in1d(unique_xvals, y_sorted, assume_unique=True)
+    return slot_keys, slot_rows
 
-    # Create a boolean array with True for each value in x with a match, otherwise False
-    idx_x = np.repeat(unique_xval_has_match, counts)
 
-    # For each unique value of x with a match in y, identify the index of the match
-    matching_indices_in_y = np.searchsorted(
-        y_sorted, unique_xvals[unique_xval_has_match]
-    )
+def _row_of_match_in_hash_table(slot_keys, slot_rows, x):
+    num_bits = int(np.log2(len(slot_rows)))
+    mask = len(slot_rows) - 1
+    row_of_match = np.full(len(x), -1, dtype=np.int64)
+
+    active = np.arange(len(x))
+    slots = _hash_slots(x, num_bits)
+    while len(active) > 0:
+        rows = slot_rows[slots]
+        is_occupied = rows >= 0
+        is_match = is_occupied & (slot_keys[slots] == x[active])
+        row_of_match[active[is_match]] = rows[is_match]
+
+        # Keep probing until reaching the matching key or an empty slot
+        keep_probing = is_occupied & ~is_match
+        active = active[keep_probing]
+        slots = (slots[keep_probing] + 1) & mask
+
+    return row_of_match
+
+
+def _row_of_match_in_sorted(y_sorted, idx_y_sorted, x):
+    """For every element of ``x``, find the row of the matching element of ``y``,
+    where ``y_sorted = y[idx_y_sorted]`` has already been sorted.
+
+    Parameters
+    ----------
+    y_sorted : integer array
+        Array of unique integers sorted in ascending order
+
+    idx_y_sorted : integer array
+        Permutation that sorts the original ``y`` array,
+        or None if ``y`` was already sorted
 
-    # Repeat each matching index according to the multiplicity in x
-    idx_y = np.repeat(matching_indices_in_y, counts[unique_xval_has_match])
+    x : integer array
+        Array of integers with possibly repeated entries
 
-    # Undo the original sorting and return the result
-    return idx_x_sorted[idx_x], idx_y_sorted[idx_y]
+    Returns
+    -------
+    row_of_match : ndarray of shape (n, )
+        Integer array storing the row of ``y`` matching each element of ``x``,
+        or -1 for elements of ``x`` with no match in ``y``
+
+    """
+    x = np.atleast_1d(x)
+    row_of_match = np.full(x.shape[0], -1, dtype=np.int64)
+    if len(y_sorted) == 0:
+        return row_of_match
+
+    indx = np.searchsorted(y_sorted, x)
+    indx[indx == len(y_sorted)] = 0
+    has_match = y_sorted[indx] == x
+    if idx_y_sorted is None:
+        row_of_match[has_match] = indx[has_match]
+    else:
+        row_of_match[has_match] = idx_y_sorted[indx[has_match]]
+    return row_of_match
 
 
 def compute_richness(unique_halo_ids, halo_id_of_galaxies):
@@ -133,8 +664,9 @@ def compute_richness(unique_halo_ids, halo_id_of_galaxies):
 
     Parameters
     ----------
-    unique_halo_ids : ndarray
-        Numpy array of shape (num_halos, ) storing unique integers
+    unique_halo_ids : ndarray or CrossmatchIndex
+        Numpy array of shape (num_halos, ) storing unique integers,
+        or a `CrossmatchIndex` prebuilt from such an array
 
     halo_id_of_galaxies : ndarray
         Numpy integer array of shape (num_galaxies, ) storing the host ID of each galaxy
@@ -152,11 +684,90 @@ def compute_richness(unique_halo_ids, halo_id_of_galaxies):
     >>> halo_id_of_galaxies = np.random.randint(0, 5000, num_sats)
     >>> richness = compute_richness(unique_halo_ids, halo_id_of_galaxies)
     """
-    unique_halo_ids = np.atleast_1d(unique_halo_ids).astype(int)
+    if not isinstance(unique_halo_ids, CrossmatchIndex):
+        unique_halo_ids = CrossmatchIndex(np.atleast_1d(unique_halo_ids).astype(int))
     halo_id_of_galaxies = np.atleast_1d(halo_id_of_galaxies).astype(int)
-    richness_result = np.zeros_like(unique_halo_ids).astype(int)
 
-    vals, counts = np.unique(halo_id_of_galaxies, return_counts=True)
-    idxA, idxB = crossmatch(vals, unique_halo_ids)
-    richness_result[idxB] = counts[idxA]
-    return richness_result
+    #  Histogram of the host row of each galaxy, so no sort of the galaxies is needed
+    host_row = unique_halo_ids.row_of_match(halo_id_of_galaxies)
+    host_row = host_row[host_row >= 0]
+    return np.bincount(host_row, minlength=len(unique_halo_ids)).astype(int)
+
+
+def compute_cumulative_richness(
+    unique_halo_ids, halo_id_of_galaxies, galaxy_property, thresholds
+):
+    r"""For every ID in unique_halo_ids and every threshold,
+    calculate the number of galaxies of the halo with galaxy_property >= threshold.
+
+    Equivalent to calling `compute_richness` once per threshold after masking
+    the galaxies, but the galaxies are only matched to their hosts once,
+    so the cost scales with the number of galaxies rather than
+    the number of galaxies times the number of thresholds.
+
+    Parameters
+    ----------
+    unique_halo_ids : ndarray or CrossmatchIndex
+        Numpy array of shape (num_halos, ) storing unique integers,
+        or a `CrossmatchIndex` prebuilt from such an array
+
+    halo_id_of_galaxies : ndarray
+        Numpy integer array of shape (num_galaxies, ) storing the host ID of each galaxy
+
+    galaxy_property : ndarray
+        Numpy array of shape (num_galaxies, ) storing the property
+        used to select galaxies, e.g., ``obs_sm``. NaN values are never counted.
+
+    thresholds : ndarray
+        Numpy array of shape (num_thresholds, ) storing the thresholds
+        on galaxy_property. Need not be sorted.
+
+    Returns
+    -------
+    richness : ndarray
+        Numpy integer array of shape (num_halos, num_thresholds) storing
+        the number of galaxies of each host halo above each threshold
+
+    Examples
+    --------
+    >>> num_hosts = 100
+    >>> num_sats = int(1e5)
+    >>> unique_halo_ids = np.arange(5, num_hosts + 5)
+    >>> halo_id_of_galaxies = np.random.randint(0, 5000, num_sats)
+    >>> obs_sm = 10 ** np.random.uniform(8, 12, num_sats)
+    >>> thresholds = 10 ** np.arange(9, 11.5, 0.5)
+    >>> richness = compute_cumulative_richness(
+    ...     unique_halo_ids, halo_id_of_galaxies, obs_sm, thresholds)
+    """
+    if not isinstance(unique_halo_ids, CrossmatchIndex):
+        unique_halo_ids = CrossmatchIndex(np.atleast_1d(unique_halo_ids).astype(int))
+    halo_id_of_galaxies = np.atleast_1d(halo_id_of_galaxies).astype(int)
+    galaxy_property = np.atleast_1d(galaxy_property)
+    thresholds = np.atleast_1d(thresholds)
+
+    msg = "halo_id_of_galaxies and galaxy_property must have the same length"
+    assert len(halo_id_of_galaxies) == len(galaxy_property), msg
+    msg = "thresholds must be a 1d array of non-NaN values"
+    assert (thresholds.ndim == 1) & np.all(~np.isnan(thresholds)), msg
+
+    num_halos, num_thresholds = len(unique_halo_ids), len(thresholds)
+    idx_thresholds_sorted = np.argsort(thresholds, kind="stable")
+    thresholds_sorted = thresholds[idx_thresholds_sorted]
+
+    host_row = unique_halo_ids.row_of_match(halo_id_of_galaxies)
+    keep = (host_row >= 0) & ~np.isnan(galaxy_property)
+    host_row, galaxy_property = host_row[keep], galaxy_property[keep]
+
+    #  Number of sorted thresholds at or below the property of each galaxy
+    threshold_bin = np.searchsorted(thresholds_sorted, galaxy_property, side="right")
+
+    #  2d histogram of galaxies in (host, threshold bin), then reverse cumulative sum
+    num_bins = num_thresholds + 1
+    counts = np.bincount(
+        host_row * num_bins + threshold_bin, minlength=num_halos * num_bins
+    ).reshape((num_halos, num_bins))
+    cumulative_counts = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+
+    richness = np.empty((num_halos, num_thresholds), dtype=int)
+    richness[:, idx_thresholds_sorted] = cumulative_counts[:, 1:]
+    return richness
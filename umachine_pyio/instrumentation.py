@@ -0,0 +1,194 @@
+""" Module storing the IOStats class used to record where the time goes
+in the ingest, memmap and load paths of the package:
+wall time, bytes read and written, rows processed and files opened per stage,
+along with the peak resident set size of the process.
+Functions accepting a ``stats`` argument record nothing when it is None.
+"""
+import json
+import sys
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+try:
+    import resource
+
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+__all__ = ("IOStats", "JsonLinesProgressLog", "peak_rss_bytes")
+
+_COUNTER_NAMES = ("bytes_read", "bytes_written", "rows", "files_opened")
+
+
+class IOStats:
+    """Accumulator of per-stage statistics
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Function called as ``callback(stage_name, record)`` each time a stage
+        completes, where record is the dictionary of statistics of that
+        single call of the stage
+
+    Examples
+    --------
+    >>> stats = IOStats()
+    >>> mock = load_mock_from_binaries(subvolumes, root_dirname, stats=stats)  # doctest: +SKIP
+    >>> stats.as_dict()["stages"]["memmap_read"]["bytes_read"]  # doctest: +SKIP
+
+    Notes
+    -----
+    Stages may be nested, e.g., ``memmap_write`` happens within
+    ``write_ascii_to_memmap_tree``, and some of the runtime is spent
+    outside of any stage, so the times of all stages do not add up
+    to the total runtime.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stage(self, name, **counters):
+        """Context manager timing one call of the named stage
+
+        Parameters
+        ----------
+        name : string
+
+        **counters : int, optional
+            Initial values of ``bytes_read``, ``bytes_written``, ``rows``
+            or ``files_opened`` for this call. The returned record
+            may be updated within the context.
+
+        Returns
+        -------
+        context : context manager
+            Entering the context returns the dictionary of counters of the call
+        """
+        return _StageContext(self, name, counters)
+
+    def add(self, name, seconds=0.0, **counters):
+        """Add the statistics of one call of the named stage. Thread-safe."""
+        with self._lock:
+            record = self.stages.setdefault(name, _empty_record())
+            record["calls"] += 1
+            record["seconds"] += seconds
+            for key, val in counters.items():
+                record[key] += val
+
+        if self.callback is not None:
+            self.callback(name, dict(seconds=seconds, **counters))
+
+    def reset(self):
+        """Discard all statistics recorded so far"""
+        with self._lock:
+            self.stages = OrderedDict()
+
+    def as_dict(self):
+        """Statistics of every stage, along with the peak RSS of the process"""
+        with self._lock:
+            stages = OrderedDict((k, dict(v)) for k, v in self.stages.items())
+        return dict(stages=stages, peak_rss_bytes=peak_rss_bytes())
+
+    def __bool__(self):
+        return True
+
+
+class NullStats:
+    """Statistics accumulator that records nothing, used when ``stats=None``"""
+
+    def stage(self, name, **counters):
+        return _NULL_STAGE_CONTEXT
+
+    def add(self, name, seconds=0.0, **counters):
+        pass
+
+    def __bool__(self):
+        return False
+
+
+class JsonLinesProgressLog:
+    """Structured progress log writing one JSON object per line
+
+    Parameters
+    ----------
+    fname : string
+        Name of the output file. Lines are appended to an existing file.
+
+    Examples
+    --------
+    >>> with JsonLinesProgressLog("progress.jsonl") as log:  # doctest: +SKIP
+    ...     log.write("subvolume_done", subvol=3, seconds=1.2)
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._fileobj = open(fname, "a")
+
+    def write(self, event, **fields):
+        """Write a line storing the event name, a timestamp and the input fields"""
+        record = OrderedDict(event=event, time=perf_counter())
+        record.update(fields)
+        self._fileobj.write(json.dumps(record) + "\n")
+        self._fileobj.flush()
+
+    def close(self):
+        self._fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the process in bytes,
+    or None on platforms without the ``resource`` module
+    """
+    if not HAS_RESOURCE:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #  ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def get_stats(stats):
+    """Return the input stats, or the shared `NullStats` if stats is None"""
+    return NULL_STATS if stats is None else stats
+
+
+class _StageContext:
+    def __init__(self, stats, name, counters):
+        self.stats = stats
+        self.name = name
+        self.counters = dict((key, 0) for key in _COUNTER_NAMES)
+        self.counters.update(counters)
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self.counters
+
+    def __exit__(self, *exc):
+        self.stats.add(self.name, perf_counter() - self._start, **self.counters)
+
+
+class _NullStageContext:
+    def __enter__(self):
+        return dict.fromkeys(_COUNTER_NAMES, 0)
+
+    def __exit__(self, *exc):
+        pass
+
+
+def _empty_record():
+    record = dict(calls=0, seconds=0.0)
+    record.update((key, 0) for key in _COUNTER_NAMES)
+    return record
+
+
+NULL_STATS = NullStats()
+_NULL_STAGE_CONTEXT = _NullStageContext()
@@ -8,10 +8,13 @@ import numpy as np
 from astropy.table import Table
 
 from .directory_tree_utils import memmap_fname_iterator, subvol_dirname_iterator
-from .index_utils import crossmatch
+from .index_utils import _row_of_match_in_sorted, crossmatch
+from .instrumentation import get_stats
 from .memmap_array_utils import (
     read_ndarray_from_memmap_sequence,
     read_shape_and_dtype_from_ascii,
+    read_trimmed_history_from_subvolumes,
+    trimmed_history_exists,
 )
 
 default_galprops = list(
@@ -37,10 +40,23 @@ default_galprops = list(
     )
 )
 
-__all__ = ("load_mock_from_binaries", "value_added_mock")
+__all__ = (
+    "load_mock_from_binaries",
+    "load_multisnap_mock_from_binaries",
+    "value_added_mock",
+    "compute_host_index",
+    "propagate_host_properties",
+)
 
 
-def load_mock_from_binaries(subvolumes, root_dirname, galprops=default_galprops):
+def load_mock_from_binaries(
+    subvolumes,
+    root_dirname,
+    galprops=default_galprops,
+    row_ranges=None,
+    stats=None,
+    row_selections=None,
+):
     """Load the mock catalog into memory.
 
     Parameters
@@ -61,24 +77,211 @@ def load_mock_from_binaries(subvolumes, root_dirname, galprops=default_galprops)
         subdirectory of each ``subvol_N`` where the Numpy binary of
         a galaxy property is stored.
 
+    row_ranges : sequence of tuples, optional
+        One ``(row_start, row_stop)`` tuple per element of ``subvolumes``
+        specifying the range of rows to load from that subvolume.
+        A subvolume may appear more than once with different row ranges.
+        An element equal to None loads all rows. Default is to load all rows.
+        See the `~umachine_pyio.partition_utils.partition_subvolumes` function.
+
+    stats : IOStats, optional
+        Records the memmap reads of each column and the ``host_row_conversion``
+        stage. See `~umachine_pyio.instrumentation.IOStats`.
+
+    row_selections : sequence, optional
+        One entry per element of ``subvolumes`` specifying which rows to load
+        from that subvolume: None, a slice, or an integer array of rows.
+        Cannot be combined with row_ranges. Default is to load all rows.
+
     Returns
     -------
     mock : Astropy Table
         Table of mock galaxies with the requested properties from the requested subvolumes.
     """
+    stats = get_stats(stats)
     galprops = np.array(list(set(np.atleast_1d(galprops))))
+    if row_selections is None:
+        row_selections = _row_selections_from_row_ranges(row_ranges)
+    else:
+        msg = "Cannot pass both row_ranges and row_selections"
+        assert row_ranges is None, msg
+        row_selections = list(row_selections)
 
     mock = Table()
     for galprop in galprops:
         fname_tuples = list(memmap_fname_iterator(root_dirname, galprop, *subvolumes))
         memmap_fnames = [t[0] for t in fname_tuples]
         shape_fnames = [t[1] for t in fname_tuples]
-        arr = read_ndarray_from_memmap_sequence(memmap_fnames, shape_fnames)
+        subvol_dirnames = list(subvol_dirname_iterator(root_dirname, *subvolumes))
+        if _is_trimmed_history(subvol_dirnames, shape_fnames, galprop):
+            arr = read_trimmed_history_from_subvolumes(
+                subvol_dirnames, galprop, row_selections
+            )
+        else:
+            arr = read_ndarray_from_memmap_sequence(
+                memmap_fnames, shape_fnames, row_selections, stats=stats
+            )
+        if galprop == "host_row":
+            with stats.stage("host_row_conversion", rows=len(arr)):
+                arr = _host_rows_to_loaded_rows(arr, shape_fnames, row_selections)
         mock[galprop] = arr
 
     return mock
 
 
+def _is_trimmed_history(subvol_dirnames, shape_fnames, galprop):
+    """Determine whether ``galprop`` is only stored as a trimmed history column,
+    see `~umachine_pyio.memmap_array_utils.write_trimmed_history_to_memmap`
+    """
+    if len(shape_fnames) == 0 or os.path.isfile(shape_fnames[0]):
+        return False
+    return trimmed_history_exists(subvol_dirnames[0], galprop)
+
+
+def _host_rows_to_loaded_rows(host_row, shape_fnames, row_selections):
+    """Convert the row of each host halo within its subvolume, as stored in the
+    ``host_row`` column, into the row of the host halo in the loaded catalog.
+    Hosts that were not loaded together with their satellites are set to -1.
+    """
+    if row_selections is None:
+        row_selections = [None] * len(shape_fnames)
+
+    loaded_row = np.full(len(host_row), -1, dtype=np.int64)
+    ifirst = 0
+    for shape_fname, rows in zip(shape_fnames, row_selections):
+        num_subvol_rows = read_shape_and_dtype_from_ascii(shape_fname)[0][0]
+        if rows is None:
+            ilast = ifirst + num_subvol_rows
+            subvol_host_row = host_row[ifirst:ilast]
+            has_host = subvol_host_row >= 0
+            loaded_row[ifirst:ilast][has_host] = subvol_host_row[has_host] + ifirst
+        else:
+            selected_rows = np.arange(num_subvol_rows)[rows]
+            ilast = ifirst + len(selected_rows)
+            position_of_row = np.full(num_subvol_rows + 1, -1, dtype=np.int64)
+            position_of_row[selected_rows] = np.arange(len(selected_rows))
+            # host_row = -1 indexes the trailing -1 of position_of_row
+            position = position_of_row[host_row[ifirst:ilast]]
+            has_host = position >= 0
+            loaded_row[ifirst:ilast][has_host] = position[has_host] + ifirst
+        ifirst = ilast
+    return loaded_row
+
+
+def _row_selections_from_row_ranges(row_ranges):
+    """Convert ``(row_start, row_stop)`` tuples into the row selections
+    accepted by `read_ndarray_from_memmap_sequence`
+    """
+    if row_ranges is None:
+        return None
+    return list(None if r is None else slice(*r) for r in row_ranges)
+
+
+def load_multisnap_mock_from_binaries(
+    subvolumes,
+    root_dirnames,
+    galprops=default_galprops,
+    id_key="halo_id",
+    suffixes=None,
+):
+    """Load the same subvolumes of several snapshots into a single catalog
+    whose rows are aligned by ID.
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence specifies which subvolumes will be used to load data
+        from every snapshot
+
+    root_dirnames : sequence of strings
+        Each string is the name of a snapshot directory such as ``a_1.002310``
+        storing subdirectories ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+        The first snapshot is the reference: the rows of the returned catalog
+        are the galaxies of the first snapshot.
+
+    galprops : sequence of strings, optional
+        List of galaxy properties to load from each snapshot
+
+    id_key : string, optional
+        Name of the column used to align rows across snapshots.
+        IDs must be unique within each snapshot. Default is ``halo_id``.
+
+    suffixes : sequence of strings, optional
+        Suffix appended to the column names of each snapshot.
+        Default is the basename of each root_dirname, e.g., ``a_1.002310``.
+
+    Returns
+    -------
+    mock : Astropy Table
+        Table with one row per galaxy of the reference snapshot.
+        Column ``id_key`` stores the reference IDs; every galaxy property
+        of each snapshot is stored in column ``<galprop>_<suffix>``,
+        and boolean column ``has_match_<suffix>`` is True for rows with a
+        matching ID in that snapshot. Properties of unmatched rows are zero.
+        Column ``host_row_<suffix>`` stores the row of the host halo in the
+        returned table, or -1 if the host has no row in the returned table.
+
+    Notes
+    -----
+    The reference IDs are sorted only once, and the IDs of every other snapshot
+    are located in the sorted reference by binary search,
+    so that the cost does not grow with the number of snapshot pairs.
+    """
+    root_dirnames = list(np.atleast_1d(root_dirnames))
+    if suffixes is None:
+        suffixes = [os.path.basename(os.path.normpath(d)) for d in root_dirnames]
+    msg = "Must have the same number of ``suffixes`` as ``root_dirnames``"
+    assert len(suffixes) == len(root_dirnames), msg
+
+    galprops = list(dict.fromkeys(list(np.atleast_1d(galprops)) + [id_key]))
+
+    ref_mock = load_mock_from_binaries(subvolumes, root_dirnames[0], galprops)
+    ref_ids = np.array(ref_mock[id_key])
+    idx_ref_sorted = np.argsort(ref_ids, kind="stable")
+    ref_ids_sorted = ref_ids[idx_ref_sorted]
+    if np.any(ref_ids_sorted[1:] == ref_ids_sorted[:-1]):
+        msg = "Column ``{0}`` of {1} must store unique IDs"
+        raise ValueError(msg.format(id_key, root_dirnames[0]))
+
+    num_gals = len(ref_ids)
+    mock = Table()
+    mock[id_key] = ref_ids
+    for isnap, (root_dirname, suffix) in enumerate(zip(root_dirnames, suffixes)):
+        if isnap == 0:
+            snap_mock = ref_mock
+            ref_rows = np.arange(num_gals)
+        else:
+            snap_mock = load_mock_from_binaries(subvolumes, root_dirname, galprops)
+            snap_ids = np.array(snap_mock[id_key])
+            ref_rows = _row_of_match_in_sorted(ref_ids_sorted, idx_ref_sorted, snap_ids)
+
+        has_match = np.zeros(num_gals, dtype=bool)
+        matched_snap_rows = np.flatnonzero(ref_rows >= 0)
+        ref_rows = ref_rows[matched_snap_rows]
+        has_match[ref_rows] = True
+        if np.count_nonzero(has_match) != len(ref_rows):
+            msg = "Column ``{0}`` of {1} must store unique IDs"
+            raise ValueError(msg.format(id_key, root_dirname))
+
+        #  Map the rows of the snapshot table onto the rows of the output,
+        #  with host_row = -1 indexing the trailing -1
+        output_row = np.full(len(snap_mock) + 1, -1, dtype=np.int64)
+        output_row[matched_snap_rows] = ref_rows
+
+        for galprop in galprops:
+            arr = snap_mock[galprop]
+            if galprop == "host_row":
+                aligned = np.full(num_gals, -1, dtype=np.int64)
+                aligned[ref_rows] = output_row[arr[matched_snap_rows]]
+            else:
+                aligned = np.zeros((num_gals, *arr.shape[1:]), dtype=arr.dtype)
+                aligned[ref_rows] = arr[matched_snap_rows]
+            mock[galprop + "_" + suffix] = aligned
+        mock["has_match_" + suffix] = has_match
+
+    return mock
+
+
 def subvol_id_and_ngals_generator(subvol_labels, root_dirname, shape_key="halo_id"):
     """Yield the subvolume ID and number of galaxies for each subvolume label"""
     for subvol_dirname in subvol_dirname_iterator(root_dirname, *subvol_labels):
@@ -133,7 +336,9 @@ def get_snapshot_times(root_dirname):
     return np.load(fname)
 
 
-def value_added_mock(mock, Lbox):
+def value_added_mock(
+    mock, Lbox, host_galprops=("rvir", "mvir"), host_index=None, return_host_index=False
+):
     """From an input mock that has been loaded into memory by the
     `load_mock_from_binaries` function, add some convenience columns
     and apply periodic boundary conditions.
@@ -146,38 +351,140 @@ def value_added_mock(mock, Lbox):
     Lbox : float
         Size of the simulation box - used to apply periodic boundary conditions
 
+    host_galprops : sequence of strings, optional
+        Galaxy properties to propagate from each host halo to its satellites.
+        For each property, column ``host_halo_<galprop>`` will be added.
+        Properties that do not appear in the mock are skipped.
+        Default is ``("rvir", "mvir")``.
+
+    host_index : ndarray of shape (n, ), optional
+        Output of `compute_host_index` for this mock, e.g., from a previous call
+        to `value_added_mock` with ``return_host_index=True``.
+        Default is to compute the host index by crossmatching
+        ``halo_hostid`` against ``halo_id``. If the mock stores the ``host_row``
+        column written by `~umachine_pyio.derived_columns.write_derived_columns`,
+        only the galaxies whose host was loaded from a different subvolume
+        are crossmatched.
+
+    return_host_index : bool, optional
+        If True, the host index is additionally returned so that
+        it can be reused. Default is False.
+
     Returns
     -------
     value_added_mock : Astropy Table
         Value-added mock catalog that contains ``halo_hostid`` column;
         the ``rvir`` will be rescaled by 1000 to be in Mpc units;
-        the ``host_halo_mvir`` and ``host_halo_rvir`` columns
+        the ``host_halo_<galprop>`` column of each of the ``host_galprops``
         will be calculated and added.
-    """
 
+    host_index : ndarray of shape (n, )
+        Returned only if ``return_host_index`` is True. See `compute_host_index`.
+
+    Notes
+    -----
+    The input mock is modified in place: positions are wrapped
+    and ``rvir`` is rescaled without allocating temporary copies of the columns.
+    """
     xyz_keylist = ["x", "y", "z"]
     mock_keylist = list(mock.keys())
     xyz_keys = [key for key in xyz_keylist if key in mock_keylist]
     for xyz_key in xyz_keys:
-        mock[xyz_key] = np.mod(mock[xyz_key], Lbox)
+        pos = mock[xyz_key]
+        np.mod(pos, Lbox, out=pos)
 
-    mock["halo_hostid"] = mock["halo_id"]
-    satmask = mock["upid"] != -1
-    mock["halo_hostid"][satmask] = mock["upid"][satmask]
+    if "halo_hostid" not in mock_keylist:
+        halo_hostid = np.where(mock["upid"] == -1, mock["halo_id"], mock["upid"])
+        _set_column(mock, "halo_hostid", halo_hostid)
 
-    idxA, idxB = crossmatch(mock["halo_hostid"], mock["halo_id"])
+    if host_index is None:
+        host_row = mock["host_row"] if "host_row" in mock_keylist else None
+        host_index = compute_host_index(mock["halo_hostid"], mock["halo_id"], host_row)
 
-    try:
-        mock["rvir"] = mock["rvir"] / 1000.0
-        mock["host_halo_rvir"] = mock["rvir"]
-        mock["host_halo_rvir"][idxA] = mock["rvir"][idxB]
-    except KeyError:
-        pass
+    if "rvir" in mock_keylist:
+        rvir = mock["rvir"]
+        np.divide(rvir, 1000.0, out=rvir)
 
-    try:
-        mock["host_halo_mvir"] = mock["mvir"]
-        mock["host_halo_mvir"][idxA] = mock["mvir"][idxB]
-    except KeyError:
-        pass
+    host_galprops = [key for key in np.atleast_1d(host_galprops) if key in mock_keylist]
+    propagate_host_properties(mock, host_galprops, host_index)
 
+    if return_host_index:
+        return mock, host_index
+    else:
+        return mock
+
+
+def compute_host_index(halo_hostid, halo_id, host_row=None):
+    """Calculate the row of the host halo of every galaxy
+
+    Parameters
+    ----------
+    halo_hostid : ndarray of shape (n, )
+        Integer array storing the ID of the host halo of each galaxy
+
+    halo_id : ndarray of shape (n, ) or CrossmatchIndex
+        Integer array storing the unique ID of each galaxy, or a
+        `~umachine_pyio.index_utils.CrossmatchIndex` prebuilt from this array
+
+    host_row : ndarray of shape (n, ), optional
+        Row of the host halo of each galaxy for the galaxies whose host row
+        is already known, and -1 otherwise, e.g., the ``host_row`` column
+        as loaded by `load_mock_from_binaries`.
+        Only the galaxies with -1 will be crossmatched.
+
+    Returns
+    -------
+    host_index : ndarray of shape (n, )
+        Integer array storing the row of the host halo of each galaxy.
+        Central galaxies, and satellites whose host halo does not appear
+        in the input catalog, store their own row.
+    """
+    host_index = np.arange(len(halo_id))
+    if host_row is None:
+        idxA, idxB = crossmatch(halo_hostid, halo_id)
+        host_index[idxA] = idxB
+    else:
+        host_row = np.asarray(host_row)
+        has_host_row = host_row >= 0
+        host_index[has_host_row] = host_row[has_host_row]
+        unresolved = np.flatnonzero(~has_host_row)
+        idxA, idxB = crossmatch(np.asarray(halo_hostid)[unresolved], halo_id)
+        host_index[unresolved[idxA]] = idxB
+    return host_index
+
+
+def propagate_host_properties(mock, galprops, host_index, prefix="host_halo_"):
+    """For each galaxy property, add a column storing the property of the host halo
+
+    Parameters
+    ----------
+    mock : Astropy Table
+        Mock catalog storing each of the input ``galprops``
+
+    galprops : sequence of strings
+        Names of the galaxy properties to propagate, e.g., ``("vmax", "sm", "x")``
+
+    host_index : ndarray of shape (n, )
+        Output of `compute_host_index`
+
+    prefix : string, optional
+        Prefix of the name of each new column. Default is ``host_halo_``.
+
+    Returns
+    -------
+    mock : Astropy Table
+        Input mock with a new column ``<prefix><galprop>`` for each galaxy property.
+        The mock is modified in place.
+    """
+    for galprop in np.atleast_1d(galprops):
+        host_prop = np.take(np.asarray(mock[galprop]), host_index, axis=0)
+        _set_column(mock, prefix + galprop, host_prop)
     return mock
+
+
+def _set_column(mock, colname, arr):
+    """Add or replace a column of the mock without copying the input array"""
+    if colname in mock.colnames:
+        mock.replace_column(colname, arr, copy=False)
+    else:
+        mock.add_column(arr, name=colname, copy=False)
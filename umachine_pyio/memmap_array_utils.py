@@ -5,8 +5,14 @@ to facilitate automated parallel I/O.
 import os
 import numpy as np
 
+from .instrumentation import get_stats
+from .memmap_cache import _cached_memmap, _cached_metadata, _invalidate_cached_file
 
-def write_ndarray_to_memmap(arr, output_fname):
+TRIMMED_START_SUFFIX = "_trimmed_start"
+TRIMMED_VALUES_SUFFIX = "_trimmed_values"
+
+
+def write_ndarray_to_memmap(arr, output_fname, stats=None):
     """Create a Numpy memmap of the input array, additionally storing the
     shape and dtype in an ASCII file with filename pattern ``*_shape_and_dtype``,
     facilitating calculation of binary offsets.
@@ -20,15 +26,25 @@ def write_ndarray_to_memmap(arr, output_fname):
 
     output_fname : string
         Filename of the memmap binary, including absolute path.
+
+    stats : IOStats, optional
+        Records the ``memmap_write`` and ``sidecar_write`` stages.
+        See `~umachine_pyio.instrumentation.IOStats`.
     """
-    mmp = np.memmap(output_fname, mode="w+", dtype=arr.dtype, shape=arr.shape)
-    mmp[:] = arr[:]
-    del mmp
+    stats = get_stats(stats)
+    _invalidate_cached_file(output_fname)
+    with stats.stage("memmap_write", bytes_written=arr.nbytes, files_opened=1):
+        mmp = np.memmap(output_fname, mode="w+", dtype=arr.dtype, shape=arr.shape)
+        mmp[:] = arr[:]
+        del mmp
 
     dirname = os.path.dirname(output_fname)
     basename = os.path.basename(dirname) + "_shape_and_dtype.txt"
     shape_and_dtype_output_fname = os.path.join(dirname, basename)
-    write_shape_and_dtype_to_ascii(shape_and_dtype_output_fname, arr.shape, arr.dtype)
+    with stats.stage("sidecar_write", files_opened=1):
+        write_shape_and_dtype_to_ascii(
+            shape_and_dtype_output_fname, arr.shape, arr.dtype
+        )
 
 
 def write_shape_and_dtype_to_ascii(output_fname, shape, dtype):
@@ -51,6 +67,7 @@ def write_shape_and_dtype_to_ascii(output_fname, shape, dtype):
     line1 = "shape " + " ".join(str(i) for i in shape) + "\n"
     line2 = "dtype " + _unique_numpy_dtype_string(dtype) + "\n"
 
+    _invalidate_cached_file(output_fname)
     with open(output_fname, "w") as f:
         f.write(line1)
         f.write(line2)
@@ -95,7 +112,14 @@ def read_shape_and_dtype_from_ascii(metadata_fname):
 
     The second row stores the Numpy data type. So your second row should look
     something like, ``dtype f4`` or ``dtype i8``.
+
+    Parsed files are cached until they are modified,
+    see `~umachine_pyio.memmap_cache.MemmapCache`.
     """
+    return _cached_metadata(metadata_fname, _parse_shape_and_dtype_file)[0]
+
+
+def _parse_shape_and_dtype_file(metadata_fname):
     with open(metadata_fname, "r") as f:
         line1 = next(f).strip().split()
         line2 = next(f).strip().split()
@@ -104,7 +128,7 @@ def read_shape_and_dtype_from_ascii(metadata_fname):
     return shape, dtype
 
 
-def write_structured_array_to_memmap(arr, parent_dirname, *columns_to_save):
+def write_structured_array_to_memmap(arr, parent_dirname, *columns_to_save, stats=None):
     """Function saves a memory map of the desired columns of a structured array
     according to the standard directory tree layout.
 
@@ -122,6 +146,9 @@ def write_structured_array_to_memmap(arr, parent_dirname, *columns_to_save):
         List of column names that will be memory-mapped to disk.
         If no argument is passed, default behavior is to store all columns.
 
+    stats : IOStats, optional
+        See `~umachine_pyio.instrumentation.IOStats`
+
     Notes
     -----
     For each memory-mapped column, an ASCII file serving as metadata
@@ -142,15 +169,288 @@ def write_structured_array_to_memmap(arr, parent_dirname, *columns_to_save):
     for colname in columns_to_save:
         msg = "Column name ``{0}`` does not appear in input array".format(colname)
         assert colname in dt.names, msg
+        write_column_to_memmap(arr[colname], parent_dirname, colname, stats=stats)
+
+
+def write_column_to_memmap(arr, parent_dirname, colname, stats=None):
+    """Function saves a memory map of the input ndarray as column ``colname``
+    according to the standard directory tree layout.
+
+    Parameters
+    ----------
+    arr : ndarray
+        Numpy array
+
+    parent_dirname : string
+        Root directory where the data will be stored.
+
+        Typically this is of the form 'some/path/subvol_0_1_2'.
+
+    colname : string
+        Name of the column. The memmap will be stored in
+        ``parent_dirname/colname/colname.memmap``
+
+    stats : IOStats, optional
+        See `~umachine_pyio.instrumentation.IOStats`
+    """
+    output_dirname = os.path.join(parent_dirname, colname)
+    try:
+        os.makedirs(output_dirname)
+    except OSError:
+        pass
+
+    output_fname = os.path.join(output_dirname, colname + ".memmap")
+    write_ndarray_to_memmap(arr, output_fname, stats=stats)
+
+
+def trim_history(history):
+    """Encode a history column by dropping the leading zeros of each row
+
+    Parameters
+    ----------
+    history : ndarray of shape (n, num_scales)
+        History of each galaxy, e.g., ``sfr_history_main_prog``
+
+    Returns
+    -------
+    start : ndarray of shape (n, )
+        Index of the first non-zero scale of each row,
+        or num_scales for rows that are zero at every scale
+
+    values : ndarray of shape (num_values, )
+        Concatenation of ``history[i, start[i]:]`` over all rows
+    """
+    history = np.asarray(history)
+    msg = "Input history must be a 2d array"
+    assert history.ndim == 2, msg
+    num_scales = history.shape[1]
+
+    is_nonzero = history != 0
+    start = np.where(is_nonzero.any(axis=1), is_nonzero.argmax(axis=1), num_scales)
+    start = start.astype(np.min_scalar_type(num_scales))
+    values = history[_trimmed_mask(start, num_scales)]
+    return start, values
+
+
+def untrim_history(start, values, num_scales, out=None):
+    """Reconstruct the dense history column encoded by `trim_history`
+
+    Parameters
+    ----------
+    start : ndarray of shape (n, )
+
+    values : ndarray of shape (num_values, )
+
+    num_scales : int
+
+    out : ndarray of shape (n, num_scales), optional
+        Preallocated array that will store the result, e.g., a view of
+        shared memory. Default is to allocate a new array.
+
+    Returns
+    -------
+    history : ndarray of shape (n, num_scales)
+    """
+    start = np.asarray(start).astype(np.int64)
+    shape = (len(start), num_scales)
+    if out is None:
+        history = np.zeros(shape, dtype=np.asarray(values).dtype)
+    else:
+        msg = "Input ``out`` must have shape {0}".format(shape)
+        assert out.shape == shape, msg
+        history = out
+        history[...] = 0
+    history[_trimmed_mask(start, num_scales)] = values
+    return history
+
+
+def write_trimmed_history_to_memmap(history, parent_dirname, colname, stats=None):
+    """Function saves a history column in the trimmed encoding of `trim_history`
+    as two columns ``colname_trimmed_start`` and ``colname_trimmed_values``
+    according to the standard directory tree layout.
+
+    Parameters
+    ----------
+    history : ndarray of shape (n, num_scales)
+        History of each galaxy
+
+    parent_dirname : string
+        Root directory where the data will be stored.
+
+        Typically this is of the form 'some/path/subvol_0_1_2'.
+
+    colname : string
+        Name of the history column, e.g., ``sfr_history_main_prog``
+
+    stats : IOStats, optional
+        See `~umachine_pyio.instrumentation.IOStats`
+
+    Notes
+    -----
+    The number of scales is not stored explicitly: it is determined
+    by ``(num_values + sum(start)) / n``.
+    """
+    with get_stats(stats).stage("trim_history", rows=len(history)):
+        start, values = trim_history(history)
+    write_column_to_memmap(
+        start, parent_dirname, colname + TRIMMED_START_SUFFIX, stats=stats
+    )
+    write_column_to_memmap(
+        values, parent_dirname, colname + TRIMMED_VALUES_SUFFIX, stats=stats
+    )
+
+
+def read_trimmed_history_from_subvolumes(
+    subvol_dirnames, colname, row_selections=None, ragged=False
+):
+    """Read a history column stored by `write_trimmed_history_to_memmap`
+    in each of the input subvolume directories
+
+    Parameters
+    ----------
+    subvol_dirnames : sequence of strings
+        Each string is the name of a directory such as ``some/path/subvol_0``
+
+    colname : string
+        Name of the history column, e.g., ``sfr_history_main_prog``
+
+    row_selections : sequence, optional
+        One entry per subvolume specifying which rows to read.
+        See `read_ndarray_from_memmap_sequence`.
+
+    ragged : bool, optional
+        If True, return the trimmed encoding instead of the dense array.
+        Default is False.
+
+    Returns
+    -------
+    history : ndarray of shape (n, num_scales)
+        Dense history of each galaxy. Only returned if ragged is False.
+
+    start, offsets, values : ndarrays of shape (n, ), (n+1, ), (num_values, )
+        Only returned if ragged is True. The history of galaxy i is zero before
+        scale ``start[i]`` and equals ``values[offsets[i]:offsets[i+1]]`` after.
+    """
+    subvol_dirnames = list(np.atleast_1d(subvol_dirnames))
+    if row_selections is None:
+        row_selections = [None] * len(subvol_dirnames)
+    msg = "Must have the same number of ``row_selections`` as ``subvol_dirnames``"
+    assert len(row_selections) == len(subvol_dirnames), msg
+
+    starts, values, num_scales = [], [], None
+    for subvol_dirname, rows in zip(subvol_dirnames, row_selections):
+        start, subvol_values, subvol_num_scales = _read_trimmed_history_of_subvolume(
+            subvol_dirname, colname, rows
+        )
+        starts.append(start)
+        values.append(subvol_values)
+        if subvol_num_scales is not None:
+            msg = (
+                "Column ``{0}`` must have the same number of scales in every subvolume"
+            )
+            assert num_scales in (None, subvol_num_scales), msg.format(colname)
+            num_scales = subvol_num_scales
+
+    start = np.concatenate(starts)
+    values = np.concatenate(values)
+    num_scales = 0 if num_scales is None else num_scales
+
+    if ragged:
+        offsets = np.zeros(len(start) + 1, dtype=np.int64)
+        np.cumsum(num_scales - start, out=offsets[1:])
+        return start, offsets, values
+    return untrim_history(start, values, num_scales)
+
+
+def trimmed_history_exists(subvol_dirname, colname):
+    """Determine whether the history column ``colname`` of the input subvolume
+    is stored by `write_trimmed_history_to_memmap`
+    """
+    start_dirname = os.path.join(subvol_dirname, colname + TRIMMED_START_SUFFIX)
+    return os.path.isdir(start_dirname)
 
-        output_dirname = os.path.join(parent_dirname, colname)
-        try:
-            os.makedirs(output_dirname)
-        except OSError:
-            pass
 
-        output_fname = os.path.join(output_dirname, colname + ".memmap")
-        write_ndarray_to_memmap(arr[colname], output_fname)
+def _read_trimmed_history_of_subvolume(subvol_dirname, colname, rows):
+    """Private function returning the start, values and number of scales
+    of the selected rows of a trimmed history column of a single subvolume.
+    The number of scales is None for subvolumes without galaxies.
+    """
+    layout = _read_trimmed_history_layout(subvol_dirname, colname)
+    return _select_trimmed_history_rows(layout, rows)
+
+
+def _read_trimmed_history_layout(subvol_dirname, colname):
+    """Private function returning the start, offsets, number of scales
+    and memory-mapped values of a trimmed history column of a single subvolume,
+    so that the rows of the column can be selected by
+    `_select_trimmed_history_rows` without re-reading the start column
+    """
+    start = _read_column_of_subvolume(subvol_dirname, colname + TRIMMED_START_SUFFIX)
+    values_fname, values_shape_fname = _column_fnames(
+        subvol_dirname, colname + TRIMMED_VALUES_SUFFIX
+    )
+    values_shape, values_dtype = read_shape_and_dtype_from_ascii(values_shape_fname)
+
+    start = start.astype(np.int64)
+    num_rows = len(start)
+    if num_rows == 0:
+        offsets = np.zeros(1, dtype=np.int64)
+        return start, offsets, None, np.zeros(0, dtype=values_dtype)
+
+    num_scales = (values_shape[0] + int(start.sum())) // num_rows
+    if values_shape[0] == 0:
+        values_mmp = np.zeros(0, dtype=values_dtype)
+    else:
+        values_mmp = _cached_memmap(values_fname, values_shape, values_dtype)[0]
+
+    offsets = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(num_scales - start, out=offsets[1:])
+    return start, offsets, num_scales, values_mmp
+
+
+def _select_trimmed_history_rows(layout, rows):
+    """Private function returning the start, values and number of scales
+    of the selected rows of the layout returned by `_read_trimmed_history_layout`
+    """
+    start, offsets, num_scales, values_mmp = layout
+    if rows is None:
+        return start, np.array(values_mmp), num_scales
+
+    num_rows = len(start)
+    if isinstance(rows, slice) and rows.step in (None, 1):
+        row_start, row_stop, __ = rows.indices(num_rows)
+        row_stop = max(row_start, row_stop)
+        values = np.array(values_mmp[offsets[row_start] : offsets[row_stop]])
+        return start[row_start:row_stop], values, num_scales
+
+    rows = np.arange(num_rows)[rows]
+    selected_lengths = offsets[rows + 1] - offsets[rows]
+    selected_offsets = np.cumsum(selected_lengths) - selected_lengths
+    idx_values = np.repeat(offsets[rows] - selected_offsets, selected_lengths)
+    idx_values += np.arange(len(idx_values))
+    return start[rows], values_mmp[idx_values], num_scales
+
+
+def _read_column_of_subvolume(subvol_dirname, colname):
+    memmap_fname, shape_fname = _column_fnames(subvol_dirname, colname)
+    return read_ndarray_from_memmap_sequence(memmap_fname, shape_fname)
+
+
+def _column_fnames(subvol_dirname, colname):
+    """Private function returning the names of the memmap and of the
+    shape and dtype files of a column of the input subvolume directory
+    """
+    dirname = os.path.join(subvol_dirname, colname)
+    memmap_fname = os.path.join(dirname, colname + ".memmap")
+    shape_fname = os.path.join(dirname, colname + "_shape_and_dtype.txt")
+    return memmap_fname, shape_fname
+
+
+def _trimmed_mask(start, num_scales):
+    """Private function returning the boolean mask of shape (n, num_scales)
+    of the entries of a history column kept by `trim_history`
+    """
+    return np.arange(num_scales) >= np.asarray(start)[:, np.newaxis]
 
 
 def determine_composite_shape_from_ascii_sequence(*shapes):
@@ -179,7 +479,9 @@ def determine_composite_shape_from_ascii_sequence(*shapes):
     return tuple(output_shape)
 
 
-def read_ndarray_from_memmap_sequence(memmap_fnames, shape_fnames):
+def read_ndarray_from_memmap_sequence(
+    memmap_fnames, shape_fnames, row_selections=None, out=None, stats=None
+):
     """From an input sequence of filenames to memory-mapped Numpy arrays of known shape,
     return a single Numpy array storing the concatenation of these arrays.
 
@@ -195,6 +497,21 @@ def read_ndarray_from_memmap_sequence(memmap_fnames, shape_fnames):
         The ASCII data have a simple format described in the
         `read_shape_and_dtype_from_ascii` function documentation.
 
+    row_selections : sequence, optional
+        One entry per memmap specifying which rows to read from that memmap.
+        Each entry may be None to read all rows, a slice,
+        or an integer array of row indices. Default is to read all rows.
+
+    out : ndarray, optional
+        Preallocated array that will store the result, e.g., a view of
+        shared memory. Must have the shape and dtype returned by
+        `read_composite_shape_and_dtype_from_ascii_sequence`.
+        Default is to allocate a new array.
+
+    stats : IOStats, optional
+        Records the ``sidecar_read`` and ``memmap_read`` stages.
+        See `~umachine_pyio.instrumentation.IOStats`.
+
     Returns
     -------
     arr : ndarray
@@ -204,22 +521,109 @@ def read_ndarray_from_memmap_sequence(memmap_fnames, shape_fnames):
     shape_fnames = np.atleast_1d(shape_fnames)
     msg = "Must have the same number of ``shapes`` as ``memmap_fnames``"
     assert len(memmap_fnames) == len(shape_fnames), msg
-
-    shapes = list(
-        read_shape_and_dtype_from_ascii(shape_fname)[0] for shape_fname in shape_fnames
+    if row_selections is None:
+        row_selections = [None] * len(memmap_fnames)
+    msg = "Must have the same number of ``row_selections`` as ``memmap_fnames``"
+    assert len(row_selections) == len(memmap_fnames), msg
+
+    stats = get_stats(stats)
+    with stats.stage("sidecar_read") as record:
+        shapes_and_dtypes = []
+        for shape_fname in shape_fnames:
+            shape_and_dtype, is_cached = _cached_metadata(
+                shape_fname, _parse_shape_and_dtype_file
+            )
+            shapes_and_dtypes.append(shape_and_dtype)
+            record["files_opened"] += int(not is_cached)
+    shapes = list(shape for shape, __ in shapes_and_dtypes)
+    dt = shapes_and_dtypes[0][1]
+    selected_shapes = list(
+        _selected_shape(shape, rows) for shape, rows in zip(shapes, row_selections)
     )
-    dt = read_shape_and_dtype_from_ascii(shape_fnames[0])[1]
+    composite_shape = determine_composite_shape_from_ascii_sequence(*selected_shapes)
 
-    arr = np.empty(determine_composite_shape_from_ascii_sequence(*shapes), dtype=dt)
+    if out is None:
+        arr = np.empty(composite_shape, dtype=dt)
+    else:
+        msg = "Input ``out`` must have shape {0} and dtype {1}".format(
+            composite_shape, dt
+        )
+        assert (out.shape == composite_shape) & (out.dtype == dt), msg
+        arr = out
 
     ifirst = 0
-    for fname, shape in zip(memmap_fnames, shapes):
-        ilast = ifirst + shape[0]
-        arr[ifirst:ilast] = np.memmap(fname, shape=shape, dtype=dt, mode="r")
+    for fname, shape, selected_shape, rows in zip(
+        memmap_fnames, shapes, selected_shapes, row_selections
+    ):
+        ilast = ifirst + selected_shape[0]
+        if ilast > ifirst:
+            with stats.stage("memmap_read") as record:
+                mmp, is_cached = _cached_memmap(fname, shape, dt)
+                record["files_opened"] = int(not is_cached)
+                if rows is None:
+                    arr[ifirst:ilast] = mmp
+                else:
+                    arr[ifirst:ilast] = mmp[rows]
+                record["bytes_read"] = arr[ifirst:ilast].nbytes
+                record["rows"] = ilast - ifirst
         ifirst = ilast
     return arr
 
 
+def read_composite_shape_and_dtype_from_ascii_sequence(
+    shape_fnames, row_selections=None
+):
+    """Determine the shape and dtype of the array that
+    `read_ndarray_from_memmap_sequence` would return for the same inputs,
+    without reading any of the memory-mapped data.
+
+    Parameters
+    ----------
+    shape_fnames : sequence of strings
+        Filenames of the ASCII metadata of each memory-mapped array
+
+    row_selections : sequence, optional
+        One entry per file specifying the selected rows.
+        See `read_ndarray_from_memmap_sequence`.
+
+    Returns
+    -------
+    shape : tuple
+        Shape of the concatenated array
+
+    dtype : object
+        Instance of a Numpy dtype object.
+    """
+    shape_fnames = np.atleast_1d(shape_fnames)
+    if row_selections is None:
+        row_selections = [None] * len(shape_fnames)
+    msg = "Must have the same number of ``row_selections`` as ``shape_fnames``"
+    assert len(row_selections) == len(shape_fnames), msg
+
+    shapes_and_dtypes = list(
+        read_shape_and_dtype_from_ascii(shape_fname) for shape_fname in shape_fnames
+    )
+    selected_shapes = list(
+        _selected_shape(shape, rows)
+        for (shape, __), rows in zip(shapes_and_dtypes, row_selections)
+    )
+    shape = determine_composite_shape_from_ascii_sequence(*selected_shapes)
+    return shape, shapes_and_dtypes[0][1]
+
+
+def _selected_shape(shape, rows):
+    """Private function calculating the shape of the rows of an array
+    selected by ``rows``, which may be None, a slice, or an integer array
+    """
+    if rows is None:
+        return shape
+    elif isinstance(rows, slice):
+        num_rows = len(range(*rows.indices(shape[0])))
+    else:
+        num_rows = len(rows)
+    return (num_rows, *shape[1:])
+
+
 def _unique_numpy_dtype_string(dtype):
     """Private function providing a standardized string used to characterize
     a Numpy dtype
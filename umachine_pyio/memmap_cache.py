@@ -0,0 +1,210 @@
+""" Module storing the process-wide cache of the parsed ``*_shape_and_dtype.txt``
+metadata and of the read-only memory maps opened by the package,
+so that repeated loads of the same columns in a long-running session
+skip parsing the metadata and re-opening the memory maps.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_HANDLES = 512
+DEFAULT_MAX_METADATA_ENTRIES = 2**16
+
+__all__ = (
+    "MemmapCache",
+    "get_memmap_cache",
+    "configure_memmap_cache",
+    "clear_memmap_cache",
+)
+
+
+class MemmapCache:
+    """Thread-safe cache of file metadata and read-only memory maps,
+    with least-recently-used eviction
+
+    Parameters
+    ----------
+    max_handles : int, optional
+        Maximum number of open memory maps. Each open memory map holds
+        a file descriptor, counting towards the limit of open files
+        of the process. Default is 512.
+
+    max_metadata_entries : int, optional
+        Maximum number of cached metadata files. Default is 65536.
+
+    Notes
+    -----
+    Every lookup calls ``os.stat`` on the file, and the cached entry is
+    discarded if the modification time or the size of the file changed.
+    The functions of `~umachine_pyio.memmap_array_utils` writing memory maps
+    also invalidate the entries of the files they overwrite.
+
+    The cached memory maps are shared between callers, so they are only
+    used for reading, and the arrays returned by the package are copies.
+    """
+
+    def __init__(
+        self,
+        max_handles=DEFAULT_MAX_HANDLES,
+        max_metadata_entries=DEFAULT_MAX_METADATA_ENTRIES,
+    ):
+        self.max_handles = int(max_handles)
+        self.max_metadata_entries = int(max_metadata_entries)
+        self._metadata = OrderedDict()
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def metadata(self, fname, parse):
+        """Return ``parse(fname)``, parsing the file only if it changed
+        since the last call
+
+        Returns
+        -------
+        value : object
+            Output of parse
+
+        is_cached : bool
+            True if the file was not parsed
+        """
+        signature = _file_signature(fname)
+        with self._lock:
+            entry = self._metadata.get(fname)
+            if (entry is not None) and (entry[0] == signature):
+                self._metadata.move_to_end(fname)
+                self.hits += 1
+                return entry[1], True
+            self.misses += 1
+
+        value = parse(fname)
+        with self._lock:
+            self._metadata[fname] = (signature, value)
+            self._metadata.move_to_end(fname)
+            while len(self._metadata) > self.max_metadata_entries:
+                self._metadata.popitem(last=False)
+        return value, False
+
+    def memmap(self, fname, shape, dtype):
+        """Return a read-only memory map of the file, re-using an open
+        memory map if the file did not change since it was opened
+
+        Returns
+        -------
+        mmp : np.memmap
+
+        is_cached : bool
+            True if the file was not opened
+        """
+        key = (fname, tuple(shape), np.dtype(dtype))
+        signature = _file_signature(fname)
+        with self._lock:
+            entry = self._handles.get(key)
+            if (entry is not None) and (entry[0] == signature):
+                self._handles.move_to_end(key)
+                self.hits += 1
+                return entry[1], True
+            self.misses += 1
+
+        mmp = np.memmap(fname, shape=shape, dtype=dtype, mode="r")
+        if self.max_handles > 0:
+            with self._lock:
+                self._handles[key] = (signature, mmp)
+                self._handles.move_to_end(key)
+                while len(self._handles) > self.max_handles:
+                    self._handles.popitem(last=False)
+        return mmp, False
+
+    def invalidate(self, fname):
+        """Discard the cached metadata and memory maps of the file"""
+        with self._lock:
+            self._metadata.pop(fname, None)
+            for key in [key for key in self._handles if key[0] == fname]:
+                del self._handles[key]
+
+    def clear(self):
+        """Discard every cached entry and reset the hit and miss counts"""
+        with self._lock:
+            self._metadata.clear()
+            self._handles.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Number of cached entries, hits and misses"""
+        with self._lock:
+            return dict(
+                num_metadata_entries=len(self._metadata),
+                num_handles=len(self._handles),
+                hits=self.hits,
+                misses=self.misses,
+            )
+
+
+def get_memmap_cache():
+    """Return the process-wide `MemmapCache`, or None if caching is disabled"""
+    return _MEMMAP_CACHE
+
+
+def configure_memmap_cache(
+    enabled=True,
+    max_handles=DEFAULT_MAX_HANDLES,
+    max_metadata_entries=DEFAULT_MAX_METADATA_ENTRIES,
+):
+    """Replace the process-wide cache with a new empty cache,
+    or disable caching with ``enabled=False``. Caching is enabled by default.
+
+    Examples
+    --------
+    >>> configure_memmap_cache(max_handles=2048)
+    >>> configure_memmap_cache(enabled=False)
+    >>> configure_memmap_cache()
+    """
+    global _MEMMAP_CACHE
+    _MEMMAP_CACHE = MemmapCache(max_handles, max_metadata_entries) if enabled else None
+
+
+def clear_memmap_cache():
+    """Discard every entry of the process-wide cache"""
+    cache = _MEMMAP_CACHE
+    if cache is not None:
+        cache.clear()
+
+
+def _cached_metadata(fname, parse):
+    """Return ``(parse(fname), is_cached)``
+    through the process-wide cache if enabled
+    """
+    cache = _MEMMAP_CACHE
+    if cache is None:
+        return parse(fname), False
+    return cache.metadata(fname, parse)
+
+
+def _cached_memmap(fname, shape, dtype):
+    """Return ``(mmp, is_cached)`` for a read-only
+    memory map through the process-wide cache if enabled
+    """
+    cache = _MEMMAP_CACHE
+    if cache is None:
+        return np.memmap(fname, shape=shape, dtype=dtype, mode="r"), False
+    return cache.memmap(fname, shape, dtype)
+
+
+def _invalidate_cached_file(fname):
+    """Discard the cached entries of a file
+    that is about to be overwritten
+    """
+    cache = _MEMMAP_CACHE
+    if cache is not None:
+        cache.invalidate(fname)
+
+
+def _file_signature(fname):
+    st = os.stat(fname)
+    return st.st_mtime_ns, st.st_size
+
+
+_MEMMAP_CACHE = MemmapCache()
@@ -0,0 +1,172 @@
+""" Module storing functions used to divide the subvolumes of a mock
+into balanced assignments for parallel analysis across ranks or workers.
+"""
+import heapq
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator
+from .load_mock import subvol_id_and_ngals_generator
+from .memmap_array_utils import read_shape_and_dtype_from_ascii
+
+__all__ = ("partition_subvolumes", "subvolume_weights")
+
+
+def subvolume_weights(subvolumes, root_dirname, weight="ngals", galprops=None):
+    """Calculate the number of galaxies and the workload of each subvolume
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    weight : string, optional
+        Either ``ngals`` to weight each subvolume by its number of galaxies,
+        or ``nbytes`` to weight each subvolume by the number of bytes
+        of the columns in ``galprops``. Default is ``ngals``.
+
+    galprops : sequence of strings, optional
+        Columns used to calculate the weights when ``weight`` is ``nbytes``.
+        Ignored when ``weight`` is ``ngals``.
+
+    Returns
+    -------
+    ngals : ndarray of shape (n_subvols, )
+        Number of galaxies in each subvolume
+
+    weights : ndarray of shape (n_subvols, )
+        Workload of each subvolume
+
+    """
+    subvolumes = list(subvolumes)
+    ngals = np.array(
+        [n for __, n in subvol_id_and_ngals_generator(subvolumes, root_dirname)],
+        dtype=np.int64,
+    )
+
+    if weight == "ngals":
+        weights = ngals.astype(float)
+    elif weight == "nbytes":
+        msg = "Must pass ``galprops`` to weight subvolumes by ``nbytes``"
+        assert galprops is not None, msg
+        weights = np.zeros(len(subvolumes))
+        for galprop in np.atleast_1d(galprops):
+            fname_gen = memmap_fname_iterator(root_dirname, galprop, *subvolumes)
+            for i, (__, shape_fname) in enumerate(fname_gen):
+                shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+                weights[i] += np.prod(shape, dtype=np.int64) * dtype.itemsize
+    else:
+        msg = "Input weight = ``{0}`` must be either ``ngals`` or ``nbytes``"
+        raise ValueError(msg.format(weight))
+
+    return ngals, weights
+
+
+def partition_subvolumes(
+    subvolumes,
+    root_dirname,
+    nranks,
+    rank=None,
+    weight="ngals",
+    galprops=None,
+    split_large=False,
+):
+    """Divide the input subvolumes into ``nranks`` assignments of nearly equal
+    workload, optionally splitting large subvolumes into row ranges.
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels, e.g., np.arange(144)
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    nranks : int
+        Number of MPI ranks or pool workers
+
+    rank : int, optional
+        If passed, only the assignment of this rank is returned.
+        Default is to return the assignments of all ranks.
+
+    weight : string, optional
+        Either ``ngals`` or ``nbytes``. See `subvolume_weights`.
+
+    galprops : sequence of strings, optional
+        Columns used to calculate the weights when ``weight`` is ``nbytes``
+
+    split_large : bool, optional
+        If True, every subvolume whose workload exceeds half the mean workload
+        per rank is split into row ranges of nearly equal size,
+        each with no more than half the mean workload per rank.
+        Default is False.
+
+    Returns
+    -------
+    assignment : tuple
+        When ``rank`` is passed, a two-element tuple ``(subvolumes, row_ranges)``
+        that can be passed directly to `~umachine_pyio.load_mock.load_mock_from_binaries`
+        as ``load_mock_from_binaries(subvolumes, root_dirname, row_ranges=row_ranges)``.
+        Otherwise, a list of such tuples with one element per rank.
+
+    Notes
+    -----
+    Assignments are computed with the greedy longest-processing-time rule:
+    work units are visited in order of decreasing workload
+    and each unit is given to the rank with the smallest workload so far.
+    With ``split_large=True``, every work unit is at most half the mean workload
+    per rank, up to the workload of a single row, so that no rank receives more
+    than 1.5 times the mean workload plus the workload of one row.
+
+    Examples
+    --------
+    >>> subvolumes, row_ranges = partition_subvolumes(np.arange(144), root_dirname, nranks, rank=rank)  # doctest: +SKIP
+    >>> mock = load_mock_from_binaries(subvolumes, root_dirname, row_ranges=row_ranges)  # doctest: +SKIP
+    """
+    subvolumes = list(subvolumes)
+    msg = "Input nranks = {0} must be a positive integer".format(nranks)
+    assert int(nranks) == nranks and nranks > 0, msg
+    if rank is not None:
+        msg = "Input rank = {0} must satisfy 0 <= rank < nranks".format(rank)
+        assert 0 <= rank < nranks, msg
+
+    ngals, weights = subvolume_weights(subvolumes, root_dirname, weight, galprops)
+
+    work_units = []
+    target = weights.sum() / nranks
+    for subvol, n, w in zip(subvolumes, ngals, weights):
+        if split_large and (w > target / 2) and (n > 1):
+            num_chunks = min(int(np.ceil(2 * w / target)), n)
+            edges = np.linspace(0, n, num_chunks + 1).astype(np.int64)
+            for row_start, row_stop in zip(edges[:-1], edges[1:]):
+                chunk_weight = w * (row_stop - row_start) / n
+                work_units.append((chunk_weight, subvol, int(row_start), int(row_stop)))
+        else:
+            work_units.append((w, subvol, 0, int(n)))
+
+    # Visit the heaviest work units first, breaking ties deterministically
+    work_units.sort(key=lambda u: (-u[0], u[1], u[2]))
+
+    rank_loads = [(0.0, i) for i in range(nranks)]
+    assignments = [[] for __ in range(nranks)]
+    for unit in work_units:
+        load, i = heapq.heappop(rank_loads)
+        assignments[i].append(unit)
+        heapq.heappush(rank_loads, (load + unit[0], i))
+
+    result = []
+    for units in assignments:
+        units = sorted(units, key=lambda u: (u[1], u[2]))
+        rank_subvolumes = [u[1] for u in units]
+        rank_row_ranges = [(u[2], u[3]) for u in units]
+        result.append((rank_subvolumes, rank_row_ranges))
+
+    if rank is None:
+        return result
+    else:
+        return result[rank]
@@ -0,0 +1,214 @@
+""" Module storing the SubvolumePrefetcher class used to loop over subvolumes
+while a background thread reads the columns of the next subvolumes,
+so that reading from the filesystem overlaps with the analysis of each subvolume.
+"""
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator, subvol_dirname_iterator
+from .load_mock import _is_trimmed_history
+from .memmap_array_utils import (
+    read_ndarray_from_memmap_sequence,
+    read_trimmed_history_from_subvolumes,
+)
+
+DEFAULT_PREFETCH_DEPTH = 2
+
+__all__ = ("SubvolumePrefetcher", "prefetch_subvolumes", "read_subvolume_columns")
+
+
+class SubvolumePrefetcher:
+    """Iterator over subvolumes yielding the requested columns of each subvolume
+    while a background thread reads the columns of the next subvolumes
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels, yielded in this order
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    galprops : sequence of strings
+        Names of the columns to read from each subvolume
+
+    prefetch_depth : int, optional
+        Maximum number of subvolumes read ahead of the consumer. Default is 2.
+
+    stats : IOStats, optional
+        Records the reads of the background thread.
+        See `~umachine_pyio.instrumentation.IOStats`.
+
+    Examples
+    --------
+    >>> with SubvolumePrefetcher(range(144), root_dirname, ["x", "obs_sm"]) as it:  # doctest: +SKIP
+    ...     for subvol, columns in it:
+    ...         total_sm = columns["obs_sm"].sum()
+
+    Notes
+    -----
+    Each item is a tuple ``(subvol, columns)``, where columns is an OrderedDict
+    storing one ndarray per requested column. As for
+    `~umachine_pyio.load_mock.load_mock_from_binaries`, trimmed history columns
+    are read as dense arrays. The ``host_row`` column stores the row of the host
+    within the subvolume, which is also its row in the yielded arrays.
+
+    At most ``prefetch_depth`` subvolumes wait in the queue, in addition to
+    the subvolume being read by the background thread and the subvolume held
+    by the consumer, which bounds memory use to ``prefetch_depth + 2``
+    subvolumes.
+
+    Exceptions raised while reading are re-raised by the iterator.
+    Breaking out of the loop leaves the background thread waiting on the queue:
+    call `close`, or use the prefetcher as a context manager, to stop it.
+    """
+
+    def __init__(
+        self,
+        subvolumes,
+        root_dirname,
+        galprops,
+        prefetch_depth=DEFAULT_PREFETCH_DEPTH,
+        stats=None,
+    ):
+        msg = "prefetch_depth must be a positive integer"
+        assert int(prefetch_depth) >= 1, msg
+
+        self.subvolumes = list(subvolumes)
+        self.root_dirname = root_dirname
+        self.galprops = list(
+            OrderedDict.fromkeys(str(g) for g in np.atleast_1d(galprops))
+        )
+        self.prefetch_depth = int(prefetch_depth)
+        self.stats = stats
+
+        self._queue = queue.Queue(maxsize=self.prefetch_depth)
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self._exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._exhausted:
+            raise StopIteration
+        item = self._queue.get()
+        if item is _END_OF_SUBVOLUMES:
+            self._exhausted = True
+            self._thread.join()
+            raise StopIteration
+        if isinstance(item, _WorkerError):
+            self.close()
+            raise item.exception
+        return item
+
+    def close(self):
+        """Stop the background thread and discard the prefetched subvolumes"""
+        self._cancelled.set()
+        self._exhausted = True
+        while self._thread.is_alive():
+            self._drain_queue()
+            self._thread.join(timeout=_POLL_SECONDS)
+        self._drain_queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _worker(self):
+        try:
+            for subvol in self.subvolumes:
+                if self._cancelled.is_set():
+                    return
+                columns = read_subvolume_columns(
+                    subvol, self.root_dirname, self.galprops, self.stats
+                )
+                if not self._put((subvol, columns)):
+                    return
+        except Exception as exception:
+            self._put(_WorkerError(exception))
+            return
+        self._put(_END_OF_SUBVOLUMES)
+
+    def _put(self, item):
+        """Put the item in the queue, waiting for space unless cancelled.
+        Return False if the prefetcher was cancelled.
+        """
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain_queue(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+def prefetch_subvolumes(
+    subvolumes,
+    root_dirname,
+    galprops,
+    prefetch_depth=DEFAULT_PREFETCH_DEPTH,
+    stats=None,
+):
+    """Generator yielding ``(subvol, columns)`` for each subvolume
+    while the next subvolumes are read in the background.
+    See `SubvolumePrefetcher` for a description of the arguments.
+
+    The background thread is stopped when the generator is closed or
+    garbage collected, e.g., after breaking out of the loop.
+    """
+    prefetcher = SubvolumePrefetcher(
+        subvolumes, root_dirname, galprops, prefetch_depth, stats
+    )
+    try:
+        yield from prefetcher
+    finally:
+        prefetcher.close()
+
+
+def read_subvolume_columns(subvol, root_dirname, galprops, stats=None):
+    """Read the requested columns of a single subvolume
+
+    Returns
+    -------
+    columns : OrderedDict
+        One ndarray per requested column
+    """
+    subvol_dirname = next(subvol_dirname_iterator(root_dirname, subvol))
+    columns = OrderedDict()
+    for galprop in galprops:
+        memmap_fname, shape_fname = next(
+            memmap_fname_iterator(root_dirname, galprop, subvol)
+        )
+        if _is_trimmed_history([subvol_dirname], [shape_fname], galprop):
+            arr = read_trimmed_history_from_subvolumes([subvol_dirname], galprop)
+        else:
+            arr = read_ndarray_from_memmap_sequence(
+                [memmap_fname], [shape_fname], stats=stats
+            )
+        columns[galprop] = arr
+    return columns
+
+
+class _WorkerError:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_END_OF_SUBVOLUMES = object()
+_POLL_SECONDS = 0.05
@@ -224,9 +224,16 @@ def _compression_safe_opener(fname):
     f = gzip.open(fname, "r")
     try:
         f.read(1)
-        opener = gzip.open
+        opener = _gzip_text_opener
     except IOError:
         opener = open
     finally:
         f.close()
     return opener
+
+
+def _gzip_text_opener(fname, mode="r"):
+    """Open a gzip-compressed file in text mode, so that lines are strings
+    as when reading uncompressed files with *open*.
+    """
+    return gzip.open(fname, mode + "t")
@@ -1,37 +1,99 @@
 """
 """
+import os
 import numpy as np
 from collections import OrderedDict
-from .memmap_array_utils import write_structured_array_to_memmap
+from .instrumentation import get_stats
+from .history_summaries import (
+    compute_history_summaries,
+    history_summary_input_colnames,
+)
+from .memmap_array_utils import (
+    write_column_to_memmap,
+    write_structured_array_to_memmap,
+    write_trimmed_history_to_memmap,
+)
 
 
 def write_ascii_to_memmap_tree(
-    sfh_ascii_fname, column_info_fname, output_dirname, requested_colnames=None
+    sfh_ascii_fname,
+    column_info_fname,
+    output_dirname,
+    requested_colnames=None,
+    trimmed_colnames=(),
+    summary_cosmic_age=None,
+    stats=None,
 ):
-    """Read SFH ASCII data output from umachine and write to memmap column store"""
-
-    columns_dict = _build_colnums_dict(sfh_ascii_fname, column_info_fname)
+    """Read SFH ASCII data output from umachine and write to memmap column store
+
+    History columns listed in ``trimmed_colnames`` are stored without
+    the leading zeros of each galaxy, see
+    `~umachine_pyio.memmap_array_utils.write_trimmed_history_to_memmap`.
+
+    If ``summary_cosmic_age`` storing the age of the Universe at each scale is
+    passed, the history summaries of
+    `~umachine_pyio.history_summaries.compute_history_summaries` are computed
+    from the parsed histories and stored as additional columns,
+    whether or not the history columns themselves are requested.
+
+    If an `~umachine_pyio.instrumentation.IOStats` is passed as ``stats``,
+    the time spent parsing the header, tokenizing the ASCII data,
+    converting dtypes and writing memmaps is recorded.
+    """
+    stats = get_stats(stats)
+    with stats.stage("header_parse", files_opened=2):
+        columns_dict = _build_colnums_dict(sfh_ascii_fname, column_info_fname)
 
     if requested_colnames is None:
         requested_colnames = list(columns_dict.keys())
 
-    data_array_indices = _data_array_indices_from_dict(columns_dict, requested_colnames)
-    colnums_to_yield = _determine_colnums_to_yield(columns_dict, requested_colnames)
-    raw_data_array = np.array(
-        list(_ascii_data_iterator(sfh_ascii_fname, colnums_to_yield))
-    )
-
-    for colname in requested_colnames:
+    parsed_colnames = list(requested_colnames)
+    if summary_cosmic_age is not None:
+        for colname in history_summary_input_colnames:
+            if colname not in parsed_colnames:
+                parsed_colnames.append(colname)
+
+    data_array_indices = _data_array_indices_from_dict(columns_dict, parsed_colnames)
+    colnums_to_yield = _determine_colnums_to_yield(columns_dict, parsed_colnames)
+    with stats.stage("tokenize", files_opened=1) as record:
+        raw_data_array = np.array(
+            list(_ascii_data_iterator(sfh_ascii_fname, colnums_to_yield))
+        )
+        record["bytes_read"] = os.path.getsize(sfh_ascii_fname)
+        record["rows"] = len(raw_data_array)
+
+    histories = dict()
+    for colname in parsed_colnames:
         ifirst, ilast = data_array_indices[colname]
         dt = np.dtype([(colname, columns_dict[colname][0])])
 
-        if ifirst == ilast:
-            data = np.array(raw_data_array[:, ifirst], dtype=dt)
+        with stats.stage("dtype_conversion", rows=len(raw_data_array)):
+            if ifirst == ilast:
+                data = np.array(raw_data_array[:, ifirst], dtype=dt)
+            else:
+                a, b = ifirst, ilast + 1
+                data = np.array(raw_data_array[:, a:b], dtype=dt)
+
+        if colname in history_summary_input_colnames:
+            histories[colname] = data[colname]
+        if colname not in requested_colnames:
+            continue
+        elif (colname in trimmed_colnames) & (ifirst != ilast):
+            write_trimmed_history_to_memmap(
+                data[colname], output_dirname, colname, stats=stats
+            )
         else:
-            a, b = ifirst, ilast + 1
-            data = np.array(raw_data_array[:, a:b], dtype=dt)
-
-        write_structured_array_to_memmap(data, output_dirname, colname)
+            write_structured_array_to_memmap(data, output_dirname, colname, stats=stats)
+
+    if summary_cosmic_age is not None:
+        with stats.stage("history_summaries", rows=len(raw_data_array)):
+            history_summaries = compute_history_summaries(
+                histories["sm_history_main_prog"],
+                histories["sfr_history_main_prog"],
+                summary_cosmic_age,
+            )
+        for colname, arr in history_summaries.items():
+            write_column_to_memmap(arr, output_dirname, colname, stats=stats)
 
 
 def _determine_colnums_to_yield(columns_dict, requested_colnames):
@@ -0,0 +1,360 @@
+""" Module storing functions used to share a mock catalog between the processes
+of a multiprocessing pool without copying the data into every worker.
+"""
+import sys
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator, subvol_dirname_iterator
+from .load_mock import (
+    _host_rows_to_loaded_rows,
+    _is_trimmed_history,
+    _row_selections_from_row_ranges,
+    default_galprops,
+)
+from .memmap_array_utils import (
+    _read_trimmed_history_layout,
+    _select_trimmed_history_rows,
+    _selected_shape,
+    read_composite_shape_and_dtype_from_ascii_sequence,
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+    untrim_history,
+)
+
+__all__ = (
+    "SharedMock",
+    "load_mock_into_shared_memory",
+    "share_mock_memmaps",
+    "attach_shared_mock",
+)
+
+
+class SharedMock:
+    """Collection of mock galaxy properties that can be attached by name
+    from any process on the same machine.
+
+    Instances should be created with `load_mock_into_shared_memory`
+    or `share_mock_memmaps` in the parent process,
+    and with `attach_shared_mock` in the worker processes.
+    Only the ``spec`` attribute needs to be sent to the workers.
+
+    Each column is accessed by name, e.g., ``shared_mock["sm"]``,
+    and is a zero-copy Numpy view of the shared data.
+    Columns of catalogs created by `share_mock_memmaps` are instead a list of
+    read-only memmaps, one per subvolume, or a list of shared-memory arrays
+    for the history columns stored in the trimmed encoding.
+
+    The process that created the catalog owns the shared-memory segments:
+    calling `close` in the owner also removes the segments,
+    whereas calling `close` in a worker only detaches from them.
+    The owner removes the segments at exit if `close` was never called.
+    """
+
+    def __init__(self, spec, owner=False):
+        self.spec = spec
+        self.owner = owner
+        self._segments = []
+        self._columns = dict()
+
+        for colname, colspec in spec.items():
+            kind = colspec[0]
+            if kind == "shm":
+                __, shm_name, shape, dtype = colspec
+                shm = _open_shared_memory(shm_name, track=owner)
+                self._segments.append(shm)
+                self._columns[colname] = np.ndarray(
+                    shape, dtype=np.dtype(dtype), buffer=shm.buf
+                )
+            elif kind == "shm_list":
+                self._columns[colname] = []
+                for shm_name, shape, dtype in colspec[1]:
+                    shm = _open_shared_memory(shm_name, track=owner)
+                    self._segments.append(shm)
+                    self._columns[colname].append(
+                        np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+                    )
+            elif kind == "memmap":
+                self._columns[colname] = list(
+                    np.memmap(fname, shape=shape, dtype=np.dtype(dtype), mode="r")
+                    for fname, shape, dtype in colspec[1]
+                )
+            else:
+                raise ValueError("Unrecognized column kind ``{0}``".format(kind))
+
+        self._finalizer = weakref.finalize(
+            self, _release_segments, self._segments, owner
+        )
+
+    def __getitem__(self, colname):
+        return self._columns[colname]
+
+    def __contains__(self, colname):
+        return colname in self._columns
+
+    def __len__(self):
+        return len(self._columns)
+
+    def keys(self):
+        return self._columns.keys()
+
+    def close(self):
+        """Detach from the shared data, removing the shared-memory segments
+        if this process owns them
+        """
+        self._columns = dict()
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_mock_into_shared_memory(
+    subvolumes, root_dirname, galprops=default_galprops, row_ranges=None
+):
+    """Load the mock catalog into named shared-memory segments,
+    one segment per galaxy property.
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence specifies which subvolumes will be used to load data
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    galprops : sequence of strings, optional
+        List of galaxy properties to include in the mock catalog
+
+    row_ranges : sequence of tuples, optional
+        One ``(row_start, row_stop)`` tuple per subvolume.
+        See `~umachine_pyio.load_mock.load_mock_from_binaries`.
+
+    Returns
+    -------
+    shared_mock : SharedMock
+        Catalog owned by the calling process.
+        Send ``shared_mock.spec`` to the workers,
+        which call `attach_shared_mock` to access the data.
+        As in `~umachine_pyio.load_mock.load_mock_from_binaries`,
+        the ``host_row`` column stores rows of the loaded catalog.
+
+    Examples
+    --------
+    >>> with load_mock_into_shared_memory(subvolumes, root_dirname) as shared_mock:  # doctest: +SKIP
+    ...     with Pool(8) as pool:  # doctest: +SKIP
+    ...         results = pool.map(worker_func, [shared_mock.spec] * 8)  # doctest: +SKIP
+    """
+    galprops = list(dict.fromkeys(np.atleast_1d(galprops)))
+    row_selections = _row_selections_from_row_ranges(row_ranges)
+    subvol_dirnames = list(subvol_dirname_iterator(root_dirname, *subvolumes))
+
+    spec = dict()
+    segments = []
+    try:
+        for galprop in galprops:
+            fname_tuples = list(
+                memmap_fname_iterator(root_dirname, galprop, *subvolumes)
+            )
+            memmap_fnames = [t[0] for t in fname_tuples]
+            shape_fnames = [t[1] for t in fname_tuples]
+            if _is_trimmed_history(subvol_dirnames, shape_fnames, galprop):
+                shm, shape, dtype = _untrim_history_into_shared_memory(
+                    subvol_dirnames, galprop, row_selections, segments
+                )
+            else:
+                shape, dtype = read_composite_shape_and_dtype_from_ascii_sequence(
+                    shape_fnames, row_selections
+                )
+                shm, out = _create_shared_array(shape, dtype, segments)
+                read_ndarray_from_memmap_sequence(
+                    memmap_fnames, shape_fnames, row_selections, out=out
+                )
+                if galprop == "host_row":
+                    out[:] = _host_rows_to_loaded_rows(
+                        out, shape_fnames, row_selections
+                    )
+                del out
+            spec[galprop] = ("shm", shm.name, shape, dtype.str)
+
+        shared_mock = SharedMock(spec, owner=True)
+    except BaseException:
+        _release_segments(segments, unlink=True)
+        raise
+
+    # The SharedMock instance holds its own handles to the segments
+    _release_segments(segments, unlink=False)
+    return shared_mock
+
+
+def share_mock_memmaps(subvolumes, root_dirname, galprops=default_galprops):
+    """Share the read-only memmaps of the mock catalog without loading any data.
+    Workers map the same files, so that the data are shared through
+    the page cache of the operating system.
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence specifies which subvolumes will be shared
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    galprops : sequence of strings, optional
+        List of galaxy properties to include in the mock catalog
+
+    Returns
+    -------
+    shared_mock : SharedMock
+        Catalog in which each column is a list of read-only memmaps,
+        one per subvolume. Send ``shared_mock.spec`` to the workers,
+        which call `attach_shared_mock` to access the data.
+        The ``host_row`` column stores the row of the host halo
+        within the memmap of its own subvolume, as written by
+        `~umachine_pyio.derived_columns.write_derived_columns`.
+
+    Notes
+    -----
+    History columns stored in the trimmed encoding of
+    `~umachine_pyio.memmap_array_utils.write_trimmed_history_to_memmap`
+    have no dense memmap. They are instead decoded into one shared-memory
+    segment per subvolume, owned by the calling process.
+    """
+    subvol_dirnames = list(subvol_dirname_iterator(root_dirname, *subvolumes))
+    spec = dict()
+    segments = []
+    try:
+        for galprop in dict.fromkeys(np.atleast_1d(galprops)):
+            fname_tuples = list(
+                memmap_fname_iterator(root_dirname, galprop, *subvolumes)
+            )
+            shape_fnames = [t[1] for t in fname_tuples]
+            if _is_trimmed_history(subvol_dirnames, shape_fnames, galprop):
+                shm_specs = []
+                for subvol_dirname in subvol_dirnames:
+                    shm, shape, dtype = _untrim_history_into_shared_memory(
+                        [subvol_dirname], galprop, [None], segments
+                    )
+                    shm_specs.append((shm.name, shape, dtype.str))
+                spec[galprop] = ("shm_list", shm_specs)
+            else:
+                memmap_specs = []
+                for memmap_fname, shape_fname in fname_tuples:
+                    shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+                    memmap_specs.append((memmap_fname, shape, dtype.str))
+                spec[galprop] = ("memmap", memmap_specs)
+
+        shared_mock = SharedMock(spec, owner=True)
+    except BaseException:
+        _release_segments(segments, unlink=True)
+        raise
+
+    # The SharedMock instance holds its own handles to the segments
+    _release_segments(segments, unlink=False)
+    return shared_mock
+
+
+def attach_shared_mock(spec):
+    """Attach to a mock catalog shared by another process
+
+    Parameters
+    ----------
+    spec : dict
+        The ``spec`` attribute of the `SharedMock` created by the parent process
+
+    Returns
+    -------
+    shared_mock : SharedMock
+        Catalog with zero-copy views of the shared data.
+        Calling `SharedMock.close` detaches without removing the data.
+    """
+    return SharedMock(spec, owner=False)
+
+
+def _create_shared_array(shape, dtype, segments):
+    """Create a shared-memory segment storing an array of the input shape
+    and dtype, appended to ``segments``, and return it with a view of the array
+    """
+    nbytes = max(int(np.prod(shape, dtype=np.int64)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    segments.append(shm)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _untrim_history_into_shared_memory(
+    subvol_dirnames, colname, row_selections, segments
+):
+    """Decode the selected rows of a trimmed history column of the input
+    subvolumes into a new shared-memory segment, appended to ``segments``
+
+    Returns
+    -------
+    shm : SharedMemory
+
+    shape : tuple
+
+    dtype : Numpy dtype
+    """
+    if row_selections is None:
+        row_selections = [None] * len(subvol_dirnames)
+    layouts = [_read_trimmed_history_layout(d, colname) for d in subvol_dirnames]
+
+    num_rows, num_scales = 0, None
+    for (start, __, subvol_num_scales, __), rows in zip(layouts, row_selections):
+        num_rows += _selected_shape((len(start),), rows)[0]
+        if subvol_num_scales is not None:
+            msg = (
+                "Column ``{0}`` must have the same number of scales in every subvolume"
+            )
+            assert num_scales in (None, subvol_num_scales), msg.format(colname)
+            num_scales = subvol_num_scales
+    shape = (num_rows, 0 if num_scales is None else num_scales)
+    dtype = layouts[0][3].dtype
+
+    shm, out = _create_shared_array(shape, dtype, segments)
+    ifirst = 0
+    for layout, rows in zip(layouts, row_selections):
+        start, values, __ = _select_trimmed_history_rows(layout, rows)
+        ilast = ifirst + len(start)
+        untrim_history(start, values, shape[1], out=out[ifirst:ilast])
+        ifirst = ilast
+    del out
+    return shm, shape, dtype
+
+
+def _open_shared_memory(shm_name, track):
+    """Attach to an existing shared-memory segment. Unless ``track`` is True,
+    the calling process does not become responsible for removing the segment.
+
+    Before Python 3.13, attaching always registers the segment with the
+    resource tracker, which is shared with the parent by the workers of a
+    multiprocessing pool, so that the segment is still removed only once.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=track)
+    else:
+        return shared_memory.SharedMemory(name=shm_name)
+
+
+def _release_segments(segments, unlink):
+    """Close each shared-memory segment, additionally removing it if ``unlink``"""
+    for shm in segments:
+        try:
+            shm.close()
+        except BufferError:
+            # Views of the segment are still alive; the mapping is released
+            # when the last view is garbage collected
+            pass
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+    del segments[:]
@@ -0,0 +1,250 @@
+""" Module storing the SnapshotLinkingIndex class used to link galaxies
+across the reduced ``a_*`` snapshot trees of a mock,
+resolving orphans through the ID of their last surviving progenitor halo.
+"""
+import os
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator
+from .index_utils import (
+    CrossmatchIndex,
+    calculate_last_surviving_id,
+    get_num_snaps_since_orphan_merge,
+)
+from .memmap_array_utils import (
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+    write_column_to_memmap,
+)
+
+SNAPSHOT_LIST_BASENAME = "snapshots.txt"
+SUBVOLUME_OFFSETS_BASENAME = "subvolume_offsets.txt"
+
+__all__ = ("SnapshotLinkingIndex",)
+
+
+class SnapshotLinkingIndex:
+    """Persistent index mapping the ``halo_id`` of a galaxy in one snapshot
+    to the row of the same galaxy in any other indexed snapshot.
+
+    The index of each snapshot is stored in its own subdirectory of
+    ``linking_dirname``, so that snapshots can be added one at a time,
+    and queries only memory-map the index of the snapshots involved.
+
+    Rows are global rows of a snapshot, i.e., rows of the concatenation of
+    its subvolumes in the order passed to `add_snapshot`;
+    `subvolume_and_row` converts them into a subvolume label and
+    a row within that subvolume.
+
+    Parameters
+    ----------
+    linking_dirname : string
+        Directory storing the index. Created if it does not exist.
+
+    Examples
+    --------
+    >>> linking_index = SnapshotLinkingIndex("linking_index")  # doctest: +SKIP
+    >>> for root_dirname in ("a_0.668185", "a_1.002310"):  # doctest: +SKIP
+    ...     linking_index.add_snapshot(root_dirname, subvolumes=range(144))
+    >>> rows = linking_index.link_rows("a_1.002310", [0, 5, 8], "a_0.668185")  # doctest: +SKIP
+    >>> subvols, subvol_rows = linking_index.subvolume_and_row("a_0.668185", rows)  # doctest: +SKIP
+    """
+
+    def __init__(self, linking_dirname):
+        self.linking_dirname = linking_dirname
+        os.makedirs(linking_dirname, exist_ok=True)
+        self._snapshots = dict()
+
+    @property
+    def snapshot_names(self):
+        """List of the names of the indexed snapshots, in the order they were added"""
+        fname = os.path.join(self.linking_dirname, SNAPSHOT_LIST_BASENAME)
+        if not os.path.isfile(fname):
+            return []
+        with open(fname, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def add_snapshot(self, root_dirname, subvolumes, name=None):
+        """Index the ``halo_id`` column of a reduced snapshot
+
+        Parameters
+        ----------
+        root_dirname : string
+            Name of the snapshot directory storing subdirectories with names
+            ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+        subvolumes : sequence of integers
+            Sequence of subvolume labels to index
+
+        name : string, optional
+            Name of the snapshot in the index.
+            Default is the basename of root_dirname, e.g., ``a_1.002310``.
+            Adding a snapshot with an existing name replaces its index.
+        """
+        if name is None:
+            name = os.path.basename(os.path.normpath(root_dirname))
+        subvolumes = list(subvolumes)
+
+        fname_tuples = list(memmap_fname_iterator(root_dirname, "halo_id", *subvolumes))
+        shape_fnames = [t[1] for t in fname_tuples]
+        halo_id = read_ndarray_from_memmap_sequence(
+            [t[0] for t in fname_tuples], shape_fnames
+        ).astype(np.int64)
+        num_rows = [read_shape_and_dtype_from_ascii(f)[0][0] for f in shape_fnames]
+
+        snapshot_dirname = os.path.join(self.linking_dirname, name)
+        os.makedirs(snapshot_dirname, exist_ok=True)
+        write_column_to_memmap(halo_id, snapshot_dirname, "halo_id")
+        CrossmatchIndex(halo_id).save(os.path.join(snapshot_dirname, "halo_id_index"))
+
+        #  Orphans are indexed by the ID of their last surviving progenitor.
+        #  When several orphans share it, keep the most recently merged one.
+        orphan_row = np.flatnonzero(get_num_snaps_since_orphan_merge(halo_id) > 0)
+        orphan_lsid = calculate_last_surviving_id(halo_id[orphan_row])
+        num_snaps = get_num_snaps_since_orphan_merge(halo_id[orphan_row])
+        idx_sorted = np.lexsort((num_snaps, orphan_lsid))
+        orphan_lsid, orphan_row = orphan_lsid[idx_sorted], orphan_row[idx_sorted]
+        is_first = np.ones(len(orphan_lsid), dtype=bool)
+        is_first[1:] = orphan_lsid[1:] != orphan_lsid[:-1]
+        orphan_index = CrossmatchIndex(orphan_lsid[is_first], strategy="sorted")
+        orphan_index.save(os.path.join(snapshot_dirname, "orphan_index"))
+        write_column_to_memmap(orphan_row[is_first], snapshot_dirname, "orphan_row")
+
+        offsets = np.cumsum([0] + num_rows[:-1])
+        with open(os.path.join(snapshot_dirname, SUBVOLUME_OFFSETS_BASENAME), "w") as f:
+            for subvol, offset, n in zip(subvolumes, offsets, num_rows):
+                f.write("{0} {1} {2}\n".format(subvol, offset, n))
+
+        snapshot_names = self.snapshot_names
+        if name not in snapshot_names:
+            fname = os.path.join(self.linking_dirname, SNAPSHOT_LIST_BASENAME)
+            with open(fname, "w") as f:
+                f.write("".join(s + "\n" for s in snapshot_names + [name]))
+        self._snapshots.pop(name, None)
+
+    def link(self, halo_id, target):
+        """Find the row in the target snapshot of each input galaxy
+
+        Parameters
+        ----------
+        halo_id : ndarray of shape (n, )
+            ``halo_id`` of each galaxy in any snapshot
+
+        target : string
+            Name of the target snapshot
+
+        Returns
+        -------
+        row : ndarray of shape (n, )
+            Global row of each galaxy in the target snapshot, or -1 if the galaxy
+            cannot be linked. Galaxies are matched by ``halo_id``, then by the
+            ``halo_id`` of their last surviving progenitor, either to a surviving
+            halo or to an orphan of the target snapshot.
+        """
+        halo_id = np.atleast_1d(halo_id).astype(np.int64)
+        snapshot = self._load_snapshot(target)
+
+        row = snapshot["halo_id_index"].row_of_match(halo_id)
+        unmatched = np.flatnonzero(row == -1)
+        lsid = calculate_last_surviving_id(halo_id[unmatched])
+        row[unmatched] = snapshot["halo_id_index"].row_of_match(lsid)
+
+        still_unmatched = row[unmatched] == -1
+        unmatched, lsid = unmatched[still_unmatched], lsid[still_unmatched]
+        orphan_index_row = snapshot["orphan_index"].row_of_match(lsid)
+        has_orphan = orphan_index_row >= 0
+        row[unmatched[has_orphan]] = snapshot["orphan_row"][
+            orphan_index_row[has_orphan]
+        ]
+        return row
+
+    def link_rows(self, source, rows, target):
+        """Find the row in the target snapshot of galaxies
+        selected by their row in the source snapshot
+
+        Parameters
+        ----------
+        source : string
+            Name of the source snapshot
+
+        rows : ndarray of shape (n, )
+            Global rows of the galaxies in the source snapshot
+
+        target : string
+            Name of the target snapshot
+
+        Returns
+        -------
+        row : ndarray of shape (n, )
+            Global row of each galaxy in the target snapshot, or -1. See `link`.
+        """
+        return self.link(self.halo_id(source, rows), target)
+
+    def halo_id(self, name, rows=None):
+        """``halo_id`` of the galaxies of a snapshot stored at the input global rows"""
+        halo_id = self._load_snapshot(name)["halo_id"]
+        if rows is None:
+            return np.array(halo_id)
+        return halo_id[np.atleast_1d(rows)]
+
+    def subvolume_and_row(self, name, rows):
+        """Convert global rows of a snapshot into subvolume labels
+        and rows within each subvolume
+
+        Parameters
+        ----------
+        name : string
+            Name of the snapshot
+
+        rows : ndarray of shape (n, )
+            Global rows of the snapshot. Rows equal to -1 are returned as -1.
+
+        Returns
+        -------
+        subvol : ndarray of shape (n, )
+            Label of the subvolume of each row
+
+        subvol_row : ndarray of shape (n, )
+            Row within the subvolume, as loaded by
+            `~umachine_pyio.load_mock.load_mock_from_binaries`
+        """
+        rows = np.atleast_1d(rows).astype(np.int64)
+        subvolumes, offsets = self._load_snapshot(name)["subvolume_offsets"]
+        isubvol = np.searchsorted(offsets, rows, side="right") - 1
+        is_valid = rows >= 0
+        subvol = np.where(is_valid, subvolumes[isubvol], -1)
+        subvol_row = np.where(is_valid, rows - offsets[isubvol], -1)
+        return subvol, subvol_row
+
+    def _load_snapshot(self, name):
+        if name not in self._snapshots:
+            if name not in self.snapshot_names:
+                msg = "Snapshot ``{0}`` is not in the linking index {1}"
+                raise ValueError(msg.format(name, self.linking_dirname))
+
+            snapshot_dirname = os.path.join(self.linking_dirname, name)
+            snapshot = dict()
+            snapshot["halo_id_index"] = CrossmatchIndex.load(
+                os.path.join(snapshot_dirname, "halo_id_index")
+            )
+            snapshot["orphan_index"] = CrossmatchIndex.load(
+                os.path.join(snapshot_dirname, "orphan_index")
+            )
+            for colname in ("halo_id", "orphan_row"):
+                snapshot[colname] = _load_memmap_column(snapshot_dirname, colname)
+            offsets_fname = os.path.join(snapshot_dirname, SUBVOLUME_OFFSETS_BASENAME)
+            offsets = np.loadtxt(offsets_fname, dtype=np.int64, ndmin=2)
+            snapshot["subvolume_offsets"] = (offsets[:, 0], offsets[:, 1])
+            self._snapshots[name] = snapshot
+        return self._snapshots[name]
+
+
+def _load_memmap_column(parent_dirname, colname):
+    dirname = os.path.join(parent_dirname, colname)
+    shape_fname = os.path.join(dirname, colname + "_shape_and_dtype.txt")
+    shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    memmap_fname = os.path.join(dirname, colname + ".memmap")
+    return np.memmap(memmap_fname, shape=shape, dtype=dtype, mode="r")
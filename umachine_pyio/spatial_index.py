@@ -0,0 +1,430 @@
+""" Module storing the PeriodicCellList class used to find the neighbors of
+galaxies in a periodic box, e.g., for isolation criteria or counts-in-cells,
+without a brute-force scan or a tree build for every query.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+import numpy as np
+
+from .memmap_array_utils import read_shape_and_dtype_from_ascii, write_column_to_memmap
+
+CELL_LIST_DIRNAME = "cell_list"
+CELL_LIST_INFO_BASENAME = "cell_list_info.txt"
+DEFAULT_POINTS_PER_CELL = 8
+MAX_NUM_CELLS_PER_DIM = 512
+DEFAULT_QUERY_CHUNK_SIZE = 2**15
+_CELL_LIST_ARRAY_NAMES = ("order", "cell_offsets", "pos_sorted")
+
+__all__ = ("PeriodicCellList",)
+
+
+class PeriodicCellList:
+    """Index of points in a periodic box, binned on a regular grid of cells
+    so that the neighbors of a point are only searched in the nearby cells
+
+    Parameters
+    ----------
+    x, y, z : ndarrays of shape (n, )
+        Coordinates of the indexed points, e.g., of the galaxies of a mock.
+        Points are wrapped into ``[0, Lbox)``.
+
+    Lbox : float
+        Size of the periodic box
+
+    num_cells_per_dim : int, optional
+        Number of cells along each dimension. Default is chosen so that cells
+        store about 8 points on average, with at most 512 cells per dimension.
+
+    Notes
+    -----
+    Queries are vectorized over chunks of query points, and the chunks
+    can be distributed over a pool of threads with the ``num_workers``
+    argument: Numpy releases the GIL in the gather and arithmetic kernels
+    that dominate the runtime. Memory use of each chunk scales with the
+    number of candidate pairs of the chunk, which is bounded with
+    the ``chunk_size`` argument.
+
+    Queries are exact for radii smaller than ``Lbox / 2``.
+
+    Like `~umachine_pyio.index_utils.CrossmatchIndex`, an index written to disk
+    with the `save` method, e.g., in ``root_dirname/cell_list``,
+    is memory-mapped by `PeriodicCellList.load`, and pickling a memory-mapped
+    index only sends the name of its directory.
+
+    Examples
+    --------
+    >>> Lbox = 250.0
+    >>> x, y, z = np.random.uniform(0, Lbox, (3, 10000))
+    >>> cell_list = PeriodicCellList(x, y, z, Lbox)
+    >>> idx_query, idx_point = cell_list.query_radius(x[:10], y[:10], z[:10], 5.0)
+    >>> num_neighbors = cell_list.count_within(x, y, z, 5.0)
+    >>> i, j = cell_list.pairs(2.0)
+    """
+
+    def __init__(self, x, y, z, Lbox, num_cells_per_dim=None):
+        msg = "Lbox must be positive"
+        assert Lbox > 0, msg
+        pos = np.mod(np.vstack((x, y, z)).T.astype(float), Lbox)
+        num_points = pos.shape[0]
+
+        if num_cells_per_dim is None:
+            num_cells_per_dim = np.cbrt(num_points / DEFAULT_POINTS_PER_CELL)
+            num_cells_per_dim = int(
+                np.clip(num_cells_per_dim, 1, MAX_NUM_CELLS_PER_DIM)
+            )
+        msg = "num_cells_per_dim must be a positive integer"
+        assert int(num_cells_per_dim) >= 1, msg
+
+        self.Lbox = float(Lbox)
+        self.num_cells_per_dim = int(num_cells_per_dim)
+        self.num_points = num_points
+        self.dirname = None
+
+        cell_id = self._cell_ids(pos)
+        order = np.argsort(cell_id, kind="stable")
+        counts = np.bincount(cell_id, minlength=self.num_cells_per_dim**3)
+        cell_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=cell_offsets[1:])
+        self._arrays = dict(
+            order=order, cell_offsets=cell_offsets, pos_sorted=pos[order]
+        )
+
+    @property
+    def cell_size(self):
+        return self.Lbox / self.num_cells_per_dim
+
+    def __len__(self):
+        return self.num_points
+
+    def query_radius(
+        self, x, y, z, r, num_workers=1, chunk_size=DEFAULT_QUERY_CHUNK_SIZE
+    ):
+        """Find the indexed points within distance r of each query point
+
+        Parameters
+        ----------
+        x, y, z : ndarrays of shape (m, )
+            Coordinates of the query points
+
+        r : float or ndarray of shape (m, )
+            Search radius of each query point
+
+        num_workers : int, optional
+            Number of threads. Default is 1.
+
+        chunk_size : int, optional
+            Number of query points processed at once by each thread
+
+        Returns
+        -------
+        idx_query : ndarray of shape (num_pairs, )
+            Index of the query point of each pair, in ascending order
+
+        idx_point : ndarray of shape (num_pairs, )
+            Index of the indexed point of each pair, in ascending order
+            for each query point
+        """
+        qpos, r = self._check_queries(x, y, z, r)
+
+        def query_chunk(a, b):
+            iq, ip, __ = self._pairs_of_chunk(qpos[a:b], r[a:b])
+            order = np.lexsort((ip, iq))
+            return iq[order] + a, ip[order]
+
+        results = _map_chunks(query_chunk, len(qpos), chunk_size, num_workers)
+        if len(results) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        idx_query = np.concatenate([result[0] for result in results])
+        idx_point = np.concatenate([result[1] for result in results])
+        return idx_query, idx_point
+
+    def count_within(
+        self, x, y, z, r, num_workers=1, chunk_size=DEFAULT_QUERY_CHUNK_SIZE
+    ):
+        """Count the indexed points within distance r of each query point.
+        Arguments are the same as `query_radius`.
+
+        Returns
+        -------
+        counts : ndarray of shape (m, )
+            Number of indexed points within r of each query point.
+            A query point that is also an indexed point counts itself.
+        """
+        qpos, r = self._check_queries(x, y, z, r)
+
+        def count_chunk(a, b):
+            iq, __, __ = self._pairs_of_chunk(qpos[a:b], r[a:b])
+            return np.bincount(iq, minlength=b - a)
+
+        results = _map_chunks(count_chunk, len(qpos), chunk_size, num_workers)
+        if len(results) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(results)
+
+    def pairs(
+        self,
+        rmax,
+        num_workers=1,
+        chunk_size=DEFAULT_QUERY_CHUNK_SIZE,
+        return_distances=False,
+    ):
+        """Enumerate every pair of indexed points separated by at most rmax
+
+        Parameters
+        ----------
+        rmax : float
+
+        num_workers : int, optional
+            Number of threads. Default is 1.
+
+        chunk_size : int, optional
+            Number of points whose pairs are searched at once by each thread
+
+        return_distances : bool, optional
+            If True, also return the distance of each pair. Default is False.
+
+        Returns
+        -------
+        i, j : ndarrays of shape (num_pairs, )
+            Indices of the points of each pair, with ``i < j``,
+            sorted by i and then by j
+
+        distances : ndarray of shape (num_pairs, )
+            Only returned if return_distances is True
+        """
+        pos_sorted = self._arrays["pos_sorted"]
+        order = self._arrays["order"]
+        rmax = self._check_radius(rmax)
+
+        def pairs_of_chunk(a, b):
+            r = np.full(b - a, rmax)
+            iq, ip, dist = self._pairs_of_chunk(pos_sorted[a:b], r)
+            i, j = order[iq + a], ip
+            keep = i < j
+            return i[keep], j[keep], dist[keep]
+
+        results = _map_chunks(pairs_of_chunk, self.num_points, chunk_size, num_workers)
+        if len(results) == 0:
+            i = j = np.zeros(0, dtype=np.int64)
+            dist = np.zeros(0)
+        else:
+            i, j, dist = (np.concatenate(arrs) for arrs in zip(*results))
+            sort = np.lexsort((j, i))
+            i, j, dist = i[sort], j[sort], dist[sort]
+        if return_distances:
+            return i, j, dist
+        return i, j
+
+    def counts_in_cells(self, num_cells_per_dim):
+        """Count the indexed points in each cell of a regular grid
+
+        Parameters
+        ----------
+        num_cells_per_dim : int
+            Number of cells of the grid along each dimension,
+            independent of the cells of the index
+
+        Returns
+        -------
+        counts : ndarray of shape (num_cells_per_dim, num_cells_per_dim, num_cells_per_dim)
+            Number of points in each cell, indexed by the cell along x, y and z
+        """
+        ngrid = int(num_cells_per_dim)
+        cell_id = _cell_ids(self._arrays["pos_sorted"], self.Lbox, ngrid)
+        counts = np.bincount(cell_id, minlength=ngrid**3)
+        return counts.reshape((ngrid, ngrid, ngrid))
+
+    def save(self, dirname):
+        """Write the index to disk so that it can be memory-mapped with `load`
+
+        Parameters
+        ----------
+        dirname : string
+            Directory that will store one memmap column per array of the index,
+            e.g., ``os.path.join(root_dirname, CELL_LIST_DIRNAME)``
+        """
+        os.makedirs(dirname, exist_ok=True)
+        for name, arr in self._arrays.items():
+            write_column_to_memmap(arr, dirname, name)
+
+        info_fname = os.path.join(dirname, CELL_LIST_INFO_BASENAME)
+        with open(info_fname, "w") as f:
+            f.write("Lbox " + repr(self.Lbox) + "\n")
+            f.write("num_cells_per_dim " + str(self.num_cells_per_dim) + "\n")
+            f.write("num_points " + str(self.num_points) + "\n")
+
+    @classmethod
+    def load(cls, dirname, mode="r"):
+        """Memory-map an index written to disk with the `save` method
+
+        Parameters
+        ----------
+        dirname : string
+            Directory passed to `save`
+
+        mode : string, optional
+            Mode of the memory maps. Default is ``r``.
+
+        Returns
+        -------
+        cell_list : PeriodicCellList
+        """
+        info = dict()
+        with open(os.path.join(dirname, CELL_LIST_INFO_BASENAME), "r") as f:
+            for raw_line in f:
+                key, val = raw_line.strip().split()
+                info[key] = val
+
+        cell_list = cls.__new__(cls)
+        cell_list.Lbox = float(info["Lbox"])
+        cell_list.num_cells_per_dim = int(info["num_cells_per_dim"])
+        cell_list.num_points = int(info["num_points"])
+        cell_list.dirname = dirname
+        cell_list._arrays = dict()
+        for name in _CELL_LIST_ARRAY_NAMES:
+            memmap_fname = os.path.join(dirname, name, name + ".memmap")
+            shape_fname = os.path.join(dirname, name, name + "_shape_and_dtype.txt")
+            shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+            if shape[0] == 0:
+                cell_list._arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                cell_list._arrays[name] = np.memmap(
+                    memmap_fname, shape=shape, dtype=dtype, mode=mode
+                )
+        return cell_list
+
+    def __getstate__(self):
+        if self.dirname is None:
+            return self.__dict__
+        else:
+            return dict(dirname=self.dirname)
+
+    def __setstate__(self, state):
+        if "_arrays" in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(PeriodicCellList.load(state["dirname"]).__dict__)
+
+    def _cell_ids(self, pos):
+        return _cell_ids(pos, self.Lbox, self.num_cells_per_dim)
+
+    def _check_radius(self, r):
+        r = np.asarray(r, dtype=float)
+        msg = "Search radius must be non-negative and smaller than Lbox/2"
+        assert np.all(r >= 0) & np.all(r < self.Lbox / 2), msg
+        return r
+
+    def _check_queries(self, x, y, z, r):
+        qpos = np.mod(np.vstack((x, y, z)).T.astype(float), self.Lbox)
+        r = self._check_radius(r)
+        if r.ndim == 0:
+            r = np.full(len(qpos), float(r))
+        msg = "r must be a scalar or have the same length as the query points"
+        assert r.shape == (len(qpos),), msg
+        return qpos, r
+
+    def _pairs_of_chunk(self, qpos, r):
+        """Find the pairs of query points and indexed points within r
+
+        Returns
+        -------
+        iq : ndarray
+            Index of the query point of each pair within the chunk
+
+        ip : ndarray
+            Index of the indexed point of each pair in the input order
+
+        dist : ndarray
+            Distance of each pair
+        """
+        cell_offsets = self._arrays["cell_offsets"]
+        pos_sorted = self._arrays["pos_sorted"]
+        order = self._arrays["order"]
+        ncell = self.num_cells_per_dim
+        num_queries = len(qpos)
+        if (num_queries == 0) | (self.num_points == 0):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        qcell = np.minimum((qpos / self.cell_size).astype(np.int64), ncell - 1)
+        num_neighbor_cells = int(np.ceil(r.max() / self.cell_size))
+        r2 = r * r
+        if 2 * num_neighbor_cells + 1 >= ncell:
+            # Every cell is visited exactly once
+            offsets = np.arange(ncell)
+            gap2 = dict((d, np.zeros((num_queries, 3))) for d in offsets)
+        else:
+            offsets = np.arange(-num_neighbor_cells, num_neighbor_cells + 1)
+            # Squared distance along each dimension between each query point
+            # and the nearest face of the neighbor cell, used to skip the cells
+            # farther than r from the query point
+            local = qpos - qcell * self.cell_size
+            gap2 = dict()
+            for d in offsets:
+                if d > 0:
+                    gap = d * self.cell_size - local
+                elif d < 0:
+                    gap = local + (-d - 1) * self.cell_size
+                else:
+                    gap = np.zeros_like(local)
+                gap2[d] = np.maximum(gap, 0) ** 2
+
+        iq_chunks, ip_chunks, d2_chunks = [], [], []
+        for dx, dy, dz in product(offsets, repeat=3):
+            is_reachable = gap2[dx][:, 0] + gap2[dy][:, 1] + gap2[dz][:, 2] <= r2
+            neighbor_cell = (qcell[:, 0] + dx) % ncell
+            neighbor_cell = neighbor_cell * ncell + (qcell[:, 1] + dy) % ncell
+            neighbor_cell = neighbor_cell * ncell + (qcell[:, 2] + dz) % ncell
+            start = cell_offsets[neighbor_cell]
+            counts = cell_offsets[neighbor_cell + 1] - start
+            counts = np.where(is_reachable, counts, 0)
+            num_candidates = int(counts.sum())
+            if num_candidates == 0:
+                continue
+
+            iq = np.repeat(np.arange(num_queries), counts)
+            first = np.cumsum(counts) - counts
+            isorted = np.repeat(start - first, counts) + np.arange(num_candidates)
+
+            d2 = np.zeros(num_candidates)
+            for idim in range(3):
+                dpos = np.abs(qpos[iq, idim] - pos_sorted[isorted, idim])
+                dpos = np.minimum(dpos, self.Lbox - dpos)
+                d2 += dpos * dpos
+            keep = d2 <= r2[iq]
+            iq_chunks.append(iq[keep])
+            ip_chunks.append(isorted[keep])
+            d2_chunks.append(d2[keep])
+
+        if len(iq_chunks) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+        iq = np.concatenate(iq_chunks)
+        ip = np.asarray(order[np.concatenate(ip_chunks)])
+        dist = np.sqrt(np.concatenate(d2_chunks))
+        return iq, ip, dist
+
+
+def _cell_ids(pos, Lbox, ncell):
+    """Private function returning the index of the cell of each point
+    on a grid of ncell**3 cells, in row-major order of the x, y and z cells
+    """
+    cells = np.minimum((pos * (ncell / Lbox)).astype(np.int64), ncell - 1)
+    return (cells[:, 0] * ncell + cells[:, 1]) * ncell + cells[:, 2]
+
+
+def _map_chunks(func, num_rows, chunk_size, num_workers):
+    """Private function applying ``func(a, b)`` to consecutive chunks
+    of rows, possibly in a pool of threads, and returning the list of results
+    in the order of the chunks
+    """
+    msg = "chunk_size must be a positive integer"
+    assert int(chunk_size) >= 1, msg
+    edges = list(range(0, num_rows, int(chunk_size))) + [num_rows]
+    chunks = list(zip(edges[:-1], edges[1:]))
+    if (num_workers is None) or (num_workers > 1):
+        with ThreadPoolExecutor(num_workers) as executor:
+            return list(executor.map(lambda chunk: func(*chunk), chunks))
+    return list(func(a, b) for a, b in chunks)
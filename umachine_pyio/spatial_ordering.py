@@ -0,0 +1,413 @@
+""" Module storing functions used to reorder the rows of each subvolume along
+a Morton curve of the galaxy positions, and to store the bounding box of
+each block of consecutive rows, so that reading the galaxies inside a box
+only touches the blocks that overlap the box.
+"""
+import os
+from itertools import product
+
+import numpy as np
+
+from .directory_tree_utils import memmap_fname_iterator, subvol_dirname_iterator
+from .load_mock import default_galprops, load_mock_from_binaries
+from .memmap_array_utils import (
+    TRIMMED_START_SUFFIX,
+    TRIMMED_VALUES_SUFFIX,
+    _read_column_of_subvolume,
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+    write_column_to_memmap,
+)
+
+SPATIAL_BLOCKS_DIRNAME = "spatial_blocks"
+ORIGINAL_ROW_COLNAME = "original_row"
+DEFAULT_BLOCK_SIZE = 4096
+MORTON_BITS_PER_DIM = 21
+
+__all__ = (
+    "morton_keys",
+    "spatial_ordering",
+    "reorder_subvolume_rows",
+    "write_spatial_blocks",
+    "box_row_selections",
+    "load_mock_in_box",
+)
+
+
+def morton_keys(x, y, z, bits_per_dim=MORTON_BITS_PER_DIM):
+    """Calculate the Morton key of each point by interleaving the bits of its
+    coordinates, quantized on a grid spanning the bounding cube of the points
+
+    Parameters
+    ----------
+    x, y, z : ndarrays of shape (n, )
+
+    bits_per_dim : int, optional
+        Number of bits of each quantized coordinate, at most 21. Default is 21.
+
+    Returns
+    -------
+    keys : ndarray of shape (n, )
+        uint64 array. Points that are close in the sorted order of keys
+        are close in space.
+    """
+    msg = "bits_per_dim must be between 1 and 21"
+    assert 1 <= bits_per_dim <= MORTON_BITS_PER_DIM, msg
+    pos = np.vstack((x, y, z)).astype(float)
+    if pos.shape[1] == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    lo = pos.min(axis=1)
+    span = (pos.max(axis=1) - lo).max()
+    num_cells = 2**bits_per_dim
+    scale = (num_cells - 1) / span if span > 0 else 0.0
+    cells = ((pos - lo[:, np.newaxis]) * scale).astype(np.uint64)
+
+    keys = np.zeros(pos.shape[1], dtype=np.uint64)
+    for idim in range(3):
+        keys |= _spread_bits(cells[idim]) << np.uint64(2 - idim)
+    return keys
+
+
+def spatial_ordering(x, y, z):
+    """Permutation sorting the input points along a Morton curve
+
+    Returns
+    -------
+    perm : ndarray of shape (n, )
+        ``x[perm]`` is the x-coordinate of the points in the Morton order.
+        Points with the same key keep their input order.
+    """
+    return np.argsort(morton_keys(x, y, z), kind="stable")
+
+
+def reorder_subvolume_rows(root_dirname, subvolumes, block_size=DEFAULT_BLOCK_SIZE):
+    """Reorder the rows of every column of each subvolume along a Morton curve
+    of the ``x``, ``y`` and ``z`` columns, and store the bounding boxes of
+    blocks of consecutive rows with `write_spatial_blocks`
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    block_size : int, optional
+        Number of rows per block. Default is 4096.
+
+    Notes
+    -----
+    The same permutation is applied to every column of the subvolume,
+    including history columns and both columns of trimmed histories.
+    The ``host_row`` column is remapped to the new row of each host.
+    The ``original_row`` column stores the row of each galaxy in the
+    ASCII catalog, so that the input order can be recovered.
+
+    Indexes storing rows of the subvolumes, such as a
+    `~umachine_pyio.snapshot_linking.SnapshotLinkingIndex`,
+    a `~umachine_pyio.halo_id_index.HaloIDIndex` or the index of
+    `~umachine_pyio.subsample_utils.write_subsample_index`,
+    must be rebuilt after reordering.
+    Each column is rewritten in place, so an interrupted reordering
+    leaves the subvolume inconsistent and it must be reduced again.
+    """
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        x, y, z = (_read_column_of_subvolume(subvol_dirname, key) for key in "xyz")
+        num_rows = len(x)
+        if not _column_exists(subvol_dirname, ORIGINAL_ROW_COLNAME):
+            original_row = np.arange(num_rows, dtype=np.int64)
+            write_column_to_memmap(original_row, subvol_dirname, ORIGINAL_ROW_COLNAME)
+
+        perm = spatial_ordering(x, y, z)
+        for colname in _subvolume_colnames(subvol_dirname):
+            _permute_column(subvol_dirname, colname, perm)
+        write_spatial_blocks(root_dirname, [subvol], block_size)
+
+
+def write_spatial_blocks(root_dirname, subvolumes, block_size=DEFAULT_BLOCK_SIZE):
+    """Store the bounding box of each block of ``block_size`` consecutive rows
+    of each subvolume in ``root_dirname/spatial_blocks/subvol_N``
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    block_size : int, optional
+        Number of rows per block. Default is 4096.
+
+    Notes
+    -----
+    The blocks are valid for any row order, but a spatial query only skips
+    many blocks once the rows have been reordered with `reorder_subvolume_rows`.
+    The block table of each subvolume stores three columns:
+    ``block_offsets`` of shape (num_blocks+1, ) storing the first row of each
+    block followed by the number of rows, and ``block_min`` and ``block_max``
+    of shape (num_blocks, 3).
+    """
+    msg = "block_size must be a positive integer"
+    assert int(block_size) >= 1, msg
+    block_size = int(block_size)
+
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        pos = np.vstack(
+            [_read_column_of_subvolume(subvol_dirname, key) for key in "xyz"]
+        ).T
+        num_rows = pos.shape[0]
+        block_offsets = np.append(np.arange(0, num_rows, block_size), num_rows)
+        if num_rows == 0:
+            block_min = block_max = np.zeros((0, 3))
+        else:
+            block_min = np.minimum.reduceat(pos, block_offsets[:-1], axis=0)
+            block_max = np.maximum.reduceat(pos, block_offsets[:-1], axis=0)
+
+        blocks_dirname = _spatial_blocks_dirname(root_dirname, subvol)
+        write_column_to_memmap(
+            block_offsets.astype(np.int64), blocks_dirname, "block_offsets"
+        )
+        write_column_to_memmap(block_min, blocks_dirname, "block_min")
+        write_column_to_memmap(block_max, blocks_dirname, "block_max")
+
+
+def box_row_selections(subvolumes, root_dirname, box_min, box_max, Lbox=None):
+    """Determine the rows of each subvolume storing galaxies inside a box,
+    reading positions only from the blocks that overlap the box
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+        Each subvolume must have a block table, see `write_spatial_blocks`.
+
+    box_min, box_max : sequences of length 3
+        Galaxies with ``box_min <= pos < box_max`` in every dimension are selected
+
+    Lbox : float, optional
+        Size of the periodic box. If passed, a box extending beyond
+        ``[0, Lbox)`` wraps around the periodic boundaries.
+        Default is to not apply periodic boundary conditions.
+
+    Returns
+    -------
+    row_selections : list of ndarrays
+        Sorted rows of each subvolume inside the box, as accepted by
+        `~umachine_pyio.load_mock.load_mock_from_binaries`
+    """
+    boxes = _periodic_boxes(box_min, box_max, Lbox)
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+
+    row_selections = []
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        blocks_dirname = _spatial_blocks_dirname(root_dirname, subvol)
+        msg = "No spatial blocks for subvolume {0}: call write_spatial_blocks first"
+        assert os.path.isdir(blocks_dirname), msg.format(subvol)
+        block_offsets = _read_column_of_subvolume(blocks_dirname, "block_offsets")
+        block_min = _read_column_of_subvolume(blocks_dirname, "block_min")
+        block_max = _read_column_of_subvolume(blocks_dirname, "block_max")
+
+        overlaps = np.zeros(len(block_min), dtype=bool)
+        for lo, hi in boxes:
+            overlaps |= np.all(block_max >= lo, axis=1) & np.all(block_min < hi, axis=1)
+        iblocks = np.flatnonzero(overlaps)
+        lengths = block_offsets[iblocks + 1] - block_offsets[iblocks]
+        candidate_rows = np.repeat(
+            block_offsets[iblocks] - np.cumsum(lengths) + lengths, lengths
+        )
+        candidate_rows += np.arange(len(candidate_rows))
+
+        pos = np.vstack(
+            [
+                _read_rows_of_subvolume(root_dirname, key, subvol, candidate_rows)
+                for key in "xyz"
+            ]
+        ).T
+        inside = np.zeros(len(candidate_rows), dtype=bool)
+        for lo, hi in boxes:
+            inside |= np.all((pos >= lo) & (pos < hi), axis=1)
+        row_selections.append(candidate_rows[inside])
+    return row_selections
+
+
+def load_mock_in_box(
+    subvolumes, root_dirname, box_min, box_max, galprops=default_galprops, Lbox=None
+):
+    """Load the galaxies of the mock inside a box
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    box_min, box_max : sequences of length 3
+        See `box_row_selections`
+
+    galprops : sequence of strings, optional
+        See `~umachine_pyio.load_mock.load_mock_from_binaries`
+
+    Lbox : float, optional
+        See `box_row_selections`
+
+    Returns
+    -------
+    mock : Astropy Table
+        Galaxies inside the box, in the order of their rows in each subvolume
+
+    Examples
+    --------
+    >>> mock = load_mock_in_box(range(144), root_dirname, (0, 0, 0), (20, 20, 20))  # doctest: +SKIP
+    """
+    subvolumes = list(subvolumes)
+    row_selections = box_row_selections(
+        subvolumes, root_dirname, box_min, box_max, Lbox
+    )
+    return load_mock_from_binaries(
+        subvolumes, root_dirname, galprops, row_selections=row_selections
+    )
+
+
+def _spread_bits(cells):
+    """Private function inserting two zero bits between each of the
+    21 lowest bits of the input uint64 array
+    """
+    v = cells.astype(np.uint64) & np.uint64(0x1FFFFF)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+
+def _spatial_blocks_dirname(root_dirname, subvol):
+    return os.path.join(root_dirname, SPATIAL_BLOCKS_DIRNAME, "subvol_" + str(subvol))
+
+
+def _column_exists(subvol_dirname, colname):
+    shape_fname = os.path.join(
+        subvol_dirname, colname, colname + "_shape_and_dtype.txt"
+    )
+    return os.path.isfile(shape_fname)
+
+
+def _subvolume_colnames(subvol_dirname):
+    """Private function returning the name of every column of the subvolume,
+    with the values of trimmed histories before every other column,
+    since their permutation requires the start column in the input order
+    """
+    colnames = sorted(
+        colname
+        for colname in os.listdir(subvol_dirname)
+        if _column_exists(subvol_dirname, colname)
+    )
+    return sorted(colnames, key=lambda c: not c.endswith(TRIMMED_VALUES_SUFFIX))
+
+
+def _permute_column(subvol_dirname, colname, perm):
+    """Private function rewriting the rows of a column in the order of perm"""
+    if colname.endswith(TRIMMED_VALUES_SUFFIX):
+        history_colname = colname[: -len(TRIMMED_VALUES_SUFFIX)]
+        start_colname = history_colname + TRIMMED_START_SUFFIX
+        msg = "Column ``{0}`` has no ``{1}`` column"
+        assert _column_exists(subvol_dirname, start_colname), msg.format(
+            colname, start_colname
+        )
+        start = _read_column_of_subvolume(subvol_dirname, start_colname)
+        values = _read_column_of_subvolume(subvol_dirname, colname)
+        arr = _permute_trimmed_values(start, values, perm)
+    else:
+        arr = _read_column_of_subvolume(subvol_dirname, colname)
+        msg = "Column ``{0}`` has {1} rows but the subvolume has {2}"
+        assert len(arr) == len(perm), msg.format(colname, len(arr), len(perm))
+        arr = arr[perm]
+        if colname == "host_row":
+            arr = _remap_rows(arr, perm)
+    write_column_to_memmap(arr, subvol_dirname, colname)
+
+
+def _permute_trimmed_values(start, values, perm):
+    """Private function reordering the values of a trimmed history column,
+    see `~umachine_pyio.memmap_array_utils.trim_history`, with rows in the
+    order of perm. The input start column is in the input order.
+    """
+    num_rows = len(start)
+    if num_rows == 0:
+        return values
+    start = start.astype(np.int64)
+    num_scales = (len(values) + int(start.sum())) // num_rows
+    lengths = num_scales - start
+    offsets = np.cumsum(lengths) - lengths
+    permuted_lengths = lengths[perm]
+    permuted_offsets = np.cumsum(permuted_lengths) - permuted_lengths
+    idx_values = np.repeat(offsets[perm] - permuted_offsets, permuted_lengths)
+    idx_values += np.arange(len(idx_values))
+    return values[idx_values]
+
+
+def _remap_rows(rows, perm):
+    """Private function converting rows in the input order into rows
+    in the order of perm, keeping negative rows
+    """
+    new_row_of_old_row = np.empty(len(perm), dtype=np.int64)
+    new_row_of_old_row[perm] = np.arange(len(perm))
+    return np.where(rows >= 0, new_row_of_old_row[np.maximum(rows, 0)], rows)
+
+
+def _read_rows_of_subvolume(root_dirname, colname, subvol, rows):
+    memmap_fname, shape_fname = next(
+        memmap_fname_iterator(root_dirname, colname, subvol)
+    )
+    if read_shape_and_dtype_from_ascii(shape_fname)[0][0] == 0:
+        return np.zeros(0)
+    return read_ndarray_from_memmap_sequence([memmap_fname], [shape_fname], [rows])
+
+
+def _periodic_boxes(box_min, box_max, Lbox):
+    """Private function splitting a box extending beyond the periodic boundaries
+    into a list of ``(lo, hi)`` boxes inside ``[0, Lbox)``
+    """
+    box_min = np.asarray(box_min, dtype=float)
+    box_max = np.asarray(box_max, dtype=float)
+    msg = "box_min and box_max must have length 3 with box_min <= box_max"
+    assert (box_min.shape == (3,)) & (box_max.shape == (3,)), msg
+    assert np.all(box_min <= box_max), msg
+    if Lbox is None:
+        return [(box_min, box_max)]
+
+    intervals = []
+    for lo, hi in zip(box_min, box_max):
+        if hi - lo >= Lbox:
+            intervals.append([(0.0, Lbox)])
+            continue
+        lo_wrapped = np.mod(lo, Lbox)
+        hi_wrapped = lo_wrapped + (hi - lo)
+        if hi_wrapped <= Lbox:
+            intervals.append([(lo_wrapped, hi_wrapped)])
+        else:
+            intervals.append([(lo_wrapped, Lbox), (0.0, hi_wrapped - Lbox)])
+
+    boxes = []
+    for dims in product(*intervals):
+        lo = np.array([interval[0] for interval in dims])
+        hi = np.array([interval[1] for interval in dims])
+        boxes.append((lo, hi))
+    return boxes
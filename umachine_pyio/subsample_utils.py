@@ -0,0 +1,293 @@
+""" Module storing functions used to load a reproducible subsample of the mock,
+e.g., 1% of the galaxies of a snapshot for quick-look plots,
+reading only the selected rows of each column.
+"""
+import os
+
+import numpy as np
+
+from .directory_tree_utils import subvol_dirname_iterator
+from .load_mock import default_galprops, load_mock_from_binaries
+from .memmap_array_utils import (
+    _read_column_of_subvolume,
+    read_ndarray_from_memmap_sequence,
+    read_shape_and_dtype_from_ascii,
+    write_column_to_memmap,
+)
+
+SUBSAMPLE_INDEX_DIRNAME = "subsample_index"
+DEFAULT_SUBSAMPLE_SEED = 43
+
+__all__ = (
+    "hash_uniform",
+    "subsample_row_selections",
+    "load_subsample_from_binaries",
+    "write_subsample_index",
+)
+
+
+def hash_uniform(ids, seed=DEFAULT_SUBSAMPLE_SEED):
+    """Map each integer ID to a pseudo-random number in [0, 1)
+    with the splitmix64 hash, so that the same ID is always mapped
+    to the same number for a given seed
+
+    Parameters
+    ----------
+    ids : integer ndarray of shape (n, )
+
+    seed : int, optional
+        Default is 43
+
+    Returns
+    -------
+    u : ndarray of shape (n, )
+        Uniformly distributed float64 array
+    """
+    ids = np.asarray(ids).astype(np.int64).view(np.uint64)
+    key = _splitmix64(np.array([seed], dtype=np.uint64))[0]
+    hashed = _splitmix64(ids ^ key)
+    return (hashed >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def write_subsample_index(
+    root_dirname, subvolumes, seed=DEFAULT_SUBSAMPLE_SEED, hash_colname="halo_id"
+):
+    """Store the rows of each subvolume sorted by the hash of their ID,
+    so that a hash subsample of any fraction is found without reading
+    the ID column, see `subsample_row_selections`
+
+    Parameters
+    ----------
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    subvolumes : sequence of integers
+        Sequence of subvolume labels to process
+
+    seed : int, optional
+        Seed of the hash. Default is 43.
+
+    hash_colname : string, optional
+        Name of the integer column that is hashed. Default is ``halo_id``.
+
+    Notes
+    -----
+    The index of each subvolume is stored in
+    ``root_dirname/subsample_index/<hash_colname>_seed_<seed>/subvol_N``
+    as two columns: ``hash_sorted`` storing the sorted hashes of the subvolume,
+    and ``rows_by_hash`` storing the row of each hash.
+    The index must be rebuilt if the rows of the subvolumes are reordered;
+    `subsample_row_selections` raises a ValueError when it detects
+    a stale index.
+    """
+    subvolumes = list(subvolumes)
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        ids = _read_column_of_subvolume(subvol_dirname, hash_colname)
+        u = hash_uniform(ids, seed)
+        rows_by_hash = np.argsort(u, kind="stable")
+        index_dirname = _subsample_index_dirname(
+            root_dirname, subvol, seed, hash_colname
+        )
+        write_column_to_memmap(u[rows_by_hash], index_dirname, "hash_sorted")
+        write_column_to_memmap(rows_by_hash, index_dirname, "rows_by_hash")
+
+
+def subsample_row_selections(
+    subvolumes,
+    root_dirname,
+    fraction,
+    method="hash",
+    seed=DEFAULT_SUBSAMPLE_SEED,
+    hash_colname="halo_id",
+):
+    """Select a deterministic subsample of the rows of each subvolume
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    fraction : float
+        Fraction of the rows to select, between 0 and 1
+
+    method : string, optional
+        Either ``hash`` to select the galaxies whose ID hashes to a number
+        below fraction, see `hash_uniform`, or ``stride`` to select every
+        ``round(1/fraction)``-th row of each subvolume. Default is ``hash``.
+
+    seed : int, optional
+        Seed of the hash. Ignored when method is ``stride``. Default is 43.
+
+    hash_colname : string, optional
+        Name of the integer column that is hashed. Default is ``halo_id``.
+        Ignored when method is ``stride``.
+
+    Returns
+    -------
+    row_selections : list
+        Rows of each subvolume, as accepted by
+        `~umachine_pyio.load_mock.load_mock_from_binaries`:
+        slices for ``stride``, and sorted integer arrays for ``hash``
+
+    Notes
+    -----
+    The hash subsample of a given seed only depends on the IDs,
+    so the same galaxies are selected for every column, for every subvolume
+    partition, and across snapshots for a column storing the same ID of a
+    galaxy in every snapshot. Subsamples are nested: the subsample of
+    a smaller fraction is a subset of the subsample of a larger fraction.
+
+    When the index of `write_subsample_index` exists, the selected rows
+    are found by a binary search in the memory-mapped index, reading about
+    ``fraction`` of the index, and only the ID of the selected rows is read
+    to check that the index is up to date. Otherwise the ID column of each
+    subvolume is read in full and hashed.
+    """
+    fraction = float(fraction)
+    msg = "fraction must be between 0 and 1"
+    assert 0 <= fraction <= 1, msg
+
+    subvolumes = list(subvolumes)
+    if method == "stride":
+        if fraction == 0:
+            return [slice(0, 0) for __ in subvolumes]
+        step = max(int(round(1 / fraction)), 1)
+        return [slice(None, None, step) for __ in subvolumes]
+    elif method != "hash":
+        msg = "Input method = ``{0}`` must be either ``hash`` or ``stride``"
+        raise ValueError(msg.format(method))
+
+    row_selections = []
+    subvol_dirnames = subvol_dirname_iterator(root_dirname, *subvolumes)
+    for subvol, subvol_dirname in zip(subvolumes, subvol_dirnames):
+        index_dirname = _subsample_index_dirname(
+            root_dirname, subvol, seed, hash_colname
+        )
+        if os.path.isdir(index_dirname):
+            rows = _rows_below_fraction_in_index(
+                index_dirname, subvol_dirname, fraction, seed, hash_colname
+            )
+        else:
+            ids = _read_column_of_subvolume(subvol_dirname, hash_colname)
+            rows = np.flatnonzero(hash_uniform(ids, seed) < fraction)
+        row_selections.append(rows)
+    return row_selections
+
+
+def load_subsample_from_binaries(
+    subvolumes,
+    root_dirname,
+    fraction,
+    galprops=default_galprops,
+    method="hash",
+    seed=DEFAULT_SUBSAMPLE_SEED,
+    hash_colname="halo_id",
+):
+    """Load a deterministic subsample of the mock catalog into memory,
+    reading only the selected rows of each column
+
+    Parameters
+    ----------
+    subvolumes : sequence of integers
+        Sequence of subvolume labels
+
+    root_dirname : string
+        Name of the parent directory of the collection
+        subdirectories with names ``subvol_0``, ``subvol_1``, ``subvol_2``, etc.
+
+    fraction : float
+        Fraction of the galaxies to load, between 0 and 1
+
+    galprops : sequence of strings, optional
+        See `~umachine_pyio.load_mock.load_mock_from_binaries`
+
+    method, seed, hash_colname : optional
+        See `subsample_row_selections`
+
+    Returns
+    -------
+    mock : Astropy Table
+        Table of the subsample of galaxies, in the order of their rows
+        in each subvolume. The ``host_row`` column is -1 for galaxies
+        whose host is not in the subsample.
+
+    Examples
+    --------
+    >>> mock = load_subsample_from_binaries(range(144), root_dirname, 0.01)  # doctest: +SKIP
+    """
+    subvolumes = list(subvolumes)
+    row_selections = subsample_row_selections(
+        subvolumes, root_dirname, fraction, method, seed, hash_colname
+    )
+    return load_mock_from_binaries(
+        subvolumes, root_dirname, galprops, row_selections=row_selections
+    )
+
+
+def _splitmix64(x):
+    """Private function returning the splitmix64 hash of each element
+    of the input uint64 array
+    """
+    with np.errstate(over="ignore"):
+        z = x + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _subsample_index_dirname(root_dirname, subvol, seed, hash_colname):
+    return os.path.join(
+        root_dirname,
+        SUBSAMPLE_INDEX_DIRNAME,
+        "{0}_seed_{1}".format(hash_colname, seed),
+        "subvol_" + str(subvol),
+    )
+
+
+def _rows_below_fraction_in_index(
+    index_dirname, subvol_dirname, fraction, seed, hash_colname
+):
+    """Private function returning the sorted rows with hash below fraction,
+    reading only the beginning of the memory-mapped index and the ID
+    of the selected rows, which are hashed again to detect a stale index
+    """
+    memmaps = dict()
+    for name in ("hash_sorted", "rows_by_hash"):
+        memmap_fname = os.path.join(index_dirname, name, name + ".memmap")
+        shape_fname = os.path.join(index_dirname, name, name + "_shape_and_dtype.txt")
+        shape, dtype = read_shape_and_dtype_from_ascii(shape_fname)
+        if shape[0] == 0:
+            memmaps[name] = np.zeros(shape, dtype=dtype)
+        else:
+            memmaps[name] = np.memmap(memmap_fname, shape=shape, dtype=dtype, mode="r")
+
+    ids_shape_fname = os.path.join(
+        subvol_dirname, hash_colname, hash_colname + "_shape_and_dtype.txt"
+    )
+    num_rows = read_shape_and_dtype_from_ascii(ids_shape_fname)[0][0]
+    msg = "The subsample index {0} is stale. Rebuild it with write_subsample_index"
+    msg = msg.format(index_dirname)
+    if len(memmaps["rows_by_hash"]) != num_rows:
+        raise ValueError(msg)
+    if num_rows == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    num_selected = np.searchsorted(memmaps["hash_sorted"], fraction, side="left")
+    rows_by_hash = np.array(memmaps["rows_by_hash"][:num_selected])
+    rows = np.sort(rows_by_hash)
+    ids = read_ndarray_from_memmap_sequence(
+        [os.path.join(subvol_dirname, hash_colname, hash_colname + ".memmap")],
+        [ids_shape_fname],
+        [rows],
+    )
+    hashes = hash_uniform(ids, seed)
+    expected = memmaps["hash_sorted"][:num_selected][np.argsort(rows_by_hash)]
+    if np.any(hashes != expected):
+        raise ValueError(msg)
+    return rows
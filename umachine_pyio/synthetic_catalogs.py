@@ -0,0 +1,279 @@
+""" Module storing functions used to generate synthetic UniverseMachine
+star formation history catalogs with the same ASCII layout as the real outputs,
+using the headers stored in ``example_headers``.
+The catalogs are used to test and benchmark the I/O of the package
+on machines without access to the real data.
+"""
+import gzip
+import os
+
+import numpy as np
+
+from .index_utils import ORPHAN_ID_OFFSET
+from .process_ascii_into_memmap import _retrieve_scale_list
+
+EXAMPLE_HEADERS_DIRNAME = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "example_headers"
+)
+EXAMPLE_COLUMN_INFO_FNAME = os.path.join(
+    EXAMPLE_HEADERS_DIRNAME, "sfh_ascii_header_column_info.dat"
+)
+NUM_SCALAR_COLUMNS = 24
+NUM_HISTORY_COLUMNS = 8
+
+__all__ = (
+    "example_header_fname",
+    "write_synthetic_column_info",
+    "write_synthetic_sfh_catalog",
+    "write_synthetic_sfh_catalogs",
+)
+
+
+def example_header_fname(scale_factor):
+    """Filename of the example header of the input snapshot
+
+    Parameters
+    ----------
+    scale_factor : string
+        Scale factor of the snapshot, e.g., ``1.002310``.
+        Available scale factors are ``0.399872``, ``0.668185`` and ``1.002310``.
+    """
+    fname = os.path.join(EXAMPLE_HEADERS_DIRNAME, "header_a_" + scale_factor + ".txt")
+    msg = "No example header for scale factor ``{0}``".format(scale_factor)
+    assert os.path.isfile(fname), msg
+    return fname
+
+
+def write_synthetic_column_info(output_fname, with_history_flags=True):
+    """Write the column information file of the synthetic catalogs
+
+    Parameters
+    ----------
+    output_fname : string
+
+    with_history_flags : bool, optional
+        If True, each line stores ``colname dtype is_history`` as required by
+        `~umachine_pyio.process_ascii_into_memmap.write_ascii_to_memmap_tree`.
+        If False, each line stores ``colname dtype`` as required by
+        `~umachine_pyio.process_ascii_file_into_binaries.write_ascii_to_memmap_tree`.
+        Default is True.
+    """
+    with open(EXAMPLE_COLUMN_INFO_FNAME, "r") as f:
+        lines = [raw_line.strip() for raw_line in f if raw_line.strip()]
+    with open(output_fname, "w") as f:
+        for icol, line in enumerate(lines):
+            if with_history_flags:
+                line = line + " " + str(int(icol >= NUM_SCALAR_COLUMNS))
+            f.write(line + "\n")
+
+
+def write_synthetic_sfh_catalog(
+    output_fname,
+    num_gals,
+    scale_factor="1.002310",
+    Lbox=250.0,
+    seed=43,
+    compress=False,
+    chunk_size=10000,
+):
+    """Write a synthetic star formation history catalog
+
+    Parameters
+    ----------
+    output_fname : string
+        Name of the output ASCII file
+
+    num_gals : int
+        Number of galaxies in the catalog
+
+    scale_factor : string, optional
+        Scale factor of the example header to use. Default is ``1.002310``.
+
+    Lbox : float, optional
+        Size of the periodic box in Mpc/h. Default is 250.
+
+    seed : int, optional
+        Random number seed. Default is 43.
+
+    compress : bool, optional
+        If True, the output file is gzip-compressed. Default is False.
+
+    chunk_size : int, optional
+        Number of rows whose histories are generated at once, bounding memory use.
+        The random histories depend on both seed and chunk_size.
+
+    Notes
+    -----
+    The catalog reproduces the layout of the real outputs: 24 scalar columns
+    followed by 8 history blocks of ``num_scales`` columns each.
+    About 70% of the galaxies are centrals with ``upid = -1``; satellites are
+    placed near their host, and about 5% of the IDs are orphan IDs
+    encoding the number of snapshots since merging.
+    Histories are zero before a random formation snapshot,
+    and the stellar mass histories are cumulative sums of the SFR histories.
+    """
+    header_fname = example_header_fname(scale_factor)
+    with open(header_fname, "r") as f:
+        header = "".join(line for line in f if line[0] == "#")
+    num_scales = len(_retrieve_scale_list(header_fname))
+
+    rng = np.random.RandomState(seed)
+    scalars = _synthetic_scalar_columns(rng, num_gals, Lbox)
+    formation_index = rng.randint(0, max(num_scales // 2, 1), num_gals)
+    quenching_index = rng.randint(num_scales // 2, 2 * num_scales, num_gals)
+
+    fmt = " ".join(
+        ["%d", "%d"]
+        + ["%.6g"] * (NUM_SCALAR_COLUMNS - 2)
+        + ["%.6g"] * (NUM_HISTORY_COLUMNS * num_scales)
+    )
+    opener = gzip.open if compress else open
+    with opener(output_fname, "wt") as f:
+        f.write(header)
+        for ifirst in range(0, num_gals, chunk_size):
+            rows = slice(ifirst, min(ifirst + chunk_size, num_gals))
+            histories = _synthetic_history_blocks(
+                rng,
+                scalars[rows],
+                formation_index[rows],
+                quenching_index[rows],
+                num_scales,
+            )
+            data = np.concatenate((scalars[rows], histories), axis=1)
+            np.savetxt(f, data, fmt=fmt)
+
+
+def write_synthetic_sfh_catalogs(
+    output_dirname,
+    num_subvols,
+    num_gals_per_subvol,
+    scale_factor="1.002310",
+    compress=False,
+    seed=43,
+):
+    """Write one synthetic catalog per subvolume with the filename pattern
+    ``sfh_catalog_<scale_factor>.<subvol>.txt`` of the real outputs,
+    with an additional ``.gz`` extension if compressed
+
+    Returns
+    -------
+    fnames : list of strings
+        Name of the catalog of each subvolume
+    """
+    os.makedirs(output_dirname, exist_ok=True)
+    fnames = []
+    for subvol in range(num_subvols):
+        basename = "sfh_catalog_{0}.{1}.txt".format(scale_factor, subvol)
+        if compress:
+            basename = basename + ".gz"
+        fname = os.path.join(output_dirname, basename)
+        write_synthetic_sfh_catalog(
+            fname,
+            num_gals_per_subvol,
+            scale_factor=scale_factor,
+            seed=seed + subvol,
+            compress=compress,
+        )
+        fnames.append(fname)
+    return fnames
+
+
+def _synthetic_scalar_columns(rng, num_gals, Lbox):
+    """Private function returning an array of shape (num_gals, 24) storing the
+    scalar columns of the catalog in the order of the header
+    """
+    halo_id = rng.permutation(np.arange(1, num_gals + 1)) * 50
+    halo_id += rng.randint(0, 50, num_gals)
+    #  Orphan IDs stay below 2**53 so that they are exact in the float64 array
+    is_orphan = rng.uniform(size=num_gals) < 0.05
+    halo_id[is_orphan] += rng.randint(1, 9, is_orphan.sum()) * ORPHAN_ID_OFFSET
+
+    is_central = rng.uniform(size=num_gals) < 0.7
+    is_central[0] = True
+    central_rows = np.flatnonzero(is_central)
+    host_row = np.where(
+        is_central, np.arange(num_gals), rng.choice(central_rows, num_gals)
+    )
+    upid = np.where(is_central, -1, halo_id[host_row])
+
+    central_pos = rng.uniform(0, Lbox, (num_gals, 3))
+    pos = central_pos[host_row] + np.where(
+        is_central[:, np.newaxis], 0.0, rng.normal(0, 0.5, (num_gals, 3))
+    )
+    pos = np.mod(pos, Lbox)
+    vel = rng.normal(0, 300, (num_gals, 3))
+
+    mpeak = 10 ** rng.uniform(10.5, 15, num_gals)
+    mpeak[~is_central] = np.minimum(mpeak[~is_central], mpeak[host_row[~is_central]])
+    mvir = np.where(is_central, mpeak, mpeak * rng.uniform(0.1, 1, num_gals))
+    vmax_at_mpeak = 200 * (mpeak / 1e12) ** (1 / 3.0)
+    vmax = vmax_at_mpeak * (mvir / mpeak) ** (1 / 3.0)
+    rvir = 200 * (mvir / 1e12) ** (1 / 3.0)
+
+    sm = mpeak * 10 ** rng.normal(-2, 0.3, num_gals)
+    sfr = sm * 10 ** rng.normal(-10, 1, num_gals)
+    a_infall = np.where(is_central, -1.0, rng.uniform(0.2, 1, num_gals))
+
+    columns = (
+        halo_id,
+        upid,
+        *pos.T,
+        *vel.T,
+        mpeak,
+        mvir,
+        vmax_at_mpeak,
+        vmax,
+        rvir,
+        rng.uniform(0, 1, num_gals),
+        rng.normal(0, 1, num_gals),
+        rng.normal(0, 1, num_gals),
+        sm,
+        0.1 * sm * rng.uniform(size=num_gals),
+        sfr,
+        sm * 10 ** rng.normal(0, 0.1, num_gals),
+        sfr * 10 ** rng.normal(0, 0.1, num_gals),
+        -2.5 * np.log10(sfr + 1e-3) - 15,
+        a_infall,
+        np.where(is_central, -1.0, np.maximum(a_infall, rng.uniform(0.2, 1, num_gals))),
+    )
+    return np.array(columns, dtype=np.float64).T
+
+
+def _synthetic_history_blocks(
+    rng, scalars, formation_index, quenching_index, num_scales
+):
+    """Private function returning an array of shape (n, 8 * num_scales) storing
+    the history blocks of the catalog in the order of the header
+    """
+    num_gals = scalars.shape[0]
+    mpeak, sm = scalars[:, 8], scalars[:, 16]
+    scale_index = np.arange(num_scales)
+    is_formed = scale_index >= formation_index[:, np.newaxis]
+    is_quenched = scale_index >= quenching_index[:, np.newaxis]
+
+    sfr_history = 10 ** rng.normal(0, 0.3, (num_gals, num_scales))
+    sfr_history = np.where(is_quenched, 1e-3 * sfr_history, sfr_history) * is_formed
+    sm_history = np.cumsum(sfr_history, axis=1)
+    norm = sm / np.where(sm_history[:, -1] > 0, sm_history[:, -1], 1.0)
+    sm_history *= norm[:, np.newaxis]
+    sfr_history *= norm[:, np.newaxis] / 1e8
+
+    growth = (
+        np.cumsum(is_formed, axis=1)
+        / np.maximum(is_formed.sum(axis=1), 1)[:, np.newaxis]
+    )
+    mpeak_history = mpeak[:, np.newaxis] * growth
+    vmax_history = 200 * (mpeak_history / 1e12) ** (1 / 3.0)
+    dvmax_history = rng.normal(0, 1, (num_gals, num_scales)) * is_formed
+
+    blocks = (
+        sfr_history,
+        0.1 * sfr_history,
+        sm_history,
+        0.1 * sm_history,
+        mpeak_history,
+        sfr_history,
+        vmax_history,
+        dvmax_history,
+    )
+    return np.concatenate(blocks, axis=1)
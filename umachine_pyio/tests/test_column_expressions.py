@@ -0,0 +1,75 @@
+""" """
+
+import numpy as np
+import pytest
+
+from ..column_expressions import (
+    col,
+    evaluate_expression,
+    host_col,
+    where,
+    write_expression_column,
+)
+from ..load_mock import load_mock_from_binaries
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+
+
+def test_expressions_agree_with_the_loaded_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (0, 700, 0, 450)
+    write_fake_tree(root_dirname, nrows, trimmed_colnames=["sm_history"])
+    subvolumes = list(range(len(nrows)))
+    galprops = ["x", "obs_sm", "obs_sfr", "sm_history", "host_row"]
+    mock = load_mock_from_binaries(subvolumes, root_dirname, galprops)
+
+    ssfr = where(col("obs_sfr") > 0, col("obs_sfr") / col("obs_sm"), 1e-12)
+    log_ssfr = np.log10(ssfr)
+    assert log_ssfr.colnames == ["obs_sfr", "obs_sm"]
+    result = evaluate_expression(log_ssfr, subvolumes, root_dirname, chunk_size=64)
+    expected = np.log10(
+        np.where(mock["obs_sfr"] > 0, mock["obs_sfr"] / mock["obs_sm"], 1e-12)
+    )
+    assert np.allclose(result, expected)
+
+    sm_final = 2 * col("sm_history")[:, -1] + 1
+    result = evaluate_expression(sm_final, subvolumes, root_dirname, chunk_size=100)
+    assert np.allclose(result, 2 * mock["sm_history"][:, -1] + 1)
+    history = evaluate_expression(col("sm_history"), subvolumes, root_dirname)
+    assert np.all(history == mock["sm_history"])
+
+    dx = col("x") - host_col("x")
+    result = evaluate_expression(dx, subvolumes, root_dirname, chunk_size=33)
+    has_host = mock["host_row"] >= 0
+    expected = mock["x"] - mock["x"][np.where(has_host, mock["host_row"], 0)]
+    assert np.allclose(result[has_host], expected[has_host])
+    assert np.all(np.isnan(result[~has_host]))
+
+    host_sm = host_col("sm_history", fill_value=-1)[:, -1]
+    result = evaluate_expression(host_sm, subvolumes, root_dirname, chunk_size=40)
+    expected = mock["sm_history"][np.where(has_host, mock["host_row"], 0), -1]
+    assert np.all(result[has_host] == expected[has_host])
+    assert np.all(result[~has_host] == -1)
+
+
+def test_write_expression_column(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (300, 0, 200), trimmed_colnames=["sm_history"])
+    subvolumes = [0, 1, 2]
+    mock = load_mock_from_binaries(subvolumes, root_dirname, ["obs_sm"])
+
+    write_expression_column(
+        np.log10(col("obs_sm")), subvolumes, root_dirname, "log_sm", chunk_size=50
+    )
+    log_sm = load_mock_from_binaries(subvolumes, root_dirname, ["log_sm"])["log_sm"]
+    assert np.allclose(log_sm, np.log10(mock["obs_sm"]))
+
+    #  An expression may overwrite one of its own inputs
+    write_expression_column(col("log_sm") * 2, subvolumes, root_dirname, "log_sm")
+    log_sm2 = load_mock_from_binaries(subvolumes, root_dirname, ["log_sm"])["log_sm"]
+    assert np.allclose(log_sm2, 2 * log_sm)
+
+    write_fake_subvolume(root_dirname, 0, x=np.zeros(3))
+    with pytest.raises(AssertionError):
+        evaluate_expression(col("x") + col("obs_sm"), subvolumes, root_dirname)
@@ -0,0 +1,96 @@
+""" """
+
+import os
+
+import numpy as np
+import pytest
+
+from ..column_sketches import (
+    ColumnSketch,
+    load_column_sketch,
+    merge_sketches,
+    write_column_sketches,
+)
+from ..load_mock import load_mock_from_binaries
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+
+
+def test_sketch_quantiles_counts_and_histograms():
+    rng = np.random.RandomState(fixed_seed)
+    x = np.concatenate(
+        (10 ** rng.uniform(8, 12, 20000), -rng.exponential(size=5000), np.zeros(100))
+    )
+    sketch = ColumnSketch.from_array(np.concatenate((x, [np.nan, np.inf])), 0.01)
+    assert sketch.count == len(x)
+    assert sketch.num_nonfinite == 2
+    assert (sketch.min, sketch.max) == (x.min(), x.max())
+    assert np.isclose(sketch.mean, x.mean())
+
+    q = np.linspace(0, 1, 41)
+    expected = np.quantile(x, q, method="lower")
+    assert np.allclose(sketch.quantile(q), expected, rtol=0.01, atol=0)
+    assert np.isclose(sketch.quantile(0.5), np.median(x), rtol=0.01)
+
+    for threshold in (-0.5, 0, 1e9, 1e11, 1e13):
+        num_above = np.sum(x > threshold)
+        assert abs(sketch.count_above(threshold) - num_above) < 0.01 * len(x)
+    bins = np.linspace(8, 12, 9)
+    counts = sketch.histogram(10**bins)[0]
+    expected = np.histogram(x, 10**bins)[0]
+    assert np.all(np.abs(counts - expected) < 0.01 * expected + 50)
+    assert sketch.histogram(5)[0].sum() == len(x)
+
+    empty = ColumnSketch()
+    assert np.isnan(empty.quantile(0.5))
+    assert empty.count_above(0) == 0
+    assert np.all(empty.histogram(3)[0] == 0)
+    merged = merge_sketches([empty, sketch, empty])
+    assert np.all(merged.quantile(q) == sketch.quantile(q))
+
+    with pytest.raises(AssertionError):
+        sketch.merge(ColumnSketch(0.02))
+
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    #  Values just above the lower edge of a bucket
+    sketch = ColumnSketch(0.01)
+    x = np.concatenate((np.full(100, 1.000001 * sketch.gamma**9), [1e-3, 1e3]))
+    sketch.update(x)
+    expected = np.quantile(x, 0.98, method="lower")
+    assert np.isclose(sketch.quantile(0.98), expected, rtol=0.01, atol=0)
+
+
+def test_merged_subvolume_sketches_match_the_sketch_of_the_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    rng = np.random.RandomState(fixed_seed)
+    nrows = (3000, 0, 2000, 1000)
+    for subvol, n in enumerate(nrows):
+        write_fake_subvolume(
+            root_dirname,
+            subvol,
+            obs_sm=10 ** rng.uniform(8, 12, n),
+            halo_id=np.arange(n),
+            sm_history=rng.uniform(size=(n, 3)),
+        )
+    subvolumes = list(range(len(nrows)))
+    write_column_sketches(root_dirname, subvolumes, chunk_size=700)
+    sketch_dirname = os.path.join(root_dirname, "column_sketches", "subvol_0")
+    assert sorted(os.listdir(sketch_dirname)) == ["halo_id.npz", "obs_sm.npz"]
+
+    mock = load_mock_from_binaries(subvolumes, root_dirname, ["obs_sm", "halo_id"])
+    for colname in ("obs_sm", "halo_id"):
+        sketch = load_column_sketch(root_dirname, subvolumes, colname)
+        expected = ColumnSketch.from_array(mock[colname])
+        for name in ("positive_keys", "positive_counts"):
+            assert np.all(getattr(sketch, name) == getattr(expected, name))
+        assert sketch.zero_count == expected.zero_count == np.sum(mock[colname] == 0)
+
+    sketch = load_column_sketch(root_dirname, [2, 1], "obs_sm")
+    assert sketch.count == 2000
+
+    with pytest.raises(AssertionError):
+        write_column_sketches(root_dirname, [0], ["sm_history"])
+    with pytest.raises(AssertionError):
+        load_column_sketch(root_dirname, [0], "sm_history")
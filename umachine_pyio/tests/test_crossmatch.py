@@ -1,9 +1,18 @@
 """ Module providing unit-testing of `~halotools.utils.crossmatch` function.
 """
+import pickle
+from multiprocessing import Pool
+
 import numpy as np
 import pytest
 
-from ..index_utils import crossmatch
+from ..index_utils import (
+    CrossmatchIndex,
+    compute_cumulative_richness,
+    compute_richness,
+    crossmatch,
+    crossmatch_parallel,
+)
 
 fixed_seed = 43
 
@@ -134,3 +143,168 @@ def test_crossmatch_skip_bounds_checking():
 
     assert np.allclose(x_idx, x_idx2)
     assert np.allclose(y_idx, y_idx2)
+
+
+STRATEGIES = ("auto", "lookup", "sorted", "hash", "sort")
+
+
+def _brute_force_crossmatch(x, y):
+    row_of_y = dict((val, i) for i, val in enumerate(y))
+    idx_x = [i for i, val in enumerate(x) if val in row_of_y]
+    idx_y = [row_of_y[x[i]] for i in idx_x]
+    return np.array(idx_x, dtype=int), np.array(idx_y, dtype=int)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("id_spacing", (1, 7, 10**12))
+def test_crossmatch_strategies_agree(strategy, id_spacing):
+    if (strategy == "lookup") & (id_spacing > 10):
+        pytest.skip("lookup table would require too much memory")
+    rng = np.random.RandomState(fixed_seed)
+    y = np.arange(-500, 1500) * id_spacing + 3
+    if strategy != "sorted":
+        rng.shuffle(y)
+    x = rng.randint(-1000, 2000, 5000) * id_spacing + 3
+
+    x_idx, y_idx = crossmatch(x, y, strategy=strategy)
+    correct_x_idx, correct_y_idx = _brute_force_crossmatch(x, y)
+    assert np.all(x_idx == correct_x_idx)
+    assert np.all(y_idx == correct_y_idx)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_crossmatch_strategies_detect_repeated_y(strategy):
+    y = np.array([2, 5, 5, 9, 11]) * 1000
+    x = np.arange(3)
+    with pytest.raises(ValueError) as err:
+        crossmatch(x, y, strategy=strategy)
+    substr = "Input array y must be a 1d sequence of unique integers"
+    assert substr in err.value.args[0]
+
+
+def test_crossmatch_sorted_strategy_requires_sorted_y():
+    with pytest.raises(ValueError) as err:
+        crossmatch(np.arange(3), np.array([5, 1, 3]), strategy="sorted")
+    assert "sorted in ascending order" in err.value.args[0]
+
+
+def test_crossmatch_empty_inputs():
+    for strategy in STRATEGIES:
+        x_idx, y_idx = crossmatch(
+            np.zeros(0, dtype=int), np.arange(4), strategy=strategy
+        )
+        assert len(x_idx) == len(y_idx) == 0
+        x_idx, y_idx = crossmatch(
+            np.arange(4), np.zeros(0, dtype=int), strategy=strategy
+        )
+        assert len(x_idx) == len(y_idx) == 0
+
+
+def test_crossmatch_invalid_strategy():
+    for y in (np.arange(4), np.zeros(0, dtype=int)):
+        with pytest.raises(ValueError) as err:
+            CrossmatchIndex(y, strategy="bogus")
+        assert "Input strategy = ``bogus``" in err.value.args[0]
+
+
+def _row_of_match_in_worker(args):
+    index, x = args
+    return index.row_of_match(x)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_crossmatch_index_reuse(strategy, tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    y = np.arange(-500, 1500) * 3
+    if strategy != "sorted":
+        rng.shuffle(y)
+    index = CrossmatchIndex(y, strategy=strategy)
+    assert len(index) == len(y)
+
+    for __ in range(3):
+        x = rng.randint(-2000, 5000, 1000)
+        correct_x_idx, correct_y_idx = _brute_force_crossmatch(x, y)
+        x_idx, y_idx = index.crossmatch(x)
+        assert np.all(x_idx == correct_x_idx)
+        assert np.all(y_idx == correct_y_idx)
+        x_idx, y_idx = crossmatch(x, index)
+        assert np.all(x_idx == correct_x_idx)
+
+        row_of_match = index.row_of_match(x)
+        assert np.all(row_of_match[correct_x_idx] == correct_y_idx)
+        assert np.count_nonzero(row_of_match >= 0) == len(correct_x_idx)
+
+    index.save(str(tmp_path / "index"))
+    loaded_index = CrossmatchIndex.load(str(tmp_path / "index"))
+    assert loaded_index.strategy == index.strategy
+    assert np.all(loaded_index.row_of_match(x) == row_of_match)
+
+    for idx in (index, loaded_index):
+        assert np.all(pickle.loads(pickle.dumps(idx)).row_of_match(x) == row_of_match)
+    assert len(pickle.dumps(loaded_index)) < 1000
+
+    with Pool(2) as pool:
+        results = pool.map(_row_of_match_in_worker, [(loaded_index, x)] * 2)
+    for result in results:
+        assert np.all(result == row_of_match)
+
+
+def test_compute_richness_accepts_crossmatch_index():
+    rng = np.random.RandomState(fixed_seed)
+    unique_halo_ids = rng.permutation(np.arange(5, 105)) * 11
+    halo_id_of_galaxies = rng.randint(0, 200, 5000) * 11
+    richness = compute_richness(unique_halo_ids, halo_id_of_galaxies)
+    richness2 = compute_richness(CrossmatchIndex(unique_halo_ids), halo_id_of_galaxies)
+    assert np.all(richness == richness2)
+    for halo_id, n in zip(unique_halo_ids[:10], richness[:10]):
+        assert n == np.count_nonzero(halo_id_of_galaxies == halo_id)
+
+
+def test_compute_cumulative_richness_agrees_with_compute_richness():
+    rng = np.random.RandomState(fixed_seed)
+    unique_halo_ids = rng.permutation(np.arange(5, 105)) * 11
+    halo_id_of_galaxies = rng.randint(0, 200, 5000) * 11
+    obs_sm = 10 ** rng.uniform(8, 12, 5000)
+    obs_sm[::50] = np.nan
+    thresholds = np.array((1e10, 1e9, 1e11, 0.0, 1e13, 1e10))
+
+    richness = compute_cumulative_richness(
+        unique_halo_ids, halo_id_of_galaxies, obs_sm, thresholds
+    )
+    assert richness.shape == (len(unique_halo_ids), len(thresholds))
+    for i, threshold in enumerate(thresholds):
+        mask = obs_sm >= threshold
+        correct = compute_richness(unique_halo_ids, halo_id_of_galaxies[mask])
+        assert np.all(richness[:, i] == correct)
+
+    index = CrossmatchIndex(unique_halo_ids)
+    richness2 = compute_cumulative_richness(
+        index, halo_id_of_galaxies, obs_sm, thresholds
+    )
+    assert np.all(richness == richness2)
+
+
+@pytest.mark.parametrize("num_workers", (1, 2, 3, 8))
+@pytest.mark.parametrize("id_spacing", (1, 10**12))
+def test_crossmatch_parallel_agrees_with_crossmatch(num_workers, id_spacing):
+    rng = np.random.RandomState(fixed_seed)
+    y = rng.permutation(np.arange(-500, 1500)) * id_spacing
+    x = rng.randint(-1000, 2000, 5000) * id_spacing
+    x[:500] = y[0]
+
+    x_idx, y_idx = crossmatch_parallel(x, y, num_workers=num_workers)
+    correct_x_idx, correct_y_idx = crossmatch(x, y)
+    assert np.all(x_idx == correct_x_idx)
+    assert np.all(y_idx == correct_y_idx)
+
+
+def test_crossmatch_parallel_error_handling():
+    with pytest.raises(ValueError) as err:
+        crossmatch_parallel(np.arange(5), np.array([1, 2, 2, 3] * 100), num_workers=4)
+    substr = "Input array y must be a 1d sequence of unique integers"
+    assert substr in err.value.args[0]
+
+    with pytest.raises(ValueError) as err:
+        crossmatch_parallel(np.arange(0, 5, 0.5), np.arange(10), num_workers=4)
+    substr = "Input array x must be a 1d sequence of integers"
+    assert substr in err.value.args[0]
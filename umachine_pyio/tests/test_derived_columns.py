@@ -0,0 +1,70 @@
+"""
+"""
+import numpy as np
+
+from ..derived_columns import compute_derived_columns, write_derived_columns
+from ..index_utils import calculate_last_surviving_id, get_num_snaps_since_orphan_merge
+from ..load_mock import load_mock_from_binaries, value_added_mock
+from .testing_data import write_fake_subvolume
+
+
+def test_orphan_decoding_is_exact_for_large_ids():
+    last_surviving_id = np.array([12345678901234, 999999999999999, 1])
+    num_snaps = np.array([0, 7, 9000])
+    halo_id = last_surviving_id + num_snaps * 10**15
+    assert np.all(get_num_snaps_since_orphan_merge(halo_id) == num_snaps)
+    assert np.all(calculate_last_surviving_id(halo_id) == last_surviving_id)
+
+
+def test_compute_derived_columns():
+    halo_id = np.array([10, 11, 12, 13, 3 * 10**15 + 14])
+    upid = np.array([-1, 10, 99, -1, 13])
+    derived = compute_derived_columns(halo_id, upid)
+    assert np.all(derived["halo_hostid"] == (10, 10, 99, 13, 13))
+    assert np.all(derived["host_row"] == (0, 0, -1, 3, 3))
+    assert np.all(derived["num_snaps_since_merge"] == (0, 0, 0, 0, 3))
+    assert np.all(derived["last_surviving_id"] == (10, 11, 12, 13, 14))
+
+
+def _write_tree(root_dirname):
+    # The host of the last galaxy of subvol_1 lives in subvol_0
+    halo_ids = (np.array([10, 11, 12, 13]), np.array([20, 21, 22]))
+    upids = (np.array([-1, 10, -1, 12]), np.array([-1, 20, 13]))
+    for subvol, (halo_id, upid) in enumerate(zip(halo_ids, upids)):
+        write_fake_subvolume(
+            root_dirname,
+            subvol,
+            halo_id=halo_id,
+            upid=upid,
+            mvir=halo_id * 1.0,
+            x=halo_id * 1.0,
+        )
+
+
+def test_value_added_mock_with_derived_columns(tmp_path):
+    root_dirname = str(tmp_path)
+    _write_tree(root_dirname)
+    write_derived_columns(root_dirname, (0, 1))
+
+    galprops = ("halo_id", "upid", "mvir", "x")
+    derived_galprops = (*galprops, "halo_hostid", "host_row")
+    correct_host_mvir = (10, 10, 12, 12, 20, 20, 13)
+
+    mock = load_mock_from_binaries((0, 1), root_dirname, derived_galprops)
+    assert np.all(mock["host_row"] == (0, 0, 2, 2, 4, 4, -1))
+    mock, host_index = value_added_mock(mock, 250.0, return_host_index=True)
+    assert np.all(host_index == (0, 0, 2, 2, 4, 4, 3))
+    assert np.all(mock["host_halo_mvir"] == correct_host_mvir)
+
+    mock2 = value_added_mock(
+        load_mock_from_binaries((0, 1), root_dirname, galprops), 250
+    )
+    assert np.all(mock2["host_halo_mvir"] == correct_host_mvir)
+    assert np.all(mock2["halo_hostid"] == mock["halo_hostid"])
+
+    mock3 = load_mock_from_binaries(
+        (1, 0), root_dirname, derived_galprops, row_ranges=(None, (2, 4))
+    )
+    assert np.all(mock3["host_row"] == (0, 0, -1, 3, 3))
+    mock3 = value_added_mock(mock3, 250.0)
+    assert np.all(mock3["host_halo_mvir"] == (20, 20, 13, 12, 12))
@@ -0,0 +1,108 @@
+"""
+"""
+import numpy as np
+import pytest
+
+from ..directory_tree_utils import memmap_fname_iterator
+from ..external_crossmatch import (
+    _filled_memmap,
+    _merge_join_runs,
+    _write_sorted_runs,
+    crossmatch_memmap_sequences,
+)
+from ..index_utils import crossmatch
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+
+
+def _write_id_sequence(root_dirname, colname, arr, num_subvols):
+    edges = np.linspace(0, len(arr), num_subvols + 1).astype(int)
+    for subvol, (a, b) in enumerate(zip(edges[:-1], edges[1:])):
+        write_fake_subvolume(root_dirname, subvol, **{colname: arr[a:b]})
+    fname_tuples = list(
+        memmap_fname_iterator(root_dirname, colname, *range(num_subvols))
+    )
+    return [t[0] for t in fname_tuples], [t[1] for t in fname_tuples]
+
+
+@pytest.mark.parametrize("max_rows_in_memory", (251, 1000, 10**6))
+def test_crossmatch_memmap_sequences_agrees_with_crossmatch(
+    tmp_path, max_rows_in_memory
+):
+    rng = np.random.RandomState(fixed_seed)
+    y = rng.permutation(np.arange(-300, 700) * 5)
+    x = rng.randint(-2000, 4000, 3000)
+    # Long runs of repeated values span several blocks
+    x[:200] = y[0]
+    x = x.astype("i4")
+
+    x_fnames = _write_id_sequence(str(tmp_path / "x"), "upid", x, 4)
+    y_fnames = _write_id_sequence(str(tmp_path / "y"), "halo_id", y, 3)
+
+    output_dirname = str(tmp_path / "output")
+    idx_x, idx_y = crossmatch_memmap_sequences(
+        *x_fnames,
+        *y_fnames,
+        output_dirname,
+        scratch_dirname=str(tmp_path),
+        max_rows_in_memory=max_rows_in_memory,
+    )
+    correct_idx_x, correct_idx_y = crossmatch(x, y)
+    assert np.all(idx_x == correct_idx_x)
+    assert np.all(idx_y == correct_idx_y)
+
+    idx_x2 = np.memmap(
+        str(tmp_path / "output" / "idx_x" / "idx_x.memmap"), dtype="i8", mode="r"
+    )
+    assert np.all(idx_x2 == correct_idx_x)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["output", "x", "y"]
+
+
+def test_crossmatch_memmap_sequences_no_overlap(tmp_path):
+    x_fnames = _write_id_sequence(str(tmp_path / "x"), "upid", np.arange(10), 2)
+    y_fnames = _write_id_sequence(str(tmp_path / "y"), "halo_id", np.arange(20, 30), 2)
+    idx_x, idx_y = crossmatch_memmap_sequences(
+        *x_fnames, *y_fnames, str(tmp_path / "output"), max_rows_in_memory=3
+    )
+    assert len(idx_x) == len(idx_y) == 0
+
+
+def test_crossmatch_memmap_sequences_repeated_y(tmp_path):
+    x_fnames = _write_id_sequence(str(tmp_path / "x"), "upid", np.arange(10), 2)
+    y = np.concatenate((np.arange(10), [3]))
+    y_fnames = _write_id_sequence(str(tmp_path / "y"), "halo_id", y, 2)
+    with pytest.raises(ValueError):
+        crossmatch_memmap_sequences(
+            *x_fnames, *y_fnames, str(tmp_path / "output"), max_rows_in_memory=4
+        )
+
+
+@pytest.mark.parametrize("max_rows_in_memory", (100, 1000))
+def test_heavily_repeated_x_respects_the_memory_bound(tmp_path, max_rows_in_memory):
+    rng = np.random.RandomState(fixed_seed)
+    y = rng.permutation(np.arange(-1, 1500))
+    #  Most satellites share upid = -1, which also appears once in y
+    x = np.where(rng.uniform(size=5000) < 0.7, -1, rng.randint(0, 2000, 5000))
+    x_fnames = _write_id_sequence(str(tmp_path / "x"), "upid", x, 4)
+    y_fnames = _write_id_sequence(str(tmp_path / "y"), "halo_id", y, 3)
+
+    scratch = str(tmp_path)
+    x_runs, num_x = _write_sorted_runs(*x_fnames, scratch, "x", max_rows_in_memory)
+    y_runs, __ = _write_sorted_runs(*y_fnames, scratch, "y", max_rows_in_memory)
+    row_of_match = _filled_memmap(str(tmp_path / "row_of_match"), num_x, -1)
+    max_rows_per_round = _merge_join_runs(
+        x_runs, y_runs, row_of_match, max_rows_in_memory
+    )
+    assert max_rows_per_round <= max_rows_in_memory
+
+    correct_idx_x, correct_idx_y = crossmatch(x, y)
+    assert np.all(np.flatnonzero(row_of_match >= 0) == correct_idx_x)
+    assert np.all(row_of_match[correct_idx_x] == correct_idx_y)
+
+    #  Repeated values of y are still detected
+    y_fnames = _write_id_sequence(str(tmp_path / "y2"), "halo_id", -np.ones(500), 2)
+    with pytest.raises(ValueError):
+        crossmatch_memmap_sequences(
+            *x_fnames, *y_fnames, str(tmp_path / "output"), max_rows_in_memory=100
+        )
@@ -0,0 +1,161 @@
+""" """
+
+import numpy as np
+import pytest
+
+from ..groupby_utils import GroupBy, GroupByAccumulator, groupby_subvolumes
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+
+
+def _brute_force(keys, values, func):
+    unique_keys = np.unique(keys)
+    return unique_keys, np.array([func(values[keys == key]) for key in unique_keys])
+
+
+def test_groupby_reductions_agree_with_brute_force():
+    rng = np.random.RandomState(fixed_seed)
+    keys = rng.randint(-50, 50, 2000)
+    values = rng.normal(size=2000)
+    groups = GroupBy(keys)
+
+    for method, func in (
+        ("sum", np.sum),
+        ("mean", np.mean),
+        ("min", np.min),
+        ("max", np.max),
+        ("var", np.var),
+        ("std", np.std),
+    ):
+        unique_keys, correct = _brute_force(keys, values, func)
+        assert np.all(groups.unique_keys == unique_keys)
+        assert np.allclose(getattr(groups, method)(values), correct)
+
+    __, correct_counts = _brute_force(keys, values, len)
+    assert np.all(groups.count() == correct_counts)
+
+
+def test_groupby_weighted_reductions():
+    rng = np.random.RandomState(fixed_seed)
+    keys = rng.randint(0, 20, 500)
+    values = rng.uniform(0, 10, 500)
+    weights = rng.uniform(0, 1, 500)
+    groups = GroupBy(keys)
+
+    for i, key in enumerate(groups.unique_keys):
+        mask = keys == key
+        w, v = weights[mask], values[mask]
+        mean = np.sum(w * v) / np.sum(w)
+        assert np.isclose(groups.count(weights)[i], np.sum(w))
+        assert np.isclose(groups.sum(values, weights)[i], np.sum(w * v))
+        assert np.isclose(groups.mean(values, weights)[i], mean)
+        assert np.isclose(
+            groups.var(values, weights)[i], np.sum(w * (v - mean) ** 2) / np.sum(w)
+        )
+
+
+def test_groupby_central_mask_and_broadcast():
+    keys = np.array([3, 1, 3, 3, 1, 7])
+    sm = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    is_central = np.array([True, False, False, False, True, True])
+    groups = GroupBy(keys)
+
+    assert np.all(groups.unique_keys == (1, 3, 7))
+    assert np.allclose(groups.sum(sm, is_central), (5.0, 1.0, 6.0))
+    assert np.allclose(groups.broadcast(groups.sum(sm)), (8, 7, 8, 8, 7, 6))
+    assert np.all(groups.unique_keys[groups.group_index] == keys)
+
+
+def test_groupby_history_columns():
+    rng = np.random.RandomState(fixed_seed)
+    keys = rng.randint(0, 10, 300)
+    histories = rng.uniform(size=(300, 5))
+    groups = GroupBy(keys)
+    sums = groups.sum(histories)
+    assert sums.shape == (groups.num_groups, 5)
+    for i, key in enumerate(groups.unique_keys):
+        assert np.allclose(sums[i], histories[keys == key].sum(axis=0))
+
+
+def test_groupby_empty():
+    groups = GroupBy(np.zeros(0, dtype=int))
+    assert groups.num_groups == 0
+    assert groups.sum(np.zeros(0)).shape == (0,)
+    assert groups.max(np.zeros(0)).shape == (0,)
+
+
+def test_groupby_aggregate_rejects_unknown_reduction():
+    groups = GroupBy(np.arange(5))
+    with pytest.raises(ValueError):
+        groups.aggregate(dict(x=np.arange(5)), dict(y=("x", "median")))
+
+
+def test_accumulator_agrees_with_single_pass():
+    rng = np.random.RandomState(fixed_seed)
+    keys = rng.randint(0, 100, 5000)
+    columns = dict(
+        sm=rng.uniform(1, 2, 5000),
+        is_central=rng.uniform(size=5000) > 0.5,
+    )
+    reductions = dict(
+        richness=(None, "count"),
+        total_sm=("sm", "sum"),
+        central_sm=("sm", "sum", "is_central"),
+        min_sm=("sm", "min"),
+        max_sm=("sm", "max"),
+        mean_sm=("sm", "mean"),
+        var_sm=("sm", "var"),
+        std_sm=("sm", "std"),
+    )
+    correct = GroupBy(keys).aggregate(columns, reductions)
+
+    accumulator = GroupByAccumulator(reductions)
+    for chunk in np.array_split(np.arange(5000), 7):
+        accumulator.update(keys[chunk], dict((k, v[chunk]) for k, v in columns.items()))
+    unique_keys, result = accumulator.result()
+
+    assert np.all(unique_keys == np.unique(keys))
+    for name in reductions:
+        assert np.allclose(result[name], correct[name]), name
+
+
+def test_accumulator_groups_with_zero_weight_in_a_chunk():
+    keys = np.array([1, 1, 2, 2, 1, 2])
+    columns = dict(v=np.arange(1.0, 7.0), w=np.array([1, 0, 1, 1, 0, 0.0]))
+    reductions = dict(mean_v=("v", "mean", "w"), var_v=("v", "var", "w"))
+    accumulator = GroupByAccumulator(reductions)
+    for chunk in (slice(None, 4), slice(4, None)):
+        accumulator.update(keys[chunk], dict((k, v[chunk]) for k, v in columns.items()))
+    unique_keys, result = accumulator.result()
+    assert np.allclose(result["mean_v"], [1, 3.5])
+    assert np.allclose(result["var_v"], [0, 0.25])
+    correct = GroupBy(keys).aggregate(columns, reductions)
+    assert np.allclose(result["var_v"], correct["var_v"])
+
+
+def test_accumulator_result_requires_an_update():
+    accumulator = GroupByAccumulator(dict(richness=(None, "count")))
+    with pytest.raises(AssertionError):
+        accumulator.result()
+    accumulator.update(np.zeros(0, dtype=int), dict())
+    unique_keys, result = accumulator.result()
+    assert len(unique_keys) == len(result["richness"]) == 0
+
+
+def test_groupby_subvolumes(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    root_dirname = str(tmp_path)
+    keys = rng.randint(0, 30, 400)
+    sm = rng.uniform(size=400)
+    for subvol, rows in enumerate((slice(0, 150), slice(150, 250), slice(250, None))):
+        write_fake_subvolume(root_dirname, subvol, halo_hostid=keys[rows], sm=sm[rows])
+
+    reductions = dict(richness=(None, "count"), total_sm=("sm", "sum"))
+    unique_keys, result = groupby_subvolumes(
+        (0, 1, 2), root_dirname, "halo_hostid", reductions
+    )
+    groups = GroupBy(keys)
+    assert np.all(unique_keys == groups.unique_keys)
+    assert np.all(result["richness"] == groups.count())
+    assert np.allclose(result["total_sm"], groups.sum(sm))
@@ -0,0 +1,77 @@
+""" """
+
+import numpy as np
+import pytest
+
+from ..halo_id_index import HaloIDIndex, load_galaxies_by_id, write_halo_id_index
+from ..load_mock import load_mock_from_binaries
+from ..spatial_ordering import reorder_subvolume_rows
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+GALPROPS = ["halo_id", "upid", "x", "sm_history", "host_row"]
+
+
+def test_load_galaxies_by_id_agrees_with_the_full_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (500, 0, 300, 200)
+    write_fake_tree(root_dirname, nrows)
+    subvolumes = list(range(len(nrows)))
+    write_halo_id_index(root_dirname, subvolumes)
+    mock = load_mock_from_binaries(subvolumes, root_dirname, GALPROPS)
+
+    rng = np.random.RandomState(fixed_seed)
+    rows = rng.choice(len(mock), 300)
+    query = np.concatenate((mock["halo_id"][rows], [-5, 3]))
+    query = query[rng.permutation(len(query))]
+    galaxies, idx_found = load_galaxies_by_id(root_dirname, query, GALPROPS)
+    assert galaxies.keys() == GALPROPS
+    is_found = np.isin(query, mock["halo_id"])
+    assert np.all(idx_found == np.flatnonzero(is_found))
+    assert np.all(galaxies["halo_id"] == query[is_found])
+    loaded_row = np.searchsorted(
+        mock["halo_id"], galaxies["halo_id"], sorter=np.argsort(mock["halo_id"])
+    )
+    loaded_row = np.argsort(mock["halo_id"])[loaded_row]
+    for key in ("upid", "x", "sm_history"):
+        assert np.all(galaxies[key] == mock[key][loaded_row])
+
+    has_host = galaxies["host_row"] >= 0
+    host_id = galaxies["halo_id"][galaxies["host_row"][has_host]]
+    hostid = np.where(galaxies["upid"] == -1, galaxies["halo_id"], galaxies["upid"])
+    assert np.all(host_id == hostid[has_host])
+    assert np.all(np.isin(hostid[~has_host], galaxies["halo_id"], invert=True))
+
+    index = HaloIDIndex(root_dirname)
+    assert len(index) == sum(nrows)
+    subvol, subvol_row = index.lookup(mock["halo_id"][[0, 500, 999, 800]])
+    assert np.all(subvol == [0, 2, 3, 3])
+    assert np.all(subvol_row == [0, 0, 199, 0])
+    assert np.all(np.array(index.lookup([-5])) == -1)
+
+    galaxies, idx_found = index.load_galaxies([-5, 2], ["x"])
+    assert len(galaxies) == len(idx_found) == 0
+    assert galaxies.keys() == ["x"]
+
+    galaxies = index.load_galaxies(mock["halo_id"][:10], ["z", "upid", "y", "z"])[0]
+    assert galaxies.keys() == ["z", "upid", "y"]
+
+
+def test_stale_index_is_detected(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (400, 300))
+    write_halo_id_index(root_dirname, [0, 1])
+    halo_id = load_mock_from_binaries([0, 1], root_dirname, ["halo_id"])["halo_id"]
+
+    reorder_subvolume_rows(root_dirname, [0, 1])
+    with pytest.raises(ValueError):
+        load_galaxies_by_id(root_dirname, halo_id[:50], ["x"])
+    write_halo_id_index(root_dirname, [0, 1])
+    galaxies = load_galaxies_by_id(root_dirname, halo_id[:50], ["halo_id"])[0]
+    assert np.all(galaxies["halo_id"] == halo_id[:50])
+
+    write_fake_subvolume(root_dirname, 1, halo_id=np.arange(10))
+    with pytest.raises(ValueError):
+        load_galaxies_by_id(root_dirname, halo_id[-50:], ["halo_id"])
+    with pytest.raises(ValueError):
+        HaloIDIndex(str(tmp_path / "subvol_0"))
@@ -0,0 +1,139 @@
+""" """
+
+import os
+
+import numpy as np
+
+from ..history_summaries import (
+    compute_history_summaries,
+    half_mass_time,
+    history_summary_colnames,
+    integrated_mass,
+    peak_sfr,
+    quenching_time,
+    write_history_summaries,
+)
+from ..load_mock import load_mock_from_binaries
+from ..process_ascii_into_memmap import write_ascii_to_memmap_tree
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+_THIS_DRNAME = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_HEADER = os.path.join(
+    os.path.dirname(_THIS_DRNAME), "example_headers", "header_a_0.399872.txt"
+)
+EXAMPLE_COLUMN_INFO = os.path.join(
+    os.path.dirname(_THIS_DRNAME), "example_headers", "sfh_ascii_header_column_info.dat"
+)
+
+
+def _fake_histories(rng, num_gals, num_snaps):
+    sfr_history = rng.uniform(0, 10, (num_gals, num_snaps))
+    formation_index = rng.randint(0, num_snaps // 2, num_gals)
+    sfr_history[np.arange(num_snaps) < formation_index[:, np.newaxis]] = 0.0
+    quenching_index = rng.randint(num_snaps // 2, num_snaps + 1, num_gals)
+    sfr_history[np.arange(num_snaps) >= quenching_index[:, np.newaxis]] = 1e-3
+    sm_history = np.cumsum(sfr_history, axis=1) * 1e9
+    return sm_history, sfr_history
+
+
+def test_history_summary_kernels_agree_with_brute_force():
+    rng = np.random.RandomState(fixed_seed)
+    cosmic_age = np.linspace(0.5, 13.8, 40)
+    sm_history, sfr_history = _fake_histories(rng, 100, 40)
+    sm_history[0] = 0.0
+
+    t_half_mass = half_mass_time(sm_history, cosmic_age)
+    assert np.isnan(t_half_mass[0])
+    for i in range(1, 100):
+        #  sm_history is monotonic so its inverse is well defined
+        correct = np.interp(sm_history[i, -1] / 2, sm_history[i], cosmic_age)
+        assert np.isclose(t_half_mass[i], correct)
+
+    t_quench = quenching_time(sfr_history, sm_history, cosmic_age)
+    for i in range(1, 100):
+        ssfr = sfr_history[i] / np.where(sm_history[i] > 0, sm_history[i], np.inf)
+        is_sf = ssfr >= 1e-11
+        if is_sf[-1] or not np.any(is_sf):
+            assert np.isnan(t_quench[i])
+        else:
+            ilast_sf = np.flatnonzero(is_sf)[-1]
+            assert t_quench[i] == cosmic_age[ilast_sf + 1]
+
+    sfr_peak, t_sfr_peak = peak_sfr(sfr_history, cosmic_age)
+    assert np.all(sfr_peak == sfr_history.max(axis=1))
+    assert np.all(t_sfr_peak == cosmic_age[sfr_history.argmax(axis=1)])
+
+    sm_formed = integrated_mass(sfr_history, cosmic_age)
+    dt_yr = np.diff(cosmic_age) * 1e9
+    correct = [sum(dt_yr * (s[1:] + s[:-1]) / 2) for s in sfr_history]
+    assert np.allclose(sm_formed, correct)
+
+
+def test_write_history_summaries(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    root_dirname = str(tmp_path)
+    cosmic_age = np.linspace(0.5, 13.8, 20)
+    os.makedirs(os.path.join(root_dirname, "simulation_data"))
+    np.save(
+        os.path.join(root_dirname, "simulation_data", "snapshot_times.npy"), cosmic_age
+    )
+    sm_history, sfr_history = _fake_histories(rng, 50, 20)
+    for subvol, rows in enumerate((slice(0, 30), slice(30, None))):
+        write_fake_subvolume(
+            root_dirname,
+            subvol,
+            sm_history_main_prog=sm_history[rows],
+            sfr_history_main_prog=sfr_history[rows],
+        )
+
+    write_history_summaries(root_dirname, (0, 1))
+    mock = load_mock_from_binaries((0, 1), root_dirname, history_summary_colnames)
+    correct = compute_history_summaries(sm_history, sfr_history, cosmic_age)
+    for colname in history_summary_colnames:
+        assert np.allclose(mock[colname], correct[colname], equal_nan=True)
+
+
+def test_history_summaries_at_reduction_time(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    header_lines = [line for line in open(EXAMPLE_HEADER) if line[0] == "#"]
+    num_scales = 80
+
+    column_info_fname = str(tmp_path / "column_info.dat")
+    with open(column_info_fname, "w") as f:
+        for i, line in enumerate(open(EXAMPLE_COLUMN_INFO)):
+            f.write(line.strip() + " " + str(int(i >= 24)) + "\n")
+
+    num_gals = 20
+    sm_history, sfr_history = _fake_histories(rng, num_gals, num_scales)
+    ascii_fname = str(tmp_path / "sfh_catalog_0.399872.0.txt")
+    with open(ascii_fname, "w") as f:
+        f.writelines(header_lines)
+        for i in range(num_gals):
+            row = list(rng.uniform(size=22))
+            for colnum in range(8):
+                if colnum == 2:
+                    row.extend(sm_history[i])
+                elif colnum == 5:
+                    row.extend(sfr_history[i])
+                else:
+                    row.extend(np.zeros(num_scales))
+            f.write(" ".join([str(i), "-1"] + [repr(float(x)) for x in row]) + "\n")
+
+    cosmic_age = np.linspace(0.5, 5.0, num_scales)
+    output_dirname = str(tmp_path / "a_0.399872" / "subvol_0")
+    write_ascii_to_memmap_tree(
+        ascii_fname,
+        column_info_fname,
+        output_dirname,
+        ["halo_id", "sm"],
+        summary_cosmic_age=cosmic_age,
+    )
+    assert not os.path.isdir(os.path.join(output_dirname, "sm_history_main_prog"))
+
+    mock = load_mock_from_binaries(
+        [0], str(tmp_path / "a_0.399872"), history_summary_colnames
+    )
+    correct = compute_history_summaries(sm_history, sfr_history, cosmic_age)
+    for colname in history_summary_colnames:
+        assert np.allclose(mock[colname], correct[colname], equal_nan=True)
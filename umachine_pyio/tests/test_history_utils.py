@@ -0,0 +1,124 @@
+""" """
+
+import os
+
+import numpy as np
+
+from ..history_utils import (
+    interpolate_history,
+    interpolate_history_chunks,
+    interpolate_history_from_binaries,
+)
+from ..load_mock import load_mock_from_binaries
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+
+
+def _brute_force_interpolation(history, abscissa, targets):
+    return np.array([np.interp(targets, abscissa, h) for h in history])
+
+
+def test_interpolate_history_agrees_with_np_interp():
+    rng = np.random.RandomState(fixed_seed)
+    abscissa = np.sort(rng.uniform(0.1, 13.8, 50))
+    history = rng.uniform(size=(200, 50)).astype("f4")
+    targets = np.concatenate(
+        (rng.uniform(0, 14, 10), abscissa[[0, 10, 49]], [-1.0, 20.0])
+    )
+    result = interpolate_history(history, abscissa, targets)
+    correct = _brute_force_interpolation(history, abscissa, targets)
+    assert result.shape == (200, len(targets))
+    assert np.allclose(result, correct)
+
+
+def test_interpolate_history_from_binaries(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    root_dirname = str(tmp_path)
+    num_snaps = 30
+    snapshot_times = np.linspace(0.5, 13.8, num_snaps)
+    scale_list = np.linspace(0.1, 1.0, num_snaps)
+    os.makedirs(os.path.join(root_dirname, "simulation_data"))
+    np.save(
+        os.path.join(root_dirname, "simulation_data", "snapshot_times.npy"),
+        snapshot_times,
+    )
+
+    history = rng.uniform(size=(300, num_snaps)).astype("f4")
+    for subvol, rows in enumerate((slice(0, 100), slice(100, 100), slice(100, None))):
+        write_fake_subvolume(root_dirname, subvol, sfr_history=history[rows])
+
+    target_times = (12.8, 1.0, 5.5)
+    result = interpolate_history_from_binaries(
+        (0, 1, 2), root_dirname, "sfr_history", target_times=target_times
+    )
+    assert np.allclose(
+        result, _brute_force_interpolation(history, snapshot_times, target_times)
+    )
+
+    target_scale_factors = (0.5, 0.25)
+    result = interpolate_history_from_binaries(
+        (0, 1, 2),
+        root_dirname,
+        "sfr_history",
+        target_scale_factors=target_scale_factors,
+        scale_list=scale_list,
+        row_ranges=[(10, 20), None, (0, 5)],
+    )
+    rows = np.concatenate((np.arange(10, 20), np.arange(100, 105)))
+    correct = _brute_force_interpolation(
+        history[rows], scale_list, target_scale_factors
+    )
+    assert np.allclose(result, correct)
+
+    chunks = list(
+        interpolate_history_chunks(
+            (0, 1, 2), root_dirname, "sfr_history", target_times=target_times
+        )
+    )
+    assert [subvol for subvol, __ in chunks] == [0, 1, 2]
+    assert [len(chunk) for __, chunk in chunks] == [100, 0, 200]
+
+
+def test_interpolate_trimmed_history_from_binaries(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (200, 0, 150)
+    write_fake_tree(root_dirname, nrows, trimmed_colnames=("sm_history",))
+    scale_list = np.linspace(0.2, 1.0, 5)
+    target_scale_factors = (0.25, 0.6, 1.0, 0.1)
+    history = load_mock_from_binaries(range(3), root_dirname, ["sm_history"])[
+        "sm_history"
+    ]
+
+    result = interpolate_history_from_binaries(
+        range(3),
+        root_dirname,
+        "sm_history",
+        target_scale_factors=target_scale_factors,
+        scale_list=scale_list,
+    )
+    correct = interpolate_history(history, scale_list, target_scale_factors)
+    assert np.allclose(result, correct)
+
+    result = interpolate_history_from_binaries(
+        range(3),
+        root_dirname,
+        "sm_history",
+        target_scale_factors=target_scale_factors,
+        scale_list=scale_list,
+        row_ranges=[(20, 80), None, (100, 150)],
+    )
+    rows = np.concatenate((np.arange(20, 80), np.arange(300, 350)))
+    assert np.allclose(result, correct[rows])
+
+    chunks = list(
+        interpolate_history_chunks(
+            range(3),
+            root_dirname,
+            "sm_history",
+            target_scale_factors=target_scale_factors,
+            scale_list=scale_list,
+        )
+    )
+    assert [len(chunk) for __, chunk in chunks] == list(nrows)
+    assert np.allclose(np.concatenate([chunk for __, chunk in chunks]), correct)
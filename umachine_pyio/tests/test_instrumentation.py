@@ -0,0 +1,105 @@
+""" """
+
+import json
+
+import numpy as np
+
+from ..instrumentation import IOStats, JsonLinesProgressLog, peak_rss_bytes
+from ..load_mock import load_mock_from_binaries
+from ..process_ascii_into_memmap import write_ascii_to_memmap_tree
+from ..synthetic_catalogs import (
+    write_synthetic_column_info,
+    write_synthetic_sfh_catalog,
+)
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+
+
+def test_iostats_accumulates_stages_and_calls_callback():
+    events = []
+    stats = IOStats(callback=lambda name, record: events.append((name, record)))
+    for __ in range(3):
+        with stats.stage("memmap_read", files_opened=1) as record:
+            record["bytes_read"] += 10
+    stats.add("sidecar_read", 0.5, files_opened=2)
+
+    stages = stats.as_dict()["stages"]
+    assert stages["memmap_read"]["calls"] == 3
+    assert stages["memmap_read"]["bytes_read"] == 30
+    assert stages["memmap_read"]["files_opened"] == 3
+    assert stages["sidecar_read"]["seconds"] == 0.5
+    assert [name for name, __ in events] == ["memmap_read"] * 3 + ["sidecar_read"]
+    assert events[0][1]["bytes_read"] == 10
+
+    stats.reset()
+    assert len(stats.as_dict()["stages"]) == 0
+
+
+def test_load_mock_records_bytes_read(tmp_path):
+    root_dirname = str(tmp_path)
+    rng = np.random.RandomState(fixed_seed)
+    nrows = (100, 50)
+    for subvol, n in enumerate(nrows):
+        write_fake_subvolume(
+            root_dirname, subvol, x=rng.uniform(size=n), halo_id=np.arange(n)
+        )
+
+    stats = IOStats()
+    mock = load_mock_from_binaries([0, 1], root_dirname, ["x", "halo_id"], stats=stats)
+    report = stats.as_dict()
+    memmap_read = report["stages"]["memmap_read"]
+    assert memmap_read["rows"] == 2 * sum(nrows)
+    assert memmap_read["bytes_read"] == sum(mock[key].nbytes for key in mock.keys())
+    assert memmap_read["files_opened"] == 4
+    assert report["stages"]["sidecar_read"]["files_opened"] == 4
+    peak = peak_rss_bytes()
+    assert (peak is None) or (report["peak_rss_bytes"] >= mock["x"].nbytes)
+
+
+def test_ingest_records_every_stage(tmp_path):
+    column_info_fname = str(tmp_path / "column_info.dat")
+    write_synthetic_column_info(column_info_fname)
+    ascii_fname = str(tmp_path / "sfh_catalog_0.399872.0.txt")
+    write_synthetic_sfh_catalog(ascii_fname, 100, "0.399872", chunk_size=100)
+
+    stats = IOStats()
+    output_dirname = str(tmp_path / "a_0.399872" / "subvol_0")
+    colnames = ["halo_id", "x", "sm_history_main_prog"]
+    write_ascii_to_memmap_tree(
+        ascii_fname, column_info_fname, output_dirname, colnames, stats=stats
+    )
+    stages = stats.as_dict()["stages"]
+    for name in ("header_parse", "tokenize", "dtype_conversion", "memmap_write"):
+        assert stages[name]["calls"] > 0
+    assert stages["tokenize"]["rows"] == 100
+    assert stages["dtype_conversion"]["calls"] == len(colnames)
+    assert stages["memmap_write"]["files_opened"] == len(colnames)
+
+    mock = load_mock_from_binaries([0], str(tmp_path / "a_0.399872"), colnames)
+    nbytes = sum(mock[key].nbytes for key in colnames)
+    assert stages["memmap_write"]["bytes_written"] == nbytes
+
+
+def test_stats_none_gives_identical_results(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_subvolume(root_dirname, 0, x=np.arange(10.0))
+    mock = load_mock_from_binaries([0], root_dirname, ["x"])
+    mock2 = load_mock_from_binaries([0], root_dirname, ["x"], stats=IOStats())
+    assert np.all(mock["x"] == mock2["x"])
+
+
+def test_json_lines_progress_log(tmp_path):
+    fname = str(tmp_path / "progress.jsonl")
+    stats = IOStats()
+    stats.add("tokenize", 1.0, rows=5)
+    with JsonLinesProgressLog(fname) as log:
+        log.write("start", scale_factor="1.002310")
+        log.write("subvolume_done", subvol=3, **stats.as_dict())
+
+    with open(fname, "r") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["event"] for r in records] == ["start", "subvolume_done"]
+    assert records[1]["subvol"] == 3
+    assert records[1]["stages"]["tokenize"]["rows"] == 5
+    assert records[1]["time"] >= records[0]["time"]
@@ -0,0 +1,138 @@
+""" """
+
+import numpy as np
+from astropy.table import Table
+
+from ..derived_columns import write_derived_columns
+from ..load_mock import (
+    compute_host_index,
+    load_mock_from_binaries,
+    load_multisnap_mock_from_binaries,
+    propagate_host_properties,
+    value_added_mock,
+)
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+
+
+def test_load_multisnap_mock_from_binaries_alignment(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    ids_a = rng.choice(np.arange(1000), 100, replace=False).astype("i8")
+    ids_b = np.concatenate((rng.permutation(ids_a[:60]), np.arange(2000, 2010)))
+
+    drn_a = str(tmp_path / "a_0.668185")
+    drn_b = str(tmp_path / "a_1.002310")
+    for subvol, rows in enumerate((slice(0, 40), slice(40, None))):
+        write_fake_subvolume(drn_a, subvol, halo_id=ids_a[rows], sm=ids_a[rows] * 2.0)
+    for subvol, rows in enumerate((slice(0, 30), slice(30, None))):
+        write_fake_subvolume(drn_b, subvol, halo_id=ids_b[rows], sm=ids_b[rows] * 3.0)
+
+    mock = load_multisnap_mock_from_binaries((0, 1), [drn_a, drn_b], galprops=["sm"])
+    assert len(mock) == len(ids_a)
+    assert np.all(mock["has_match_a_0.668185"])
+    assert np.allclose(mock["sm_a_0.668185"], mock["halo_id"] * 2.0)
+
+    has_match = mock["has_match_a_1.002310"]
+    assert np.count_nonzero(has_match) == 60
+    assert np.all(np.isin(mock["halo_id"][has_match], ids_b))
+    assert np.allclose(
+        mock["sm_a_1.002310"][has_match], mock["halo_id"][has_match] * 3.0
+    )
+    assert np.allclose(
+        mock["halo_id_a_1.002310"][has_match], mock["halo_id"][has_match]
+    )
+    assert np.all(mock["sm_a_1.002310"][~has_match] == 0)
+
+
+def test_load_multisnap_mock_from_binaries_custom_suffixes(tmp_path):
+    ids = np.arange(10).astype("i8")
+    for drn in ("snap1", "snap2"):
+        write_fake_subvolume(str(tmp_path / drn), 0, halo_id=ids, sm=ids * 1.0)
+    mock = load_multisnap_mock_from_binaries(
+        (0,),
+        [str(tmp_path / "snap1"), str(tmp_path / "snap2")],
+        "sm",
+        suffixes=("z0", "z1"),
+    )
+    assert mock.keys() == [
+        "halo_id",
+        "sm_z0",
+        "halo_id_z0",
+        "has_match_z0",
+        "sm_z1",
+        "halo_id_z1",
+        "has_match_z1",
+    ]
+
+
+def test_load_multisnap_mock_from_binaries_host_row(tmp_path):
+    drn_a = str(tmp_path / "snap_a")
+    drn_b = str(tmp_path / "snap_b")
+    nrows = (200, 100)
+    write_fake_tree(drn_a, nrows)
+    #  The second snapshot stores a shuffled subset of the galaxies
+    rng = np.random.RandomState(fixed_seed)
+    for subvol, n in enumerate(nrows):
+        snap = load_mock_from_binaries([subvol], drn_a, ["halo_id", "upid"])
+        rows = rng.permutation(n)[: int(0.8 * n)]
+        write_fake_subvolume(
+            drn_b,
+            subvol,
+            halo_id=np.array(snap["halo_id"][rows]),
+            upid=np.array(snap["upid"][rows]),
+        )
+    write_derived_columns(drn_b, range(len(nrows)))
+
+    mock = load_multisnap_mock_from_binaries(
+        (0, 1), [drn_a, drn_b], ["upid", "host_row"], suffixes=("a", "b")
+    )
+    halo_id_b = mock["halo_id"][mock["has_match_b"]]
+    for suffix in ("a", "b"):
+        host_row = mock["host_row_" + suffix]
+        upid = mock["upid_" + suffix]
+        hostid = np.where(upid == -1, mock["halo_id"], upid)
+        has_host = host_row >= 0
+        assert np.all(mock["halo_id"][host_row[has_host]] == hostid[has_host])
+    assert np.all(mock["host_row_b"][~mock["has_match_b"]] == -1)
+    no_host_b = mock["has_match_b"] & (mock["host_row_b"] == -1)
+    assert np.all(np.isin(hostid[no_host_b], halo_id_b, invert=True))
+
+
+def _fake_mock():
+    mock = Table()
+    mock["halo_id"] = np.array([10, 11, 12, 13, 14, 15])
+    mock["upid"] = np.array([-1, 10, 10, -1, 13, 99])
+    mock["x"] = np.array([-1.0, 1.0, 249.0, 251.0, 5.0, 7.0])
+    mock["y"] = np.zeros(6)
+    mock["rvir"] = np.array([1000.0, 100.0, 50.0, 500.0, 40.0, 30.0])
+    mock["mvir"] = np.array([1e14, 1e12, 1e11, 1e13, 1e11, 1e10])
+    mock["sm"] = np.array([1e11, 1e10, 1e9, 5e10, 1e9, 1e8])
+    return mock
+
+
+def test_value_added_mock_default_behavior():
+    mock = value_added_mock(_fake_mock(), 250.0)
+    assert np.all(mock["halo_hostid"] == (10, 10, 10, 13, 13, 99))
+    assert np.allclose(mock["x"], (249.0, 1.0, 249.0, 1.0, 5.0, 7.0))
+    assert np.allclose(mock["rvir"], (1.0, 0.1, 0.05, 0.5, 0.04, 0.03))
+    assert np.allclose(mock["host_halo_rvir"], (1.0, 1.0, 1.0, 0.5, 0.5, 0.03))
+    assert np.allclose(mock["host_halo_mvir"], (1e14, 1e14, 1e14, 1e13, 1e13, 1e10))
+    assert "host_halo_sm" not in mock.keys()
+
+
+def test_value_added_mock_reuses_host_index():
+    mock, host_index = value_added_mock(
+        _fake_mock(), 250.0, ("sm", "x"), return_host_index=True
+    )
+    assert np.all(host_index == (0, 0, 0, 3, 3, 5))
+    assert np.allclose(mock["host_halo_x"], (249.0, 249.0, 249.0, 1.0, 1.0, 7.0))
+
+    mock2 = value_added_mock(_fake_mock(), 250.0, ("sm",), host_index=host_index)
+    assert np.all(mock2["host_halo_sm"] == mock["host_halo_sm"])
+
+    propagate_host_properties(mock2, ["mvir", "sm"], host_index, prefix="host_")
+    assert np.all(mock2["host_sm"] == mock["host_halo_sm"])
+    assert np.all(
+        compute_host_index(mock["halo_hostid"], mock["halo_id"]) == host_index
+    )
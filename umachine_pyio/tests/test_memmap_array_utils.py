@@ -6,10 +6,19 @@ import numpy as np
 import pytest
 
 from ..directory_tree_utils import memmap_fname_iterator
-from ..memmap_array_utils import read_ndarray_from_memmap_sequence
+from ..load_mock import load_mock_from_binaries
+from ..memmap_array_utils import (
+    read_ndarray_from_memmap_sequence,
+    read_trimmed_history_from_subvolumes,
+    trim_history,
+    untrim_history,
+    write_trimmed_history_to_memmap,
+)
+from .testing_data import write_fake_subvolume
 
 z0_root_dirname = "/Users/aphearin/work/UniverseMachine/data/0126_binaries/a_1.002310"
 MSG_HAS_TEST_DATA = "This test only runs on APH_MACHINE"
+fixed_seed = 43
 
 
 if os.path.isdir(z0_root_dirname):
@@ -40,3 +49,62 @@ def test_read_ndarray_from_memmap_sequence1():
     assert np.shape(arr2)[1] == 178
 
     assert arr1.shape[0] == arr2.shape[0]
+
+
+def _fake_histories(rng, num_gals, num_scales):
+    history = rng.uniform(0, 1, (num_gals, num_scales))
+    formation_index = rng.randint(0, num_scales + 1, num_gals)
+    history[np.arange(num_scales) < formation_index[:, np.newaxis]] = 0.0
+    history[0] = 0.0
+    history[1, 5] = 0.0
+    return history
+
+
+def test_trim_history_round_trip():
+    rng = np.random.RandomState(fixed_seed)
+    history = _fake_histories(rng, 500, 30)
+    start, values = trim_history(history)
+    assert start[0] == 30
+    assert np.all(history[np.arange(500), np.minimum(start, 29)][start < 30] != 0)
+    assert len(values) == np.sum(30 - start.astype(int))
+    assert np.all(untrim_history(start, values, 30) == history)
+
+
+def test_read_trimmed_history_from_subvolumes(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    root_dirname = str(tmp_path)
+    history = _fake_histories(rng, 300, 20)
+    row_slices = (slice(0, 120), slice(120, 120), slice(120, None))
+    subvol_dirnames = []
+    for subvol, rows in enumerate(row_slices):
+        subvol_dirname = write_fake_subvolume(
+            root_dirname, subvol, halo_id=np.arange(300)[rows]
+        )
+        write_trimmed_history_to_memmap(history[rows], subvol_dirname, "sfr_history")
+        subvol_dirnames.append(subvol_dirname)
+
+    assert np.all(
+        read_trimmed_history_from_subvolumes(subvol_dirnames, "sfr_history") == history
+    )
+
+    index_rows = np.array((5, 170, 0, 5, 179))
+    row_selections = [slice(10, 50), None, index_rows]
+    result = read_trimmed_history_from_subvolumes(
+        subvol_dirnames, "sfr_history", row_selections
+    )
+    correct = np.concatenate((history[10:50], history[120:][index_rows]))
+    assert np.all(result == correct)
+
+    start, offsets, values = read_trimmed_history_from_subvolumes(
+        subvol_dirnames, "sfr_history", row_selections, ragged=True
+    )
+    for i in range(len(correct)):
+        assert np.all(correct[i, : start[i]] == 0)
+        assert np.all(correct[i, start[i] :] == values[offsets[i] : offsets[i + 1]])
+
+    mock = load_mock_from_binaries(
+        (0, 1, 2), root_dirname, ["halo_id", "sfr_history"], [(10, 50), None, None]
+    )
+    assert np.all(
+        mock["sfr_history"] == np.concatenate((history[10:50], history[120:]))
+    )
@@ -0,0 +1,110 @@
+""" """
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ..instrumentation import IOStats
+from ..load_mock import load_mock_from_binaries
+from ..memmap_cache import (
+    MemmapCache,
+    clear_memmap_cache,
+    configure_memmap_cache,
+    get_memmap_cache,
+)
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+
+
+def test_repeated_loads_skip_metadata_and_memmap_opens(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (100,) * 3, derived_columns=False)
+    galprops = ["x", "halo_id", "sm_history"]
+    clear_memmap_cache()
+
+    stats = IOStats()
+    mock = load_mock_from_binaries(range(3), root_dirname, galprops, stats=stats)
+    stats2 = IOStats()
+    mock2 = load_mock_from_binaries(range(3), root_dirname, galprops, stats=stats2)
+    for key in galprops:
+        assert np.all(mock[key] == mock2[key])
+
+    stages = stats.as_dict()["stages"]
+    stages2 = stats2.as_dict()["stages"]
+    assert stages["memmap_read"]["files_opened"] == 9
+    assert stages2["memmap_read"]["files_opened"] == 0
+    assert stages2["sidecar_read"]["files_opened"] == 0
+    assert get_memmap_cache().info()["hits"] > 0
+
+
+def test_cache_is_invalidated_by_modified_files(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (100,), derived_columns=False)
+    x = load_mock_from_binaries([0], root_dirname, ["x"])["x"]
+
+    #  Rewrite the column through the package
+    write_fake_subvolume(root_dirname, 0, x=np.arange(50.0))
+    assert np.all(
+        load_mock_from_binaries([0], root_dirname, ["x"])["x"] == np.arange(50)
+    )
+
+    #  Rewrite the column behind the back of the package
+    memmap_fname = os.path.join(root_dirname, "subvol_0", "x", "x.memmap")
+    shape_fname = os.path.join(root_dirname, "subvol_0", "x", "x_shape_and_dtype.txt")
+    x[:].tofile(memmap_fname)
+    with open(shape_fname, "w") as f:
+        f.write("shape {0}\ndtype <f8\n".format(len(x)))
+    assert np.all(load_mock_from_binaries([0], root_dirname, ["x"])["x"] == x)
+
+
+def test_handles_are_bounded_and_evicted_in_lru_order(tmp_path):
+    fnames = []
+    for i in range(4):
+        fname = str(tmp_path / "arr{0}.memmap".format(i))
+        np.arange(10.0 + i).tofile(fname)
+        fnames.append(fname)
+
+    cache = MemmapCache(max_handles=2)
+    for i, fname in enumerate(fnames):
+        mmp, is_cached = cache.memmap(fname, (10 + i,), np.float64)
+        assert not is_cached
+        assert np.all(mmp == np.arange(10.0 + i))
+    assert cache.info()["num_handles"] == 2
+    assert cache.memmap(fnames[3], (13,), np.float64)[1]
+    assert cache.memmap(fnames[2], (12,), np.float64)[1]
+    assert not cache.memmap(fnames[0], (10,), np.float64)[1]
+    #  fnames[3] is now the least recently used handle
+    assert not cache.memmap(fnames[3], (13,), np.float64)[1]
+
+
+def test_concurrent_loads_and_disabled_cache(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (100,) * 4, derived_columns=False)
+    galprops = ["x", "halo_id", "sm_history"]
+    expected = load_mock_from_binaries(range(4), root_dirname, galprops)
+
+    try:
+        configure_memmap_cache(max_handles=3, max_metadata_entries=5)
+
+        def load(subvolumes):
+            return load_mock_from_binaries(subvolumes, root_dirname, galprops)
+
+        tasks = [[i % 4, (i + 1) % 4] for i in range(40)]
+        with ThreadPoolExecutor(4) as executor:
+            mocks = list(executor.map(load, tasks))
+        for subvolumes, mock in zip(tasks, mocks):
+            rows = np.concatenate([np.arange(100) + 100 * s for s in subvolumes])
+            for key in galprops:
+                assert np.all(mock[key] == expected[key][rows])
+        info = get_memmap_cache().info()
+        assert info["num_handles"] <= 3
+        assert info["num_metadata_entries"] <= 5
+
+        configure_memmap_cache(enabled=False)
+        assert get_memmap_cache() is None
+        mock = load_mock_from_binaries(range(4), root_dirname, galprops)
+        assert np.all(mock["x"] == expected["x"])
+    finally:
+        configure_memmap_cache()
@@ -0,0 +1,107 @@
+"""
+"""
+from multiprocessing import Pool
+
+import numpy as np
+import pytest
+
+from ..load_mock import load_mock_from_binaries
+from ..partition_utils import partition_subvolumes, subvolume_weights
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+NGALS_PER_SUBVOL = (500, 20, 30, 2000, 40, 60, 10, 300)
+
+
+def _write_unbalanced_tree(root_dirname):
+    ifirst = 0
+    for subvol, ngals in enumerate(NGALS_PER_SUBVOL):
+        halo_id = np.arange(ifirst, ifirst + ngals).astype("i8")
+        history = np.repeat(halo_id.reshape((-1, 1)), 3, axis=1).astype("f4")
+        write_fake_subvolume(root_dirname, subvol, halo_id=halo_id, history=history)
+        ifirst += ngals
+
+
+def _load_assignment(args):
+    root_dirname, subvolumes, row_ranges = args
+    mock = load_mock_from_binaries(
+        subvolumes, root_dirname, ["halo_id"], row_ranges=row_ranges
+    )
+    return np.array(mock["halo_id"])
+
+
+def test_subvolume_weights(tmp_path):
+    root_dirname = str(tmp_path)
+    _write_unbalanced_tree(root_dirname)
+    subvolumes = np.arange(len(NGALS_PER_SUBVOL))
+
+    ngals, weights = subvolume_weights(subvolumes, root_dirname)
+    assert np.all(ngals == NGALS_PER_SUBVOL)
+    assert np.allclose(weights, NGALS_PER_SUBVOL)
+
+    ngals, weights = subvolume_weights(
+        subvolumes, root_dirname, "nbytes", ["halo_id", "history"]
+    )
+    assert np.allclose(weights, ngals * (8 + 3 * 4))
+
+    with pytest.raises(ValueError):
+        subvolume_weights(subvolumes, root_dirname, "nrows")
+
+
+@pytest.mark.parametrize("split_large", (False, True))
+def test_partition_subvolumes_covers_every_row_once(tmp_path, split_large):
+    root_dirname = str(tmp_path)
+    _write_unbalanced_tree(root_dirname)
+    subvolumes = np.arange(len(NGALS_PER_SUBVOL))
+    nranks = 3
+
+    assignments = partition_subvolumes(
+        subvolumes, root_dirname, nranks, split_large=split_large
+    )
+    assert len(assignments) == nranks
+    rank1 = partition_subvolumes(
+        subvolumes, root_dirname, nranks, rank=1, split_large=split_large
+    )
+    assert rank1 == assignments[1]
+
+    args = [(root_dirname, *assignment) for assignment in assignments]
+    with Pool(2) as pool:
+        results = pool.map(_load_assignment, args)
+    halo_ids = np.sort(np.concatenate(results))
+    assert np.all(halo_ids == np.arange(sum(NGALS_PER_SUBVOL)))
+
+    loads = np.array([len(r) for r in results])
+    if split_large:
+        assert loads.max() <= 1.5 * loads.mean()
+    else:
+        assert loads.max() == max(NGALS_PER_SUBVOL)
+
+
+@pytest.mark.parametrize("nranks", (2, 3, 4, 7))
+def test_split_large_bounds_the_largest_rank_workload(tmp_path, nranks):
+    root_dirname = str(tmp_path)
+    rng = np.random.RandomState(fixed_seed)
+    #  Five equal subvolumes between half and one mean workload for nranks=4
+    ngals_per_subvol = [90] * 5 + list(rng.randint(1, 200, 10))
+    for subvol, ngals in enumerate(ngals_per_subvol):
+        write_fake_subvolume(root_dirname, subvol, halo_id=np.arange(ngals))
+    subvolumes = np.arange(len(ngals_per_subvol))
+
+    for galaxies in (ngals_per_subvol[:5], ngals_per_subvol):
+        assignments = partition_subvolumes(
+            subvolumes[: len(galaxies)], root_dirname, nranks, split_large=True
+        )
+        loads = [sum(b - a for a, b in row_ranges) for __, row_ranges in assignments]
+        assert sum(loads) == sum(galaxies)
+        assert max(loads) <= 1.5 * sum(galaxies) / nranks + 1
+
+
+def test_load_mock_from_binaries_row_ranges(tmp_path):
+    root_dirname = str(tmp_path)
+    _write_unbalanced_tree(root_dirname)
+    mock = load_mock_from_binaries(
+        (0, 3, 3), root_dirname, ["halo_id", "history"], [(5, 10), None, (0, 0)]
+    )
+    correct_ids = np.concatenate((np.arange(5, 10), np.arange(550, 2550)))
+    assert np.all(mock["halo_id"] == correct_ids)
+    assert mock["history"].shape == (len(correct_ids), 3)
@@ -0,0 +1,61 @@
+""" """
+
+import threading
+
+import numpy as np
+import pytest
+
+from ..load_mock import load_mock_from_binaries
+from ..prefetch import SubvolumePrefetcher, prefetch_subvolumes
+from .testing_data import write_fake_tree
+
+fixed_seed = 43
+NROWS = (13, 0, 41, 7, 29, 22)
+
+
+def test_prefetcher_agrees_with_load_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, NROWS, trimmed_colnames=["sfr_history"])
+    galprops = ["x", "halo_id", "sfr_history"]
+    subvolumes = [4, 0, 5, 2]
+
+    with SubvolumePrefetcher(subvolumes, root_dirname, galprops, 2) as prefetcher:
+        items = list(prefetcher)
+    assert [subvol for subvol, __ in items] == subvolumes
+    for subvol, columns in items:
+        assert list(columns.keys()) == galprops
+        mock = load_mock_from_binaries([subvol], root_dirname, galprops)
+        for key in galprops:
+            assert np.all(columns[key] == mock[key])
+
+
+def test_prefetcher_cancellation_stops_thread(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, NROWS, trimmed_colnames=["sfr_history"])
+    num_threads = threading.active_count()
+
+    prefetcher = SubvolumePrefetcher(range(6), root_dirname, ["x"], 1)
+    subvol, __ = next(prefetcher)
+    assert subvol == 0
+    prefetcher.close()
+    assert not prefetcher._thread.is_alive()
+    assert threading.active_count() == num_threads
+    assert list(prefetcher) == []
+
+    gen = prefetch_subvolumes(range(6), root_dirname, ["x"], 1)
+    for subvol, __ in gen:
+        if subvol == 2:
+            break
+    gen.close()
+    assert threading.active_count() == num_threads
+
+
+def test_prefetcher_reraises_read_errors(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, NROWS[:2], trimmed_colnames=["sfr_history"])
+    prefetcher = SubvolumePrefetcher([0, 1, 2], root_dirname, ["x"])
+    assert next(prefetcher)[0] == 0
+    assert next(prefetcher)[0] == 1
+    with pytest.raises(AssertionError):
+        next(prefetcher)
+    assert not prefetcher._thread.is_alive()
@@ -0,0 +1,135 @@
+"""
+"""
+from multiprocessing import Pool
+
+import numpy as np
+import pytest
+
+from ..load_mock import load_mock_from_binaries
+from ..shared_memory_utils import (
+    attach_shared_mock,
+    load_mock_into_shared_memory,
+    share_mock_memmaps,
+)
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+
+
+def _write_tree(root_dirname):
+    rng = np.random.RandomState(fixed_seed)
+    for subvol in range(3):
+        ngals = 100 + 10 * subvol
+        write_fake_subvolume(
+            root_dirname,
+            subvol,
+            sm=rng.uniform(0, 1, ngals),
+            sm_history=rng.uniform(0, 1, (ngals, 5)).astype("f4"),
+        )
+
+
+def _sum_shared_columns(spec):
+    shared_mock = attach_shared_mock(spec)
+    result = dict()
+    for colname in shared_mock.keys():
+        arr = shared_mock[colname]
+        if isinstance(arr, list):
+            result[colname] = sum(float(a.sum()) for a in arr)
+        else:
+            result[colname] = float(arr.sum())
+    shared_mock.close()
+    return result
+
+
+def test_load_mock_into_shared_memory(tmp_path):
+    root_dirname = str(tmp_path)
+    _write_tree(root_dirname)
+    subvolumes = (0, 1, 2)
+    galprops = ("sm", "sm_history")
+    mock = load_mock_from_binaries(subvolumes, root_dirname, galprops)
+
+    with load_mock_into_shared_memory(subvolumes, root_dirname, galprops) as shared:
+        assert list(shared.keys()) == list(galprops)
+        for galprop in galprops:
+            assert np.all(shared[galprop] == mock[galprop])
+            assert shared[galprop].dtype == mock[galprop].dtype
+
+        with Pool(2) as pool:
+            results = pool.map(_sum_shared_columns, [shared.spec] * 2)
+        for result in results:
+            for galprop in galprops:
+                assert np.isclose(result[galprop], mock[galprop].sum())
+
+        spec = shared.spec
+
+    with pytest.raises(FileNotFoundError):
+        attach_shared_mock(spec)
+
+
+def test_load_mock_into_shared_memory_row_ranges(tmp_path):
+    root_dirname = str(tmp_path)
+    _write_tree(root_dirname)
+    row_ranges = ((5, 10), (0, 0), None)
+    mock = load_mock_from_binaries((0, 1, 2), root_dirname, "sm", row_ranges)
+    with load_mock_into_shared_memory((0, 1, 2), root_dirname, "sm", row_ranges) as s:
+        assert np.all(s["sm"] == mock["sm"])
+
+
+def test_share_mock_memmaps(tmp_path):
+    root_dirname = str(tmp_path)
+    _write_tree(root_dirname)
+    subvolumes = (0, 2)
+    mock = load_mock_from_binaries(subvolumes, root_dirname, ["sm", "sm_history"])
+
+    with share_mock_memmaps(subvolumes, root_dirname, ["sm", "sm_history"]) as shared:
+        assert list(shared.keys()) == ["sm", "sm_history"]
+        assert len(shared["sm"]) == len(subvolumes)
+        assert np.all(np.concatenate(shared["sm_history"]) == mock["sm_history"])
+        with Pool(2) as pool:
+            results = pool.map(_sum_shared_columns, [shared.spec] * 2)
+    for result in results:
+        assert np.isclose(result["sm"], mock["sm"].sum())
+
+
+def test_shared_host_row_agrees_with_load_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (300, 0, 200))
+    subvolumes = (0, 1, 2)
+    galprops = ["halo_id", "host_row"]
+    for row_ranges in (None, ((50, 250), None, (20, 180))):
+        mock = load_mock_from_binaries(subvolumes, root_dirname, galprops, row_ranges)
+        with load_mock_into_shared_memory(
+            subvolumes, root_dirname, galprops, row_ranges
+        ) as shared:
+            assert np.all(shared["host_row"] == mock["host_row"])
+
+    with share_mock_memmaps((2, 0), root_dirname, galprops) as shared:
+        for subvol, host_row in zip((2, 0), shared["host_row"]):
+            mock = load_mock_from_binaries([subvol], root_dirname, galprops)
+            assert np.all(host_row == mock["host_row"])
+
+
+def test_shared_trimmed_history_agrees_with_load_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (300, 0, 200), trimmed_colnames=("sm_history",))
+    subvolumes = (0, 1, 2)
+    galprops = ["sm_history", "x"]
+    for row_ranges in (None, ((50, 250), None, (20, 180))):
+        mock = load_mock_from_binaries(subvolumes, root_dirname, galprops, row_ranges)
+        with load_mock_into_shared_memory(
+            subvolumes, root_dirname, galprops, row_ranges
+        ) as shared:
+            for galprop in galprops:
+                assert np.all(shared[galprop] == mock[galprop])
+                assert shared[galprop].dtype == mock[galprop].dtype
+
+    mock = load_mock_from_binaries((2, 0), root_dirname, galprops)
+    with share_mock_memmaps((2, 0), root_dirname, galprops) as shared:
+        assert np.all(np.concatenate(shared["sm_history"]) == mock["sm_history"])
+        with Pool(2) as pool:
+            results = pool.map(_sum_shared_columns, [shared.spec] * 2)
+        spec = shared.spec
+    for result in results:
+        assert np.isclose(result["sm_history"], mock["sm_history"].sum())
+    with pytest.raises(FileNotFoundError):
+        attach_shared_mock(spec)
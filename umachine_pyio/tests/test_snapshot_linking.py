@@ -0,0 +1,61 @@
+""" """
+
+import numpy as np
+import pytest
+
+from ..index_utils import ORPHAN_ID_OFFSET
+from ..snapshot_linking import SnapshotLinkingIndex
+from .testing_data import write_fake_subvolume
+
+fixed_seed = 43
+
+
+def _write_fake_snapshot(root_dirname, halo_id, num_subvols):
+    for subvol, rows in enumerate(np.array_split(np.arange(len(halo_id)), num_subvols)):
+        write_fake_subvolume(root_dirname, subvol, halo_id=halo_id[rows])
+
+
+def test_snapshot_linking_index(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    #  Early snapshot: 100 surviving halos
+    early_ids = rng.choice(np.arange(1, 10000), 100, replace=False)
+    #  Late snapshot: first 60 survive, next 20 became orphans, last 20 vanish,
+    #  plus 10 new halos
+    late_ids = np.concatenate(
+        (
+            early_ids[:60],
+            early_ids[60:80] + rng.randint(1, 5, 20) * ORPHAN_ID_OFFSET,
+            np.arange(20000, 20010),
+        )
+    )
+    late_ids = rng.permutation(late_ids)
+
+    early_dirname = str(tmp_path / "a_0.5")
+    late_dirname = str(tmp_path / "a_1.0")
+    _write_fake_snapshot(early_dirname, early_ids, 3)
+    _write_fake_snapshot(late_dirname, late_ids, 2)
+
+    linking_index = SnapshotLinkingIndex(str(tmp_path / "linking_index"))
+    linking_index.add_snapshot(early_dirname, range(3))
+    linking_index.add_snapshot(late_dirname, range(2))
+    assert linking_index.snapshot_names == ["a_0.5", "a_1.0"]
+
+    #  Reopen from disk to check persistence
+    linking_index = SnapshotLinkingIndex(str(tmp_path / "linking_index"))
+
+    rows = linking_index.link(early_ids, "a_1.0")
+    assert np.all(rows[:60] >= 0)
+    assert np.all(late_ids[rows[:60]] == early_ids[:60])
+    assert np.all(late_ids[rows[60:80]] % ORPHAN_ID_OFFSET == early_ids[60:80])
+    assert np.all(rows[80:] == -1)
+
+    #  Orphans of the late snapshot link back to their surviving progenitor
+    back_rows = linking_index.link_rows("a_1.0", rows[:80], "a_0.5")
+    assert np.all(back_rows == np.arange(80))
+
+    subvol, subvol_row = linking_index.subvolume_and_row("a_0.5", [0, 33, 34, 99, -1])
+    assert np.all(subvol == (0, 0, 1, 2, -1))
+    assert np.all(subvol_row == (0, 33, 0, 32, -1))
+
+    with pytest.raises(ValueError):
+        linking_index.link(early_ids, "a_0.7")
@@ -0,0 +1,101 @@
+""" """
+
+import pickle
+
+import numpy as np
+import pytest
+
+from ..spatial_index import PeriodicCellList
+
+fixed_seed = 43
+LBOX = 50.0
+
+
+def _periodic_distances(pos1, pos2, Lbox):
+    dpos = np.abs(pos1[:, np.newaxis, :] - pos2[np.newaxis, :, :])
+    dpos = np.minimum(dpos, Lbox - dpos)
+    return np.sqrt(np.sum(dpos * dpos, axis=2))
+
+
+def _random_points(rng, n):
+    pos = rng.uniform(0, LBOX, (n, 3))
+    #  Put some points exactly on the boundaries of the box
+    pos[:5] = 0.0
+    pos[5:10, 0] = LBOX
+    return pos
+
+
+@pytest.mark.parametrize("num_cells_per_dim", (None, 1, 3, 7))
+def test_query_radius_agrees_with_brute_force(num_cells_per_dim):
+    rng = np.random.RandomState(fixed_seed)
+    pos = _random_points(rng, 500)
+    qpos = rng.uniform(-10, LBOX + 10, (60, 3))
+    r = rng.uniform(0, 10, len(qpos))
+    cell_list = PeriodicCellList(*pos.T, LBOX, num_cells_per_dim)
+
+    idx_query, idx_point = cell_list.query_radius(*qpos.T, r, chunk_size=17)
+    dist = _periodic_distances(np.mod(qpos, LBOX), np.mod(pos, LBOX), LBOX)
+    idx_query2, idx_point2 = np.nonzero(dist <= r[:, np.newaxis])
+    assert np.all(idx_query == idx_query2)
+    assert np.all(idx_point == idx_point2)
+
+    counts = cell_list.count_within(*qpos.T, r, num_workers=3, chunk_size=7)
+    assert np.all(counts == np.sum(dist <= r[:, np.newaxis], axis=1))
+
+
+def test_pairs_agree_with_brute_force():
+    rng = np.random.RandomState(fixed_seed)
+    pos = _random_points(rng, 400)
+    cell_list = PeriodicCellList(*pos.T, LBOX)
+    rmax = 4.0
+
+    i, j, dist = cell_list.pairs(rmax, chunk_size=50, return_distances=True)
+    i2, j2 = cell_list.pairs(rmax, num_workers=4, chunk_size=33)
+    all_dist = _periodic_distances(np.mod(pos, LBOX), np.mod(pos, LBOX), LBOX)
+    i3, j3 = np.nonzero(np.triu(all_dist <= rmax, k=1))
+    assert len(i3) > 0
+    assert np.all(i == i3) & np.all(j == j3)
+    assert np.all(i2 == i3) & np.all(j2 == j3)
+    assert np.allclose(dist, all_dist[i3, j3])
+
+
+def test_counts_in_cells():
+    rng = np.random.RandomState(fixed_seed)
+    pos = _random_points(rng, 1000)
+    cell_list = PeriodicCellList(*pos.T, LBOX)
+    counts = cell_list.counts_in_cells(5)
+    assert counts.shape == (5, 5, 5)
+    assert counts.sum() == 1000
+    cells = np.minimum((np.mod(pos, LBOX) / 10).astype(int), 4)
+    in_cell = np.all(cells == (1, 2, 3), axis=1)
+    assert counts[1, 2, 3] == in_cell.sum()
+
+
+def test_save_load_and_pickle(tmp_path):
+    rng = np.random.RandomState(fixed_seed)
+    pos = _random_points(rng, 300)
+    qpos = rng.uniform(0, LBOX, (20, 3))
+    cell_list = PeriodicCellList(*pos.T, LBOX)
+    cell_list.save(str(tmp_path / "cell_list"))
+    cell_list2 = PeriodicCellList.load(str(tmp_path / "cell_list"))
+    assert len(cell_list2) == 300
+
+    result = cell_list.query_radius(*qpos.T, 6.0)
+    result2 = cell_list2.query_radius(*qpos.T, 6.0)
+    result3 = pickle.loads(pickle.dumps(cell_list2)).query_radius(*qpos.T, 6.0)
+    for a, b, c in zip(result, result2, result3):
+        assert np.all(a == b) & np.all(a == c)
+    assert len(pickle.dumps(cell_list2)) < 1000
+
+
+def test_empty_inputs():
+    cell_list = PeriodicCellList([], [], [], LBOX)
+    idx_query, idx_point = cell_list.query_radius([1.0], [1.0], [1.0], 5.0)
+    assert len(idx_query) == len(idx_point) == 0
+    assert np.all(cell_list.count_within([1.0], [1.0], [1.0], 5.0) == 0)
+    assert len(cell_list.pairs(1.0)[0]) == 0
+
+    cell_list = PeriodicCellList(*np.ones((3, 5)), LBOX)
+    assert len(cell_list.count_within([], [], [], 1.0)) == 0
+    with pytest.raises(AssertionError):
+        cell_list.count_within([1.0], [1.0], [1.0], LBOX)
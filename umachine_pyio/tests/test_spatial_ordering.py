@@ -0,0 +1,115 @@
+""" """
+
+import os
+
+import numpy as np
+
+from ..load_mock import load_mock_from_binaries
+from ..spatial_ordering import (
+    SPATIAL_BLOCKS_DIRNAME,
+    box_row_selections,
+    load_mock_in_box,
+    morton_keys,
+    reorder_subvolume_rows,
+    write_spatial_blocks,
+)
+from .testing_data import write_fake_tree
+
+fixed_seed = 43
+LBOX = 100.0
+
+
+def test_morton_keys_order_nearby_points_together():
+    x = np.array([0.0, 1.0, 0.0, 1.0, 0.0, 1.0, 0.0, 1.0])
+    y = np.array([0.0, 0.0, 1.0, 1.0, 0.0, 0.0, 1.0, 1.0])
+    z = np.array([0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 1.0])
+    keys = morton_keys(x, y, z, bits_per_dim=1)
+    assert np.all(keys == [0, 4, 2, 6, 1, 5, 3, 7])
+    assert len(morton_keys([], [], [])) == 0
+
+
+def test_reordering_permutes_every_column_consistently(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (300, 0, 50)
+    write_fake_tree(root_dirname, nrows, Lbox=LBOX, trimmed_colnames=["sfr_history"])
+    galprops = ["x", "y", "z", "halo_id", "upid", "sm_history", "sfr_history"]
+    galprops += ["halo_hostid", "host_row"]
+    subvolumes = list(range(len(nrows)))
+    mock = load_mock_from_binaries(subvolumes, root_dirname, galprops)
+
+    reorder_subvolume_rows(root_dirname, subvolumes, block_size=16)
+    mock2 = load_mock_from_binaries(
+        subvolumes, root_dirname, galprops + ["original_row"]
+    )
+    offsets = np.repeat(np.cumsum(nrows) - nrows, nrows)
+    idx = mock2["original_row"] + offsets
+    for key in galprops:
+        if key != "host_row":
+            assert np.all(mock2[key] == mock[key][idx])
+
+    has_host = mock2["host_row"] >= 0
+    assert np.all(has_host == (mock["host_row"][idx] >= 0))
+    host_id = mock2["halo_id"][mock2["host_row"][has_host]]
+    assert np.all(host_id == mock2["halo_hostid"][has_host])
+
+    keys = morton_keys(mock2["x"][:300], mock2["y"][:300], mock2["z"][:300])
+    assert np.all(np.diff(keys.astype(float)) >= 0)
+
+    #  Reordering again leaves the subvolumes unchanged
+    reorder_subvolume_rows(root_dirname, subvolumes, block_size=16)
+    mock3 = load_mock_from_binaries(
+        subvolumes, root_dirname, galprops + ["original_row"]
+    )
+    for key in mock3.keys():
+        assert np.all(mock3[key] == mock2[key])
+
+
+def test_box_reads_agree_with_brute_force(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (400, 0, 250)
+    write_fake_tree(root_dirname, nrows, Lbox=LBOX, trimmed_colnames=["sfr_history"])
+    subvolumes = list(range(len(nrows)))
+    galprops = ["x", "y", "z", "halo_id", "sfr_history"]
+    write_spatial_blocks(root_dirname, subvolumes, block_size=32)
+    mock = load_mock_from_binaries(subvolumes, root_dirname, galprops)
+    pos = np.vstack((mock["x"], mock["y"], mock["z"])).T
+
+    rng = np.random.RandomState(fixed_seed)
+    for __ in range(10):
+        box_min = rng.uniform(-20, LBOX, 3)
+        box_max = box_min + rng.uniform(0, 40, 3)
+        boxed = load_mock_in_box(
+            subvolumes, root_dirname, box_min, box_max, galprops, Lbox=LBOX
+        )
+        dpos = np.mod(pos - box_min, LBOX)
+        inside = np.all(dpos < box_max - box_min, axis=1)
+        assert np.all(np.sort(boxed["halo_id"]) == np.sort(mock["halo_id"][inside]))
+        for key in galprops:
+            assert np.all(boxed[key] == mock[key][inside])
+
+    row_selections = box_row_selections(
+        subvolumes, root_dirname, (10, 10, 10), (30, 30, 30)
+    )
+    inside = np.all((pos >= 10) & (pos < 30), axis=1)
+    assert sum(len(rows) for rows in row_selections) == inside.sum()
+
+
+def test_reordering_reduces_blocks_touched_by_box_reads(tmp_path):
+    root_dirname = str(tmp_path)
+    write_fake_tree(root_dirname, (4000,), Lbox=LBOX, trimmed_colnames=["sfr_history"])
+    blocks_dirname = os.path.join(root_dirname, SPATIAL_BLOCKS_DIRNAME, "subvol_0")
+
+    def num_overlapping_blocks():
+        block_min = np.fromfile(
+            os.path.join(blocks_dirname, "block_min", "block_min.memmap")
+        ).reshape((-1, 3))
+        block_max = np.fromfile(
+            os.path.join(blocks_dirname, "block_max", "block_max.memmap")
+        ).reshape((-1, 3))
+        lo, hi = np.zeros(3), np.zeros(3) + 10
+        return np.sum(np.all(block_max >= lo, axis=1) & np.all(block_min < hi, axis=1))
+
+    write_spatial_blocks(root_dirname, [0], block_size=64)
+    num_blocks_unordered = num_overlapping_blocks()
+    reorder_subvolume_rows(root_dirname, [0], block_size=64)
+    assert num_overlapping_blocks() < num_blocks_unordered / 4
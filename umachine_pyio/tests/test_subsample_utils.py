@@ -0,0 +1,105 @@
+""" """
+
+import numpy as np
+import pytest
+
+from ..load_mock import load_mock_from_binaries
+from ..spatial_ordering import reorder_subvolume_rows
+from ..subsample_utils import (
+    hash_uniform,
+    load_subsample_from_binaries,
+    subsample_row_selections,
+    write_subsample_index,
+)
+from .testing_data import write_fake_subvolume, write_fake_tree
+
+fixed_seed = 43
+GALPROPS = ["halo_id", "upid", "x", "sm_history", "host_row"]
+
+
+def test_hash_uniform_is_reproducible_and_uniform():
+    ids = np.arange(100000)
+    u = hash_uniform(ids, seed=3)
+    assert np.all((u >= 0) & (u < 1))
+    assert np.all(u == hash_uniform(ids, seed=3))
+    assert not np.all(u == hash_uniform(ids, seed=4))
+    assert np.all(u[::7] == hash_uniform(ids[::7], seed=3))
+    counts = np.histogram(u, bins=10, range=(0, 1))[0]
+    assert np.all(np.abs(counts - 10000) < 500)
+
+
+def test_hash_subsample_agrees_with_masking_the_full_mock(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (2000, 0, 1500)
+    write_fake_tree(root_dirname, nrows)
+    subvolumes = list(range(len(nrows)))
+    mock = load_mock_from_binaries(subvolumes, root_dirname, GALPROPS)
+
+    fraction = 0.1
+    subsample = load_subsample_from_binaries(
+        subvolumes, root_dirname, fraction, GALPROPS, seed=7
+    )
+    mask = hash_uniform(mock["halo_id"], seed=7) < fraction
+    assert 0.05 < mask.mean() < 0.15
+    for key in ("halo_id", "upid", "x", "sm_history"):
+        assert np.all(subsample[key] == mock[key][mask])
+
+    has_host = subsample["host_row"] >= 0
+    host_id = subsample["halo_id"][subsample["host_row"][has_host]]
+    hostid = np.where(subsample["upid"] == -1, subsample["halo_id"], subsample["upid"])
+    assert np.all(host_id == hostid[has_host])
+
+    #  The index gives the same subsample, and subsamples are nested
+    write_subsample_index(root_dirname, subvolumes, seed=7)
+    subsample2 = load_subsample_from_binaries(
+        subvolumes, root_dirname, fraction, GALPROPS, seed=7
+    )
+    for key in GALPROPS:
+        assert np.all(subsample2[key] == subsample[key])
+    smaller = load_subsample_from_binaries(
+        subvolumes, root_dirname, fraction / 3, ["halo_id"], seed=7
+    )
+    assert np.all(np.isin(smaller["halo_id"], subsample["halo_id"]))
+
+
+def test_stride_subsample(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (1000, 0, 333)
+    write_fake_tree(root_dirname, nrows)
+    subvolumes = list(range(len(nrows)))
+    mock = load_mock_from_binaries(subvolumes, root_dirname, ["halo_id"])
+
+    subsample = load_subsample_from_binaries(
+        subvolumes, root_dirname, 0.01, ["halo_id"], method="stride"
+    )
+    offsets = np.cumsum(nrows) - nrows
+    rows = np.concatenate([np.arange(0, n, 100) + a for a, n in zip(offsets, nrows)])
+    assert np.all(subsample["halo_id"] == mock["halo_id"][rows])
+
+    row_selections = subsample_row_selections(subvolumes, root_dirname, 0.0)
+    assert sum(len(rows) for rows in row_selections) == 0
+    with pytest.raises(ValueError):
+        subsample_row_selections(subvolumes, root_dirname, 0.1, method="random")
+
+
+def test_stale_subsample_index_is_detected(tmp_path):
+    root_dirname = str(tmp_path)
+    nrows = (2000, 0, 1500)
+    write_fake_tree(root_dirname, nrows)
+    subvolumes = list(range(len(nrows)))
+    write_subsample_index(root_dirname, subvolumes)
+    expected = load_subsample_from_binaries(subvolumes, root_dirname, 0.05, ["halo_id"])
+
+    reorder_subvolume_rows(root_dirname, subvolumes)
+    with pytest.raises(ValueError):
+        load_subsample_from_binaries(subvolumes, root_dirname, 0.05, ["halo_id"])
+
+    write_subsample_index(root_dirname, subvolumes)
+    subsample = load_subsample_from_binaries(
+        subvolumes, root_dirname, 0.05, ["halo_id"]
+    )
+    assert np.all(np.sort(subsample["halo_id"]) == np.sort(expected["halo_id"]))
+
+    write_fake_subvolume(root_dirname, 0, halo_id=np.arange(10))
+    with pytest.raises(ValueError):
+        subsample_row_selections(subvolumes, root_dirname, 0.05)
@@ -0,0 +1,68 @@
+""" """
+
+import os
+
+import numpy as np
+
+from ..load_mock import load_mock_from_binaries
+from ..process_ascii_file_into_binaries import (
+    write_ascii_to_memmap_tree as write_ascii_to_binaries,
+)
+from ..process_ascii_into_memmap import write_ascii_to_memmap_tree
+from ..synthetic_catalogs import (
+    write_synthetic_column_info,
+    write_synthetic_sfh_catalog,
+    write_synthetic_sfh_catalogs,
+)
+
+COLNAMES = ["halo_id", "upid", "x", "obs_sm", "sm_history_main_prog"]
+
+
+def test_synthetic_catalog_round_trip_through_both_ingest_modules(tmp_path):
+    column_info_fname = str(tmp_path / "column_info.dat")
+    write_synthetic_column_info(column_info_fname)
+    column_info_fname2 = str(tmp_path / "column_info2.dat")
+    write_synthetic_column_info(column_info_fname2, with_history_flags=False)
+
+    ascii_fname = str(tmp_path / "sfh_catalog_0.399872.0.txt")
+    write_synthetic_sfh_catalog(ascii_fname, 250, "0.399872", chunk_size=100)
+    ascii_fname2 = str(tmp_path / "sfh_catalog_0.399872.0.txt.gz")
+    write_synthetic_sfh_catalog(
+        ascii_fname2, 250, "0.399872", compress=True, chunk_size=100
+    )
+
+    root_dirname = str(tmp_path / "a_0.399872")
+    write_ascii_to_memmap_tree(
+        ascii_fname,
+        column_info_fname,
+        os.path.join(root_dirname, "subvol_0"),
+        COLNAMES,
+    )
+    write_ascii_to_binaries(
+        ascii_fname2,
+        column_info_fname2,
+        os.path.join(root_dirname, "subvol_1"),
+        COLNAMES,
+        stellar_mass_cut=0,
+        mpeak_cut=0,
+    )
+    mock0 = load_mock_from_binaries([0], root_dirname, COLNAMES)
+    mock1 = load_mock_from_binaries([1], root_dirname, COLNAMES)
+
+    assert len(mock0) == 250
+    assert mock0["sm_history_main_prog"].shape == (250, 80)
+    for colname in COLNAMES:
+        assert np.all(mock0[colname] == mock1[colname])
+
+    halo_id, upid = mock0["halo_id"], mock0["upid"]
+    assert len(np.unique(halo_id)) == len(halo_id)
+    assert np.all(np.isin(upid[upid != -1], halo_id))
+    assert np.all((mock0["x"] >= 0) & (mock0["x"] < 250))
+    assert np.all(np.diff(mock0["sm_history_main_prog"], axis=1) >= 0)
+
+
+def test_write_synthetic_sfh_catalogs(tmp_path):
+    fnames = write_synthetic_sfh_catalogs(str(tmp_path), 3, 10, compress=True)
+    assert [os.path.basename(fname) for fname in fnames] == [
+        "sfh_catalog_1.002310.{0}.txt.gz".format(i) for i in range(3)
+    ]
@@ -0,0 +1,76 @@
+"""
+"""
+import os
+
+import numpy as np
+
+from ...derived_columns import write_derived_columns
+from ...memmap_array_utils import (
+    write_ndarray_to_memmap,
+    write_trimmed_history_to_memmap,
+)
+
+
+def write_fake_subvolume(root_dirname, subvol_label, **columns):
+    """Write each input array as a memmap column of ``subvol_<subvol_label>``
+    according to the standard directory tree layout
+    """
+    subvol_dirname = os.path.join(root_dirname, "subvol_" + str(subvol_label))
+    for colname, arr in columns.items():
+        output_dirname = os.path.join(subvol_dirname, colname)
+        os.makedirs(output_dirname, exist_ok=True)
+        output_fname = os.path.join(output_dirname, colname + ".memmap")
+        write_ndarray_to_memmap(arr, output_fname)
+    return subvol_dirname
+
+
+def write_fake_tree(
+    root_dirname,
+    nrows,
+    seed=43,
+    Lbox=100.0,
+    num_scales=5,
+    trimmed_colnames=(),
+    derived_columns=True,
+):
+    """Write a fake snapshot with ``nrows[i]`` galaxies in ``subvol_i``
+
+    Every subvolume stores the halo_id, upid, x, y, z, obs_sm, obs_sfr,
+    sm_history and sfr_history columns. The halo_id are unique across
+    subvolumes and spaced by 7, so that most integers are not an ID.
+    The history columns in ``trimmed_colnames`` are written by
+    write_trimmed_history_to_memmap, and the ``host_row`` column
+    by write_derived_columns if ``derived_columns`` is True.
+    """
+    rng = np.random.RandomState(seed)
+    first_halo_id = 1
+    for subvol, n in enumerate(nrows):
+        halo_id = rng.permutation(n) * 7 + first_halo_id
+        first_halo_id += 7 * n
+        upid = np.where(rng.uniform(size=n) < 0.5, -1, rng.choice(halo_id, n))
+        histories = {
+            colname: rng.uniform(size=(n, num_scales))
+            * (rng.uniform(size=(n, num_scales)) < 0.5)
+            for colname in ("sm_history", "sfr_history")
+        }
+        dense_histories = {
+            colname: history
+            for colname, history in histories.items()
+            if colname not in trimmed_colnames
+        }
+        subvol_dirname = write_fake_subvolume(
+            root_dirname,
+            subvol,
+            halo_id=halo_id,
+            upid=upid,
+            x=rng.uniform(0, Lbox, n),
+            y=rng.uniform(0, Lbox, n),
+            z=rng.uniform(0, Lbox, n),
+            obs_sm=10 ** rng.uniform(9, 11, n),
+            obs_sfr=np.where(rng.uniform(size=n) < 0.1, 0, rng.uniform(0, 10, n)),
+            **dense_histories,
+        )
+        for colname in trimmed_colnames:
+            write_trimmed_history_to_memmap(histories[colname], subvol_dirname, colname)
+    if derived_columns:
+        write_derived_columns(root_dirname, range(len(nrows)))